@@ -1,39 +1,327 @@
-import firebase_admin
-from firebase_admin import credentials, firestore
-import torch
-import whisper
+import os
+import tempfile
+import threading
+import time
 import warnings
-import google.generativeai as genai
+
+# Heavy clients and models are created on first use (see "Lazy Resources" below), so importing
+# this module stays cheap for --reload cycles, worker processes and tooling.
 
 # ------------------------------
 # Firebase Initialization
 # ------------------------------
 FIREBASE_CERT = "/mnt/02269F95269F8875/DEV/vitalgenie/app/vitalgenie-firebase-adminsdk-fbsvc-cd12c49878.json"  # Replace with your file path
-if not firebase_admin._apps:
-    cred = credentials.Certificate(FIREBASE_CERT)
-    firebase_admin.initialize_app(cred)
-db = firestore.client()
 
 # ------------------------------
 # Google Gemini Configuration
 # ------------------------------
 GOOGLE_API_KEY = ""  # Replace with your API key
-genai.configure(api_key=GOOGLE_API_KEY)
-# Initialize the Gemini model (adjust the model name as needed)
-model = genai.GenerativeModel('gemini-2.0-flash-exp')
+GEMINI_MODEL_NAME = "gemini-2.0-flash-exp"  # Adjust the model name as needed
 
 # ------------------------------
-# GPU Setup and Whisper Model Loading
+# GPU Setup and Whisper Model
 # ------------------------------
-DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-print(f"🚀 Running on: {DEVICE}")
-if DEVICE.type == "cuda":
-    torch.backends.cuda.matmul.allow_tf32 = True
-    torch.backends.cudnn.allow_tf32 = True
-
 MODEL_NAME = "tiny"  # You can change this to a larger model if needed
-print(f"🔹 Loading Whisper Model: {MODEL_NAME}...")
-whisper_model = whisper.load_model(MODEL_NAME).to(DEVICE)
 
 # Optionally, filter warnings from torchaudio
 warnings.filterwarnings("ignore", category=UserWarning, module="torchaudio")
+
+# ------------------------------
+# Sentence Embedding Service
+# ------------------------------
+EMBEDDING_MODEL_NAME = "all-mpnet-base-v2"
+EMBEDDING_BATCH_WINDOW_MS = 10     # How long to wait for more encode calls before running a batch
+EMBEDDING_MAX_BATCH_SIZE = 64      # Max number of sentences encoded in one forward pass
+
+# ------------------------------
+# FAISS Index Cache
+# ------------------------------
+FAISS_CACHE_DIR = "faiss_cache"    # On-disk store for per-summary indexes (survives restarts)
+FAISS_CACHE_MAX_ENTRIES = 32       # Indexes kept in memory (LRU)
+FAISS_CACHE_MAX_DISK_ENTRIES = 1024  # Indexes kept on disk; least recently used ones are deleted beyond this
+
+# ------------------------------
+# Corpus Index (all encounters)
+# ------------------------------
+CORPUS_INDEX_DIR = "corpus_index"  # Persistent index + chunk metadata across every stored summary
+CORPUS_CHUNK_CHARS = 500           # Target chunk length; chunks always end on a sentence boundary
+CORPUS_CHUNK_OVERLAP_SENTENCES = 1 # Sentences repeated at the start of the next chunk
+CORPUS_HNSW_THRESHOLD = 50_000     # Chunks at which the exact flat index is rebuilt as HNSW
+CORPUS_HNSW_M = 32                 # HNSW graph degree
+CORPUS_HNSW_EF_CONSTRUCTION = 80
+CORPUS_HNSW_EF_SEARCH = 64         # Search breadth; raise for recall, lower for latency
+CORPUS_EXACT_FILTER_MAX = 20_000   # Filtered searches matching at most this many chunks are exact
+CORPUS_SAVE_EVERY = 32             # Persist the index after this many new documents (and on shutdown)
+CORPUS_BACKFILL_ON_STARTUP = True  # Index stored summaries that are missing from the corpus index
+CORPUS_SYNC_INTERVAL_S = 2.0       # How often API processes sync with the one process that owns the index files
+
+# ------------------------------
+# Gemini Client Limits
+# ------------------------------
+GEMINI_MAX_CONCURRENCY = 8         # Max in-flight Gemini calls per process
+GEMINI_TIMEOUT_S = 60.0            # Per-attempt deadline
+GEMINI_MAX_RETRIES = 2             # Retries on transient errors (rate limits, 5xx, timeouts)
+GEMINI_RETRY_BASE_DELAY_S = 0.5    # Base for full-jitter exponential backoff
+GEMINI_HEDGE_DELAY_S = None        # e.g. 3.0 to fire a backup request when the first is slow
+
+# ------------------------------
+# Transcription Job Queue
+# ------------------------------
+TRANSCRIBE_WORKER_MODE = "thread"  # "thread" shares the loaded Whisper model (GPU hosts); "process" loads one per worker (CPU hosts)
+# Concurrent transcription jobs. In thread mode the shared model still decodes one recording at a
+# time (Whisper's kv-cache hooks are not safe to share); extra workers only overlap diarization,
+# Gemini and Firestore work. Only process mode decodes in parallel.
+TRANSCRIBE_WORKERS = 1
+TRANSCRIBE_QUEUE_SIZE = 16         # Waiting jobs before new submissions get HTTP 429
+TRANSCRIBE_JOB_TTL_S = 3600        # How long finished job results stay queryable
+
+# ------------------------------
+# Long Recordings
+# ------------------------------
+LONG_AUDIO_ENABLED = None          # None: only when Whisper runs on the CPU (GPU hosts decode in one pass); True/False forces it
+LONG_AUDIO_THRESHOLD_S = 300       # Recordings longer than this are decoded in parallel chunks
+LONG_AUDIO_CHUNK_S = 120           # Nominal chunk length; cuts snap to the quietest nearby frame
+LONG_AUDIO_WORKERS = 4             # Worker processes (one CPU Whisper model each)
+WHISPER_QUANTIZE_CPU = False       # int8 dynamic quantization for the CPU worker models
+
+# ------------------------------
+# Audio Uploads
+# ------------------------------
+MAX_UPLOAD_BYTES = 200 * 1024 * 1024   # Larger uploads are rejected with HTTP 413
+UPLOAD_CHUNK_BYTES = 1024 * 1024       # Bytes read per step from image uploads (audio is piped as it arrives)
+
+# ------------------------------
+# Live Transcription (WebSocket)
+# ------------------------------
+STREAM_VAD_THRESHOLD = 1e-4        # Mean-square frame energy counted as speech (~-40 dBFS)
+STREAM_SILENCE_S = 0.6             # Trailing silence that ends an utterance
+STREAM_MAX_SEGMENT_S = 15.0        # Utterances are force-finalized at this length (rolling window bound)
+STREAM_PARTIAL_INTERVAL_S = 1.0    # New audio needed before re-decoding the utterance in progress
+
+# ------------------------------
+# Gemini Response Cache
+# ------------------------------
+GEMINI_CACHE_ENABLED = True
+GEMINI_CACHE_PATH = "gemini_cache.sqlite3"   # Persistent tier; survives restarts
+GEMINI_CACHE_TTL_S = 7 * 24 * 3600
+GEMINI_CACHE_MEMORY_ENTRIES = 512            # In-memory LRU tier
+GEMINI_CACHE_MAX_BYTES = 64 * 1024 * 1024    # Persistent tier size budget (oldest entries evicted first)
+
+# ------------------------------
+# Speaker Diarization
+# ------------------------------
+# "gemini": send the transcript to Gemini to split it by speaker (default)
+# "local":  cluster speaker embeddings of Whisper's segments; Gemini is only the fallback
+DIARIZATION_MODE = "gemini"
+DIARIZATION_EMBEDDING = "logmel"   # "ecapa" uses speechbrain's ECAPA speaker encoder (optional dependency)
+DIARIZATION_ECAPA_SOURCE = "speechbrain/spkrec-ecapa-voxceleb"
+DIARIZATION_NUM_SPEAKERS = 2       # Doctor and patient; None estimates the count with the threshold below
+DIARIZATION_MAX_SPEAKERS = 4
+DIARIZATION_DISTANCE_THRESHOLD = 1.0   # Cosine distance at which clusters stop merging (auto count only; 1.0 = uncorrelated)
+DIARIZATION_MIN_SEGMENT_S = 1.0    # Shorter segments are matched to the nearest speaker instead of clustered
+
+# ------------------------------
+# Image Preprocessing (vision inputs)
+# ------------------------------
+IMAGE_MAX_EDGE = 1536              # Longest side sent to Gemini; keeps handwriting legible
+IMAGE_JPEG_QUALITY = 85            # Quality of the re-encoded JPEG sent to Gemini
+IMAGE_MAX_PIXELS = 50_000_000      # Larger images are rejected before decoding (decompression bombs)
+IMAGE_MAX_UPLOAD_BYTES = 25 * 1024 * 1024   # Larger uploads are rejected with HTTP 413
+IMAGE_PREPROCESS_WORKERS = 4       # Threads decoding and resizing images off the event loop
+
+# ------------------------------
+# Monitoring Change Gate
+# ------------------------------
+MONITOR_CHANGE_THRESHOLD = 0.04    # Mean abs. grayscale difference (0-1) that counts as a scene change
+MONITOR_MAX_STALENESS_S = 60.0     # Force a Gemini check at least this often even if nothing changed
+MONITOR_GATE_SIZE = 32             # Frames are compared as NxN grayscale thumbnails
+
+# ------------------------------
+# Camera Monitoring
+# ------------------------------
+MONITOR_CAMERAS = [
+    {"id": "room-1", "url": "http://192.168.4.180/cam-hi.jpg", "interval_s": 3.0},
+]
+MONITOR_FETCH_TIMEOUT_S = 5.0
+MONITOR_INTERVAL_JITTER = 0.2      # +/- fraction applied to each camera's polling interval
+MONITOR_MAX_CONCURRENT_EVALUATIONS = 4   # Gemini checks in flight across all cameras
+MONITOR_HTTP_MAX_CONNECTIONS = 32
+
+# ------------------------------
+# Monitor Leadership (multi-worker deployments)
+# ------------------------------
+# "leader":  API workers elect one monitor process through a file lock (default)
+# "sidecar": API workers only read status; run `python -m app.monitor_worker` separately
+# "inline":  every process runs its own monitor (single-worker development)
+# "off":     no camera monitoring
+MONITOR_MODE = "leader"
+MONITOR_STATE_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+MONITOR_LOCK_FILE = os.path.join(MONITOR_STATE_DIR, "vitalgenie-monitor.lock")
+MONITOR_STATUS_FILE = os.path.join(MONITOR_STATE_DIR, "vitalgenie-monitor-status.json")
+MONITOR_CAMERAS_FILE = os.path.join(MONITOR_STATE_DIR, "vitalgenie-monitor-cameras.json")
+MONITOR_PUBLISH_INTERVAL_S = 1.0   # How often the leader publishes status and picks up camera changes
+MONITOR_LEADER_RETRY_S = 5.0       # How often followers try to take over a free lock
+
+# ------------------------------
+# Firestore Access Layer
+# ------------------------------
+FIRESTORE_WRITE_QUEUE_SIZE = 1000      # Pending writes before callers fall back to a direct write
+FIRESTORE_WRITE_BATCH_SIZE = 100       # Writes per batch commit (Firestore allows up to 500)
+FIRESTORE_WRITE_FLUSH_S = 0.5          # Max time a write waits for its batch to fill
+FIRESTORE_WRITE_RETRY_BASE_S = 0.5     # Failed batch commits are retried with exponential backoff...
+FIRESTORE_WRITE_RETRY_MAX_S = 30.0     # ...capped at this delay, until they succeed or the writer stops
+FIRESTORE_OVERFLOW_WORKERS = 4         # Threads writing directly when the queue is full (never the event loop)
+FIRESTORE_LISTEN_LATEST_SUMMARY = True # Keep the cached latest summary fresh with an on_snapshot listener
+
+# ------------------------------
+# EHR PDF Rendering
+# ------------------------------
+EHR_PDF_RENDER_WORKERS = 2         # Threads rendering PDFs off the event loop
+EHR_PDF_CACHE_ENTRIES = 64         # Rendered PDFs kept in memory (LRU)
+
+# ------------------------------
+# Metrics
+# ------------------------------
+# Histogram buckets (seconds) shared by request and stage latencies; Whisper and Gemini need the long tail
+METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+METRICS_PROFILE_HEADER = "X-Profile"   # Requests sending this header get a Server-Timing breakdown of their stages
+
+# ------------------------------
+# Startup
+# ------------------------------
+WARMUP_ON_STARTUP = True           # Load every lazy resource in the background right after startup
+
+# ------------------------------
+# Lazy Resources
+# ------------------------------
+class LazyResource:
+    """
+    Thread-safe, load-once holder for an expensive client or model.
+    `get()` loads on first use; `status()` feeds the /ready endpoint; `set()`
+    installs a ready-made object (e.g. a local fake) without running the loader.
+    """
+
+    def __init__(self, name: str, loader):
+        self.name = name
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._value = None
+        self._state = "not_loaded"
+        self._error = None
+        self._load_seconds = None
+
+    def get(self):
+        if self._state == "ready":
+            return self._value
+        with self._lock:
+            if self._state != "ready":
+                self._state = "loading"
+                started = time.perf_counter()
+                try:
+                    self._value = self._loader()
+                except Exception as e:
+                    self._state = "failed"
+                    self._error = str(e)
+                    raise
+                self._load_seconds = time.perf_counter() - started
+                self._error = None
+                self._state = "ready"
+        return self._value
+
+    def set(self, value):
+        with self._lock:
+            self._value = value
+            self._state = "ready"
+            self._error = None
+            self._load_seconds = 0.0
+
+    @property
+    def ready(self) -> bool:
+        return self._state == "ready"
+
+    def status(self) -> dict:
+        return {"state": self._state, "load_seconds": self._load_seconds, "error": self._error}
+
+
+def _load_firestore():
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+    if not firebase_admin._apps:
+        cred = credentials.Certificate(FIREBASE_CERT)
+        firebase_admin.initialize_app(cred)
+    return firestore.client()
+
+def _load_gemini_model():
+    import google.generativeai as genai
+    genai.configure(api_key=GOOGLE_API_KEY)
+    return genai.GenerativeModel(GEMINI_MODEL_NAME)
+
+def _load_device():
+    import torch
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    print(f"🚀 Running on: {device}")
+    if device.type == "cuda":
+        torch.backends.cuda.matmul.allow_tf32 = True
+        torch.backends.cudnn.allow_tf32 = True
+    return device
+
+def _load_whisper_model():
+    import whisper
+    print(f"🔹 Loading Whisper Model: {MODEL_NAME}...")
+    return whisper.load_model(MODEL_NAME).to(get_device())
+
+def _load_embedding_model():
+    from sentence_transformers import SentenceTransformer
+    print(f"🔹 Loading embedding model: {EMBEDDING_MODEL_NAME}...")
+    return SentenceTransformer(EMBEDDING_MODEL_NAME)
+
+def _load_speaker_encoder():
+    try:
+        from speechbrain.inference.speaker import EncoderClassifier
+    except ImportError:
+        from speechbrain.pretrained import EncoderClassifier
+    print(f"🔹 Loading speaker encoder: {DIARIZATION_ECAPA_SOURCE}...")
+    return EncoderClassifier.from_hparams(source=DIARIZATION_ECAPA_SOURCE, run_opts={"device": str(get_device())})
+
+
+device_resource = LazyResource("device", _load_device)
+firestore_resource = LazyResource("firestore", _load_firestore)
+gemini_resource = LazyResource("gemini", _load_gemini_model)
+whisper_resource = LazyResource("whisper", _load_whisper_model)
+embedding_resource = LazyResource("embedding", _load_embedding_model)
+speaker_encoder_resource = LazyResource("speaker_encoder", _load_speaker_encoder)
+RESOURCES = [firestore_resource, gemini_resource, embedding_resource]
+if TRANSCRIBE_WORKER_MODE == "thread":
+    # Process workers load their own CPU model; the API process would hold an unused copy
+    RESOURCES.append(whisper_resource)
+if DIARIZATION_MODE == "local" and DIARIZATION_EMBEDDING == "ecapa":
+    RESOURCES.append(speaker_encoder_resource)
+
+def get_device():
+    return device_resource.get()
+
+def get_db():
+    return firestore_resource.get()
+
+def get_gemini_model():
+    return gemini_resource.get()
+
+def get_whisper_model():
+    return whisper_resource.get()
+
+def get_embedding_model():
+    return embedding_resource.get()
+
+def get_speaker_encoder():
+    return speaker_encoder_resource.get()
+
+def warmup():
+    """
+    Loads every resource, logging (not raising) failures. Blocking; run it in a thread.
+    """
+    for resource in RESOURCES:
+        try:
+            resource.get()
+            print(f"🔹 {resource.name} ready.")
+        except Exception as e:
+            print(f"Error loading {resource.name}: {e}")
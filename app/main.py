@@ -1,15 +1,32 @@
 import asyncio
-from fastapi import FastAPI
+import time
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 from app.routers import transcribe, rag_chat, image_analysis, prescription, monitoring, ehr_pdf
+from app.config import (
+    FIRESTORE_LISTEN_LATEST_SUMMARY,
+    WARMUP_ON_STARTUP,
+    CORPUS_BACKFILL_ON_STARTUP,
+    METRICS_PROFILE_HEADER,
+    RESOURCES,
+    get_db,
+    warmup,
+)
+from app.utils.embedding_utils import embedding_service
+from app.utils.firestore_utils import firestore_writer, summary_store
+from app.utils.gemini_utils import response_cache
+from app.utils.image_utils import image_preprocessor
+from app.utils.metrics import Profile, format_labels, registry, request_latency, requests_in_progress, use_profile
+from app.utils.vector_index import corpus_index
 
 app = FastAPI(
     title="VitalGenie",
     description=(
         "Upload an audio file for transcription. The entire audio is transcribed with Whisper, "
         "then Google Gemini is used to perform speaker diarization on the transcript. The resulting diarized transcript is saved to Firestore. "
-        "Use the /rag_chat endpoint for retrieval-augmented questions, /image_analysis for image analysis, "
+        "Use the /rag_chat endpoint for retrieval-augmented questions (add a patient_id or scope=\"history\" to search every stored encounter), /image_analysis for image analysis, "
         "and /extract_prescription to extract prescription details from a conversation or a prescription image."
     ),
     version="1.0.0",
@@ -24,6 +41,141 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """
+    Times every request by route template. Requests carrying the profile header also get
+    a Server-Timing header listing the stages they spent time in. Streaming responses are
+    timed to their first byte; stages that run after that are not in their header.
+    """
+    profile = Profile() if METRICS_PROFILE_HEADER in request.headers else None
+    started = time.perf_counter()
+    status = 500
+    requests_in_progress.inc(request.method)
+    try:
+        with use_profile(profile):
+            response = await call_next(request)
+        status = response.status_code
+    finally:
+        elapsed = time.perf_counter() - started
+        requests_in_progress.dec(request.method)
+        route = request.scope.get("route")
+        # Unmatched paths share one label so scanners cannot blow up the series count
+        request_latency.observe(elapsed, request.method, route.path if route else "unmatched", str(status))
+    if profile is not None:
+        response.headers["Server-Timing"] = profile.server_timing(elapsed)
+    return response
+
+def collect_queue_metrics() -> list:
+    metrics = transcribe.transcription_queue.metrics()
+    return [
+        ("vitalgenie_transcription_queue_depth", "gauge", "Transcription jobs waiting for a worker.",
+         [("vitalgenie_transcription_queue_depth", "", metrics["queue_depth"])]),
+        ("vitalgenie_transcription_jobs_running", "gauge", "Transcription jobs being processed.",
+         [("vitalgenie_transcription_jobs_running", "", metrics["running"])]),
+        ("vitalgenie_transcription_jobs_total", "counter", "Transcription jobs by outcome.",
+         [("vitalgenie_transcription_jobs_total", format_labels(("outcome",), (outcome,)), metrics[outcome])
+          for outcome in ("completed", "failed", "rejected")]),
+    ]
+
+def family(name: str, kind: str, help_text: str, value=None, labelnames: tuple = (), series: dict = None) -> tuple:
+    # One metric family from a single value or from {label values: value}
+    series = series if series is not None else {(): value}
+    return (name, kind, help_text, [(name, format_labels(labelnames, labels), v) for labels, v in series.items()])
+
+def collect_gemini_cache_metrics() -> list:
+    if response_cache is None:
+        return []
+    stats = response_cache.get_stats()
+    return [
+        family("vitalgenie_gemini_cache_lookups_total", "counter", "Gemini response cache lookups by result.",
+               labelnames=("result",), series={("memory_hit",): stats["memory_hits"], ("disk_hit",): stats["disk_hits"],
+                                               ("miss",): stats["misses"]}),
+        family("vitalgenie_gemini_cache_writes_total", "counter", "Responses stored in the Gemini cache.", stats["writes"]),
+        family("vitalgenie_gemini_cache_evictions_total", "counter", "Gemini cache entries expired or trimmed.",
+               stats["evictions"]),
+        family("vitalgenie_gemini_cache_entries", "gauge", "Entries in each Gemini cache tier.",
+               labelnames=("tier",), series={("memory",): stats["memory_entries"], ("disk",): stats["disk_entries"]}),
+        family("vitalgenie_gemini_cache_disk_bytes", "gauge", "Payload bytes in the persistent Gemini cache.",
+               stats["disk_bytes"]),
+    ]
+
+def collect_monitor_metrics() -> list:
+    # The leader's numbers; other workers read them from the status it publishes
+    cameras = monitoring.current_snapshot()["metrics"]
+    decisions = {}
+    for camera_id, metrics in cameras.items():
+        gate = metrics["change_gate"]
+        decisions[(camera_id, "skipped")] = gate["skipped"]
+        for reason in ("first_frame", "scene_change", "stale"):
+            decisions[(camera_id, f"escalated_{reason}")] = gate[f"escalated_{reason}"]
+    return [
+        family("vitalgenie_monitor_fetches_total", "counter", "Camera frame fetches.",
+               labelnames=("camera",), series={(camera_id,): m["fetches"] for camera_id, m in cameras.items()}),
+        family("vitalgenie_monitor_fetch_errors_total", "counter", "Camera frame fetches that failed.",
+               labelnames=("camera",), series={(camera_id,): m["fetch_errors"] for camera_id, m in cameras.items()}),
+        family("vitalgenie_monitor_gate_decisions_total", "counter",
+               "Change gate decisions per frame: skipped, or escalated to Gemini and why.",
+               labelnames=("camera", "decision"), series=decisions),
+    ]
+
+def collect_embedding_metrics() -> list:
+    stats = embedding_service.get_stats()
+    return [
+        family("vitalgenie_embedding_requests_total", "counter", "encode() calls served by the embedding batcher.",
+               stats["requests"]),
+        family("vitalgenie_embedding_sentences_total", "counter", "Sentences embedded.", stats["sentences"]),
+        family("vitalgenie_embedding_encode_seconds_total", "counter", "Time spent encoding embedding batches.",
+               stats["encode_seconds_total"]),
+        family("vitalgenie_embedding_wait_seconds_total", "counter", "Time requests waited for their batch to start.",
+               stats["wait_seconds_total"]),
+    ]
+
+def collect_rag_stream_metrics() -> list:
+    stats = rag_chat.stream_stats
+    return [
+        family("vitalgenie_rag_streams_total", "counter", "Streamed RAG answers by outcome.",
+               labelnames=("outcome",), series={("completed",): stats["completed"], ("error",): stats["errors"],
+                                                ("disconnect",): stats["disconnects"]}),
+    ]
+
+def collect_image_metrics() -> list:
+    stats = image_preprocessor.get_stats()
+    return [
+        family("vitalgenie_images_processed_total", "counter", "Images decoded and re-encoded.", stats["images"]),
+        family("vitalgenie_images_rejected_total", "counter", "Images rejected before or during decoding.",
+               labelnames=("reason",), series={("too_large",): stats["rejected_too_large"],
+                                               ("undecodable",): stats["rejected_undecodable"]}),
+        family("vitalgenie_images_draft_decodes_total", "counter", "JPEGs decoded at reduced size in draft mode.",
+               stats["draft_decodes"]),
+        family("vitalgenie_image_bytes_total", "counter", "Encoded image bytes received and sent to Gemini.",
+               labelnames=("direction",), series={("in",): stats["bytes_in_total"], ("out",): stats["bytes_out_total"]}),
+        family("vitalgenie_image_decoded_bytes_total", "counter", "Bytes of decoded pixels held in memory.",
+               stats["decoded_bytes_total"]),
+        family("vitalgenie_image_decode_seconds_total", "counter", "Time spent decoding image pixels.",
+               stats["decode_seconds_total"]),
+    ]
+
+def collect_corpus_metrics() -> list:
+    stats = corpus_index.get_stats()
+    return [
+        family("vitalgenie_corpus_chunks", "gauge", "Chunks in the corpus index.", stats["chunks"]),
+        family("vitalgenie_corpus_documents", "gauge", "Summaries in the corpus index.", stats["documents"]),
+        family("vitalgenie_corpus_owner", "gauge", "1 if this process owns the corpus index files.", int(stats["owner"])),
+        family("vitalgenie_corpus_unsaved_documents", "gauge", "Documents added since the index was last saved.",
+               stats["unsaved_documents"]),
+        family("vitalgenie_corpus_searches_total", "counter", "Corpus searches by kind.",
+               labelnames=("kind",), series={("unfiltered",): stats["searches"] - stats["filtered_searches"],
+                                             ("filtered",): stats["filtered_searches"] - stats["exact_filtered"],
+                                             ("exact_filtered",): stats["exact_filtered"]}),
+        family("vitalgenie_corpus_documents_added_total", "counter", "Documents appended to the corpus index.",
+               stats["documents_added"]),
+    ]
+
+for collector in (collect_queue_metrics, collect_gemini_cache_metrics, collect_monitor_metrics,
+                  collect_embedding_metrics, collect_rag_stream_metrics, collect_image_metrics, collect_corpus_metrics):
+    registry.add_collector(collector)
+
 # Include routers from submodules
 app.include_router(transcribe.router)
 app.include_router(rag_chat.router)
@@ -37,9 +189,63 @@ app.include_router(ehr_pdf.router)
 async def root():
     return {"message": "Welcome to VitalGenie!"}
 
+@app.get("/ready")
+async def ready():
+    """
+    Readiness probe: 200 once every heavy resource is loaded, 503 (with per-resource state) until then.
+    """
+    resources = {resource.name: resource.status() for resource in RESOURCES}
+    is_ready = all(resource.ready for resource in RESOURCES)
+    return JSONResponse(status_code=200 if is_ready else 503, content={"ready": is_ready, "resources": resources})
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """
+    Prometheus scrape endpoint: request and stage latency histograms, stage errors,
+    process memory and (when CUDA is in use) GPU memory, plus the queue, cache, change
+    gate, embedding, streaming, image and corpus index counters.
+    """
+    # Collectors read SQLite and shared status files, so render off the event loop
+    text = await asyncio.to_thread(registry.render)
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4")
+
+@app.get("/gemini_cache_stats")
+async def gemini_cache_stats():
+    if response_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **response_cache.get_stats()}
+
+async def backfill_corpus_index():
+    try:
+        db = await asyncio.to_thread(get_db)
+        await corpus_index.backfill(db)
+    except Exception as e:
+        print(f"Corpus index backfill failed: {e}")
+
 @app.on_event("startup")
 async def startup_event():
+    if WARMUP_ON_STARTUP:
+        # Load models in the background so the server starts answering immediately
+        asyncio.get_running_loop().run_in_executor(None, warmup)
+    if FIRESTORE_LISTEN_LATEST_SUMMARY:
+        asyncio.get_running_loop().run_in_executor(None, summary_store.start_listener)
+    if CORPUS_BACKFILL_ON_STARTUP:
+        # Only the process that owns the corpus index files backfills; the others return at once
+        app.state.corpus_backfill = asyncio.create_task(backfill_corpus_index())
+    app.state.corpus_sync = asyncio.create_task(corpus_index.run_sync_loop())
     monitoring.start_monitoring()
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    await monitoring.stop_monitoring()
+    await transcribe.transcription_queue.shutdown()
+    transcribe.whisper_executor.shutdown()
+    transcribe.long_audio_executor.shutdown()
+    image_preprocessor.shutdown()
+    summary_store.stop_listener()
+    await asyncio.to_thread(firestore_writer.stop)
+    app.state.corpus_sync.cancel()
+    await asyncio.to_thread(corpus_index.close)
+
 if __name__ == "__main__":
     uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
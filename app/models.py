@@ -1,4 +1,12 @@
+from datetime import datetime
+from typing import Optional
 from pydantic import BaseModel
 
 class ChatQuery(BaseModel):
     query: str
+    # "latest" answers from the most recent summary; "history" searches every stored encounter.
+    # Giving a patient_id or a date range implies "history".
+    scope: str = "latest"
+    patient_id: Optional[str] = None
+    start_date: Optional[datetime] = None
+    end_date: Optional[datetime] = None
@@ -0,0 +1,26 @@
+"""
+Standalone camera monitor for MONITOR_MODE = "sidecar".
+
+    python -m app.monitor_worker
+
+Runs the camera scheduler outside the API workers and publishes status to
+MONITOR_STATUS_FILE, which every worker's /monitor_status reads.
+"""
+import asyncio
+from app.config import MONITOR_LEADER_RETRY_S
+from app.routers import monitoring
+from app.utils.firestore_utils import firestore_writer
+
+async def main():
+    while not monitoring.leader_lock.try_acquire():
+        print("🔹 Another monitor holds the lock; waiting...")
+        await asyncio.sleep(MONITOR_LEADER_RETRY_S)
+    try:
+        await monitoring.run_leader()
+    finally:
+        await monitoring.stop_monitoring()
+        # Alerts queued by the last checks must reach Firestore before the process exits
+        await asyncio.to_thread(firestore_writer.stop)
+
+if __name__ == "__main__":
+    asyncio.run(main())
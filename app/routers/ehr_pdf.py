@@ -1,29 +1,22 @@
-import tempfile
 from fastapi import APIRouter, HTTPException
-from fastapi.responses import FileResponse
-from app.config import db
+from fastapi.responses import Response
+from app.utils.firestore_utils import summary_store
 from app.utils.gemini_utils import gemini_inference
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.pagesizes import letter
-from reportlab.lib.enums import TA_CENTER, TA_LEFT
+from app.utils.pdf_utils import get_or_render_ehr_pdf
 
 router = APIRouter()
 
-@router.get("/generate_ehr_pdf", response_class=FileResponse)
+@router.get("/generate_ehr_pdf", response_class=Response)
 async def generate_ehr_pdf():
     """
     Generates an Electronic Health Record (EHR) PDF report from the latest transcription summary.
     The report is formatted using ReportLab's Platypus to produce a clean, professional layout.
+    PDFs are rendered in memory on a worker thread and cached per summary document and report content.
     """
     # 1. Retrieve the latest transcription summary from Firestore
     try:
-        docs = db.collection("transcription_summaries") \
-                 .order_by("timestamp", direction="DESCENDING") \
-                 .limit(1).stream()
-        summary = None
-        for doc in docs:
-            summary = doc.to_dict().get("summary")
+        doc_id, latest = await summary_store.latest_async()
+        summary = latest.get("summary") if latest else None
         if not summary:
             raise HTTPException(status_code=404, detail="No transcription summary available.")
     except Exception as e:
@@ -74,40 +67,11 @@ async def generate_ehr_pdf():
     # ehr_report = gemini_inference(prompt)
     # and then parse ehr_report to extract the sections.
 
-    # 3. Generate PDF using ReportLab's Platypus
+    # 3. Generate PDF using ReportLab's Platypus (cached per encounter and report)
     try:
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
-        doc = SimpleDocTemplate(
-            temp_file.name,
-            pagesize=letter,
-            rightMargin=50,
-            leftMargin=50,
-            topMargin=50,
-            bottomMargin=50
-        )
-        
-        # Define custom styles
-        styles = getSampleStyleSheet()
-        styles.add(ParagraphStyle(name='CenterTitle', fontSize=18, leading=22, alignment=TA_CENTER, spaceAfter=20))
-        styles.add(ParagraphStyle(name='Heading', fontSize=14, leading=18, alignment=TA_LEFT, spaceBefore=12, spaceAfter=8))
-        styles.add(ParagraphStyle(name='Body', fontSize=12, leading=16, alignment=TA_LEFT, spaceAfter=6))
-        
-        story = []
-        
-        # Title
-        story.append(Paragraph("Electronic Health Record (EHR) Report", styles['CenterTitle']))
-        
-        # For each section, add a heading and list its items
-        for section, items in report_content.items():
-            story.append(Paragraph(section + ":", styles['Heading']))
-            for item in items:
-                # Using a bullet-like symbol for clarity
-                story.append(Paragraph(f"• {item}", styles['Body']))
-            story.append(Spacer(1, 12))
-        
-        doc.build(story)
+        pdf_bytes = await get_or_render_ehr_pdf(doc_id, report_content)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating PDF: {e}")
-    
+
     headers = {"Content-Disposition": 'attachment; filename="ehr_report.pdf"'}
-    return FileResponse(temp_file.name, media_type="application/pdf", headers=headers)
+    return Response(content=pdf_bytes, media_type="application/pdf", headers=headers)
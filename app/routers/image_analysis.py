@@ -1,19 +1,32 @@
-import io
-from PIL import Image
 from fastapi import APIRouter, UploadFile, File, HTTPException
 from fastapi.responses import JSONResponse
-from app.utils.gemini_utils import gemini_inference
+from app.utils.gemini_utils import gemini_inference_async
+from app.utils.image_utils import ImageDecodeError, ImageTooLargeError, image_preprocessor, read_image_upload
 
 router = APIRouter()
 
+async def prepare_upload(file: UploadFile):
+    """
+    Reads and preprocesses an uploaded image, mapping rejections to HTTP errors.
+    """
+    try:
+        contents = await read_image_upload(file)
+        return await image_preprocessor.prepare(contents)
+    except ImageTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ImageDecodeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error reading image: {e}")
+
 @router.post("/image_analysis")
 async def analyze_image(file: UploadFile = File(...), prompt: str = "Describe this medical image.") -> JSONResponse:
     if not file.content_type.startswith("image/"):
         raise HTTPException(status_code=400, detail="Invalid format. Upload an image file.")
-    try:
-        contents = await file.read()
-        image = Image.open(io.BytesIO(contents)).convert("RGB")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error reading image: {e}")
-    response_text = gemini_inference(prompt=prompt, image=image)
+    image = await prepare_upload(file)
+    response_text = await gemini_inference_async(prompt=prompt, image=image)
     return JSONResponse(content={"analysis": response_text})
+
+@router.get("/image_metrics")
+async def image_metrics() -> JSONResponse:
+    return JSONResponse(content=image_preprocessor.get_stats())
@@ -1,16 +1,28 @@
-import io
 import asyncio
-import requests
+import hashlib
+import json
+import os
+import time
 from datetime import datetime
-from PIL import Image
 from fastapi import APIRouter, HTTPException
 from fastapi.responses import JSONResponse
-from app.config import db
-from app.utils.gemini_utils import gemini_inference
+from pydantic import BaseModel
+from app.config import (
+    MONITOR_CAMERAS,
+    MONITOR_MODE,
+    MONITOR_LOCK_FILE,
+    MONITOR_STATUS_FILE,
+    MONITOR_CAMERAS_FILE,
+    MONITOR_PUBLISH_INTERVAL_S,
+    MONITOR_LEADER_RETRY_S,
+)
+from app.utils.leader import FileLock, write_json_atomic, read_json, file_age
+from app.utils.firestore_utils import firestore_writer
+from app.utils.gemini_utils import gemini_inference_async, ERROR_RESPONSE
+from app.utils.monitor_scheduler import Camera, CameraRegistry, MonitorScheduler
 
 router = APIRouter()
 
-ESP32_CAM_URL = "http://192.168.4.180/cam-hi.jpg"
 ANOMALY_PROMPT = (
     "You are an expert medical safety monitor. Analyze the provided image from a patient's room and determine if there is any clear sign of abnormal behavior or an emergency (such as a fall, injury, or other critical event). Your answer must be exactly one of the following words, with no additional text:\n\n"
     "- ALERT (if there is clear, unambiguous evidence of an emergency or dangerous situation)\n"
@@ -18,60 +30,241 @@ ANOMALY_PROMPT = (
     "If there is any ambiguity or uncertainty, please return OK. Your answer must be exactly one word: either ALERT or OK."
 )
 
-# Global variable to store current monitoring status
-monitoring_status = {"status": "OK", "message": "No anomaly detected."}
 
-async def continuous_monitoring_task():
-    global monitoring_status
+class CameraConfig(BaseModel):
+    id: str
+    url: str
+    interval_s: float = 3.0
+
+
+async def analyze_frame(camera: Camera, image, reason: str):
+    ai_result = await gemini_inference_async(ANOMALY_PROMPT, image=image, use_cache=False)
+    print(f"Monitoring AI result for {camera.id} ({reason}):", ai_result)
+    if ai_result == ERROR_RESPONSE:
+        # Make sure the next frame is checked again instead of being gated out
+        camera.detector.reset()
+    if ai_result.strip().upper() == "ALERT":
+        camera.status = {
+            "status": "ALERT",
+            "message": f"Alert: Anomaly detected in {camera.id}. Alert sent to hospital and emergency contacts.",
+            "last_checked": time.time(),
+        }
+        try:
+            firestore_writer.add("monitor_events", {
+                "event": "Anomaly detected",
+                "camera_id": camera.id,
+                "timestamp": datetime.utcnow(),
+                "ai_result": ai_result
+            })
+            print("🔹 Anomaly event logged to Firestore.")
+            firestore_writer.add("doctor_alerts", {
+                "message": f"Alert: Anomaly detected in {camera.id}.",
+                "camera_id": camera.id,
+                "timestamp": datetime.utcnow(),
+                "details": ai_result
+            })
+            print("🔹 Dummy alert sent to doctor.")
+        except Exception as e:
+            print("Error logging anomaly/alert:", e)
+    else:
+        camera.status = {
+            "status": "OK",
+            "message": "No anomaly detected.",
+            "last_checked": time.time(),
+        }
+
+
+camera_registry = CameraRegistry(MONITOR_CAMERAS)
+scheduler = MonitorScheduler(camera_registry, analyze_frame)
+
+# Only the process holding this lock polls cameras; every other worker reads the status it publishes
+leader_lock = FileLock(MONITOR_LOCK_FILE)
+is_leader = False
+_leader_task = None
+_cameras_mtime = None
+
+
+def aggregate_status() -> dict:
+    """
+    Overall status in the original single-camera shape, plus per-camera detail.
+    """
+    cameras = {camera.id: camera.status for camera in camera_registry.all()}
+    alerts = [camera_id for camera_id, status in cameras.items() if status["status"] == "ALERT"]
+    errors = [camera_id for camera_id, status in cameras.items() if status["status"] == "ERROR"]
+    if alerts:
+        status = {"status": "ALERT", "message": "Alert: Anomaly detected in " + ", ".join(alerts) + "."}
+    elif errors:
+        status = {"status": "ERROR", "message": "Error during monitoring of " + ", ".join(errors) + "."}
+    else:
+        status = {"status": "OK", "message": "No anomaly detected."}
+    status["cameras"] = cameras
+    return status
+
+def local_snapshot() -> dict:
+    return {
+        "leader_pid": os.getpid(),
+        "published_at": time.time(),
+        "status": aggregate_status(),
+        "metrics": scheduler.get_metrics(),
+    }
+
+def current_snapshot() -> dict:
+    if is_leader or MONITOR_MODE == "inline":
+        return local_snapshot()
+    snapshot = read_json(MONITOR_STATUS_FILE)
+    age = file_age(MONITOR_STATUS_FILE)
+    if snapshot is None or age is None or age > max(10.0, 5 * MONITOR_PUBLISH_INTERVAL_S):
+        return {
+            "leader_pid": None,
+            "published_at": None,
+            "status": {"status": "ERROR", "message": "Monitor leader unavailable.", "cameras": {}},
+            "metrics": {},
+        }
+    return snapshot
+
+# ------------------------------
+# Shared camera list
+# ------------------------------
+# The shared file lives in /dev/shm and outlives restarts; it is stamped with the MONITOR_CAMERAS
+# it was derived from so cameras registered at runtime never override an edited config
+CAMERAS_CONFIG_HASH = hashlib.sha256(json.dumps(MONITOR_CAMERAS, sort_keys=True).encode("utf-8")).hexdigest()
+
+def load_camera_configs() -> list:
+    data = read_json(MONITOR_CAMERAS_FILE)
+    if isinstance(data, dict) and data.get("config_hash") == CAMERAS_CONFIG_HASH:
+        return data["cameras"]
+    return list(MONITOR_CAMERAS)
+
+def update_camera_configs(update):
+    """
+    Applies `update(configs) -> configs` to the shared camera list under a lock.
+    The leader picks the change up on its next publish tick.
+    """
+    with FileLock(MONITOR_CAMERAS_FILE + ".lock"):
+        configs = update(load_camera_configs())
+        write_json_atomic(MONITOR_CAMERAS_FILE, {"config_hash": CAMERAS_CONFIG_HASH, "cameras": configs})
+    return configs
+
+def read_camera_changes():
+    """
+    The shared camera list if it changed since the last call, else None. Blocking (file IO).
+    """
+    global _cameras_mtime
+    mtime = os.path.getmtime(MONITOR_CAMERAS_FILE) if os.path.exists(MONITOR_CAMERAS_FILE) else None
+    if mtime is not None and mtime == _cameras_mtime:
+        return None
+    _cameras_mtime = mtime
+    return load_camera_configs()
+
+async def sync_cameras():
+    configs = await asyncio.to_thread(read_camera_changes)
+    if configs is None:
+        return
+    configs = {config["id"]: config for config in configs}
+    for camera in camera_registry.all():
+        config = configs.get(camera.id)
+        if config is None or config["url"] != camera.url or config.get("interval_s", 3.0) != camera.interval_s:
+            scheduler.remove_camera(camera.id)
+    for camera_id, config in configs.items():
+        if camera_registry.get(camera_id) is None:
+            scheduler.add_camera(Camera(camera_id, config["url"], config.get("interval_s", 3.0)))
+
+# ------------------------------
+# Leadership
+# ------------------------------
+async def run_leader():
+    """
+    Runs the camera scheduler in this process and publishes its status for the other workers.
+    """
+    global is_leader
+    is_leader = True
+    print(f"🔹 Process {os.getpid()} is the monitoring leader.")
+    await sync_cameras()
+    scheduler.start()
     while True:
         try:
-            response = requests.get(ESP32_CAM_URL, timeout=5)
-            if response.status_code == 200:
-                image_bytes = response.content
-                image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-                ai_result = gemini_inference(ANOMALY_PROMPT, image=image)
-                print("Monitoring AI result:", ai_result)
-                if ai_result.strip().upper() == "ALERT":
-                    monitoring_status = {
-                        "status": "ALERT",
-                        "message": "Alert: Anomaly detected in patient room. Alert sent to hospital and emergency contacts."
-                    }
-                    try:
-                        doc_ref = db.collection("monitor_events").document()
-                        doc_ref.set({
-                            "event": "Anomaly detected",
-                            "timestamp": datetime.utcnow(),
-                            "ai_result": ai_result
-                        })
-                        print("🔹 Anomaly event logged to Firestore.")
-                        alert_ref = db.collection("doctor_alerts").document()
-                        alert_ref.set({
-                            "message": "Alert: Anomaly detected in patient room.",
-                            "timestamp": datetime.utcnow(),
-                            "details": ai_result
-                        })
-                        print("🔹 Dummy alert sent to doctor.")
-                    except Exception as e:
-                        print("Error logging anomaly/alert:", e)
-                else:
-                    monitoring_status = {
-                        "status": "OK",
-                        "message": "No anomaly detected."
-                    }
-            else:
-                print("Failed to get image from ESP32. Status code:", response.status_code)
+            await sync_cameras()
+            await asyncio.to_thread(write_json_atomic, MONITOR_STATUS_FILE, local_snapshot())
         except Exception as e:
-            print("Error during continuous monitoring:", e)
-            monitoring_status = {
-                "status": "ERROR",
-                "message": f"Error during monitoring: {e}"
-            }
-        await asyncio.sleep(3)
+            print("Error publishing monitoring status:", e)
+        await asyncio.sleep(MONITOR_PUBLISH_INTERVAL_S)
+
+async def leader_election_loop():
+    while not await asyncio.to_thread(leader_lock.try_acquire):
+        await asyncio.sleep(MONITOR_LEADER_RETRY_S)
+    await run_leader()
 
+# ------------------------------
+# Endpoints
+# ------------------------------
+# Followers read the leader's files; a slow or locked tmpfs must not stall the event loop
 @router.get("/monitor_status")
 async def monitor_status_endpoint():
-    return JSONResponse(content=monitoring_status)
+    snapshot = await asyncio.to_thread(current_snapshot)
+    return JSONResponse(content=snapshot["status"])
+
+@router.get("/monitor_status/{camera_id}")
+async def camera_status_endpoint(camera_id: str):
+    snapshot = await asyncio.to_thread(current_snapshot)
+    status = snapshot["status"]["cameras"].get(camera_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Unknown camera.")
+    return JSONResponse(content=status)
+
+@router.get("/monitor_metrics")
+async def monitor_metrics_endpoint():
+    snapshot = await asyncio.to_thread(current_snapshot)
+    return JSONResponse(content={
+        "leader_pid": snapshot["leader_pid"],
+        "published_at": snapshot["published_at"],
+        "cameras": snapshot["metrics"],
+    })
+
+@router.get("/cameras")
+async def list_cameras():
+    if MONITOR_MODE == "inline":
+        return JSONResponse(content=[camera.to_dict() for camera in camera_registry.all()])
+    return JSONResponse(content=await asyncio.to_thread(load_camera_configs))
+
+@router.post("/cameras")
+async def register_camera(config: CameraConfig):
+    if MONITOR_MODE == "inline":
+        scheduler.add_camera(Camera(config.id, config.url, config.interval_s))
+    else:
+        entry = {"id": config.id, "url": config.url, "interval_s": config.interval_s}
+        await asyncio.to_thread(update_camera_configs,
+                                lambda configs: [c for c in configs if c["id"] != config.id] + [entry])
+    return JSONResponse(content={"registered": config.id})
+
+@router.delete("/cameras/{camera_id}")
+async def unregister_camera(camera_id: str):
+    if MONITOR_MODE == "inline":
+        removed = scheduler.remove_camera(camera_id) is not None
+    else:
+        before = await asyncio.to_thread(load_camera_configs)
+        removed = any(c["id"] == camera_id for c in before)
+        if removed:
+            await asyncio.to_thread(update_camera_configs,
+                                    lambda configs: [c for c in configs if c["id"] != camera_id])
+    if not removed:
+        raise HTTPException(status_code=404, detail="Unknown camera.")
+    return JSONResponse(content={"removed": camera_id})
 
 def start_monitoring():
-    # This function can be called on app startup to run the monitoring task.
-    asyncio.create_task(continuous_monitoring_task())
+    # Called on app startup; what runs here depends on MONITOR_MODE.
+    global _leader_task
+    if MONITOR_MODE == "inline":
+        scheduler.start()
+    elif MONITOR_MODE == "leader":
+        _leader_task = asyncio.create_task(leader_election_loop())
+
+async def stop_monitoring():
+    global is_leader, _leader_task
+    if _leader_task is not None:
+        _leader_task.cancel()
+        # Let the publish loop unwind before the lock is released below
+        await asyncio.gather(_leader_task, return_exceptions=True)
+        _leader_task = None
+    await scheduler.stop()
+    leader_lock.release()
+    is_leader = False
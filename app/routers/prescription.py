@@ -1,12 +1,11 @@
-import io
 import json
 import re
 from datetime import datetime
 from fastapi import APIRouter, UploadFile, File, Form, HTTPException
 from fastapi.responses import JSONResponse
-from PIL import Image
-from app.config import db
-from app.utils.gemini_utils import gemini_inference
+from app.routers.image_analysis import prepare_upload
+from app.utils.firestore_utils import firestore_writer
+from app.utils.gemini_utils import gemini_inference_async
 
 router = APIRouter()
 
@@ -38,14 +37,10 @@ async def extract_prescription(
     
     if text:
         extraction_input = extraction_prompt + "\n\nInput Text:\n" + text
-        extraction_result = gemini_inference(extraction_input)
+        extraction_result = await gemini_inference_async(extraction_input)
     else:
-        try:
-            contents = await file.read()
-            image = Image.open(io.BytesIO(contents)).convert("RGB")
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Error reading image: {e}")
-        extraction_result = gemini_inference(prompt=extraction_prompt, image=image)
+        image = await prepare_upload(file)
+        extraction_result = await gemini_inference_async(prompt=extraction_prompt, image=image)
     
     print("🔹 Raw Extraction Result from Gemini:", extraction_result)
     cleaned_result = extraction_result.strip()
@@ -58,13 +53,12 @@ async def extract_prescription(
         print(f"Error parsing extraction result as JSON: {e}")
     
     try:
-        doc_ref = db.collection("prescriptions").document()
-        doc_ref.set({
+        firestore_writer.add("prescriptions", {
             "prescription": prescription_data,
             "timestamp": datetime.utcnow(),
             "source": "text" if text else "image"
         })
-        print("🔹 Saved prescription data to Firestore.")
+        print("🔹 Queued prescription data for Firestore.")
     except Exception as e:
         print(f"Error saving prescription data to Firestore: {e}")
     
@@ -1,39 +1,73 @@
+import asyncio
+import json
+import time
+from datetime import datetime, timezone
 import numpy as np
 from fastapi import APIRouter
-from fastapi.responses import JSONResponse
-from app.config import db
+from fastapi.responses import JSONResponse, StreamingResponse
 from app.models import ChatQuery
-from app.utils.faiss_utils import build_faiss_index_from_summary
-from app.utils.gemini_utils import gemini_inference
+from app.utils.embedding_utils import embedding_service
+from app.utils.faiss_utils import summary_index_cache
+from app.utils.firestore_utils import summary_store
+from app.utils.gemini_utils import ERROR_RESPONSE, gemini_inference_async, gemini_inference_stream
+from app.utils.metrics import Histogram, registry, timed
+from app.utils.vector_index import corpus_index
 
 router = APIRouter()
 
-@router.post("/rag_chat")
-async def rag_chat_endpoint(request: ChatQuery) -> JSONResponse:
-    query = request.query
+class RetrievalError(Exception):
+    """
+    Raised when no answer can be attempted; the message is shown to the user as the response.
+    """
+
+def uses_history(request: ChatQuery) -> bool:
+    return (request.scope == "history" or request.patient_id is not None
+            or request.start_date is not None or request.end_date is not None)
+
+async def retrieve_latest(query: str, k: int):
     try:
-        docs = db.collection("transcription_summaries").order_by("timestamp", direction="DESCENDING").limit(1).stream()
-        summary = None
-        for doc in docs:
-            summary = doc.to_dict().get("summary")
-        if not summary:
-            return JSONResponse(content={"response": "No transcription summary available. Please transcribe first."})
+        _, latest = await summary_store.latest_async()
+        summary = latest.get("summary") if latest else None
     except Exception as e:
-        return JSONResponse(content={"response": f"Error retrieving summary from Firestore: {e}"})
-        
-    index, mapping = build_faiss_index_from_summary(summary)
+        raise RetrievalError(f"Error retrieving summary from Firestore: {e}")
+    if not summary:
+        raise RetrievalError("No transcription summary available. Please transcribe first.")
+
+    index, mapping = await summary_index_cache.get_or_build(summary)
     if index is None:
-        return JSONResponse(content={"response": "Unable to build FAISS index from summary."})
+        raise RetrievalError("Unable to build FAISS index from summary.")
     
-    from sentence_transformers import SentenceTransformer
-    embedding_model = SentenceTransformer('all-mpnet-base-v2')
-    query_embedding = embedding_model.encode(query)
+    query_embedding = await embedding_service.encode(query)
     query_embedding = np.array([query_embedding]).astype("float32")
-    k = 5
-    distances, indices = index.search(query_embedding, k)
+    with timed("faiss_search"):
+        distances, indices = index.search(query_embedding, k)
     retrieved_context = [mapping.get(idx, "") for idx in indices[0]]
-    context_text = "\n".join(retrieved_context)
-    
+    return retrieved_context, "\n".join(retrieved_context)
+
+async def retrieve_history(request: ChatQuery, k: int):
+    hits = await corpus_index.search(request.query, k, patient_id=request.patient_id,
+                                     start=request.start_date, end=request.end_date)
+    if not hits:
+        raise RetrievalError("No matching encounters found. Please transcribe first or widen the filters.")
+    # Date-label each chunk so the model can tell encounters apart
+    lines = []
+    for hit in hits:
+        when = datetime.fromtimestamp(hit["timestamp"], timezone.utc).strftime("%Y-%m-%d") if hit["timestamp"] else "undated"
+        lines.append(f"[{when}] {hit['text']}")
+    return [hit["text"] for hit in hits], "\n".join(lines)
+
+async def retrieve_context(request: ChatQuery):
+    """
+    Returns (retrieved_context, llm_prompt) for a question about the latest summary,
+    or about every stored encounter matching the request's filters.
+    """
+    query = request.query
+    k = 5
+    if uses_history(request):
+        retrieved_context, context_text = await retrieve_history(request, k)
+    else:
+        retrieved_context, context_text = await retrieve_latest(query, k)
+
     llm_prompt = (
         "You are a helpful and empathetic AI medical assistant. Answer the following question based on the provided meeting summary context.\n\n"
         "Example 1:\n"
@@ -48,5 +82,107 @@ async def rag_chat_endpoint(request: ChatQuery) -> JSONResponse:
         f"Question: {query}\n"
         f"Answer:"
     )
-    response_text = gemini_inference(llm_prompt)
+    return retrieved_context, llm_prompt
+
+@router.post("/rag_chat")
+async def rag_chat_endpoint(request: ChatQuery) -> JSONResponse:
+    try:
+        retrieved_context, llm_prompt = await retrieve_context(request)
+    except RetrievalError as e:
+        return JSONResponse(content={"response": str(e)})
+    response_text = await gemini_inference_async(llm_prompt)
     return JSONResponse(content={"response": response_text, "retrieved_context": retrieved_context})
+
+# ------------------------------
+# Streaming variant (Server-Sent Events)
+# ------------------------------
+stream_stats = {
+    "streams": 0,
+    "completed": 0,
+    "errors": 0,
+    "disconnects": 0,
+    "first_byte_seconds_total": 0.0,
+    "first_token_seconds_total": 0.0,
+    "first_token_count": 0,
+    "max_first_token_seconds": 0.0,
+}
+
+first_byte_latency = registry.register(Histogram(
+    "vitalgenie_rag_stream_first_byte_seconds", "Time from request to the first SSE event (retrieved context)."))
+first_token_latency = registry.register(Histogram(
+    "vitalgenie_rag_stream_first_token_seconds", "Time from request to the first model token."))
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def rag_chat_events(request: ChatQuery, received_at: float):
+    """
+    Yields SSE frames: `context` first (the retrieved chunks), then one `token` per
+    model chunk and a final `done` (full `response`) or `error`.
+    """
+    stream_stats["streams"] += 1
+    finished = False
+    try:
+        try:
+            retrieved_context, llm_prompt = await retrieve_context(request)
+        except RetrievalError as e:
+            retrieved_context, llm_prompt, message = [], None, str(e)
+        first_byte = time.perf_counter() - received_at
+        stream_stats["first_byte_seconds_total"] += first_byte
+        first_byte_latency.observe(first_byte)
+        yield sse_event("context", {"retrieved_context": retrieved_context})
+        if llm_prompt is None:
+            finished = True
+            stream_stats["completed"] += 1
+            yield sse_event("done", {"response": message})
+            return
+
+        parts = []
+        try:
+            async for text in gemini_inference_stream(llm_prompt):
+                if not parts:
+                    first_token = time.perf_counter() - received_at
+                    stream_stats["first_token_count"] += 1
+                    stream_stats["first_token_seconds_total"] += first_token
+                    stream_stats["max_first_token_seconds"] = max(stream_stats["max_first_token_seconds"], first_token)
+                    first_token_latency.observe(first_token)
+                parts.append(text)
+                yield sse_event("token", {"text": text})
+        except Exception as e:
+            print(f"Gemini streaming error: {type(e).__name__}: {e}")
+            finished = True
+            stream_stats["errors"] += 1
+            yield sse_event("error", {"response": "".join(parts) or ERROR_RESPONSE})
+            return
+        finished = True
+        stream_stats["completed"] += 1
+        yield sse_event("done", {"response": "".join(parts)})
+    finally:
+        if not finished:
+            stream_stats["disconnects"] += 1
+
+@router.post("/rag_chat_stream")
+async def rag_chat_stream_endpoint(request: ChatQuery) -> StreamingResponse:
+    """
+    Same question answering as /rag_chat, with the answer streamed token by token.
+    """
+    return StreamingResponse(
+        rag_chat_events(request, time.perf_counter()),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.get("/rag_chat_metrics")
+async def rag_chat_metrics_endpoint() -> JSONResponse:
+    stats = dict(stream_stats)
+    stats["avg_first_byte_ms"] = 1000.0 * stats["first_byte_seconds_total"] / (stats["streams"] or 1)
+    stats["avg_first_token_ms"] = 1000.0 * stats["first_token_seconds_total"] / (stats["first_token_count"] or 1)
+    return JSONResponse(content=stats)
+
+@router.get("/corpus_index_stats")
+async def corpus_index_stats_endpoint() -> JSONResponse:
+    return JSONResponse(content=await asyncio.to_thread(corpus_index.get_stats))
+
+@router.get("/embedding_stats")
+async def embedding_stats_endpoint() -> JSONResponse:
+    return JSONResponse(content=embedding_service.get_stats())
@@ -1,29 +1,46 @@
-import os
-import tempfile
 from datetime import datetime
-from fastapi import APIRouter, UploadFile, File, HTTPException
+import asyncio
+from fastapi import APIRouter, HTTPException, Request, WebSocket, WebSocketDisconnect
 from fastapi.responses import JSONResponse
-from app.config import db, whisper_model
-from app.utils.gemini_utils import gemini_inference
+from app.config import (
+    MODEL_NAME,
+    TRANSCRIBE_WORKER_MODE,
+    TRANSCRIBE_WORKERS,
+    LONG_AUDIO_ENABLED,
+    LONG_AUDIO_THRESHOLD_S,
+    LONG_AUDIO_CHUNK_S,
+    LONG_AUDIO_WORKERS,
+    WHISPER_QUANTIZE_CPU,
+    MAX_UPLOAD_BYTES,
+    STREAM_VAD_THRESHOLD,
+    STREAM_SILENCE_S,
+    STREAM_MAX_SEGMENT_S,
+    STREAM_PARTIAL_INTERVAL_S,
+    DIARIZATION_MODE,
+    get_device,
+)
+from app.utils.audio_utils import SAMPLE_RATE, AudioDecodeError, UploadTooLargeError, decode_stream
+from app.utils.diarization import diarize_segments, format_diarized
+from app.utils.faiss_utils import summary_index_cache
+from app.utils.firestore_utils import SUMMARIES_COLLECTION, firestore_writer, summary_store
+from app.utils.gemini_utils import ERROR_RESPONSE, gemini_inference_async
+from app.utils.job_queue import JobQueue, QueueFullError
+from app.utils.metrics import timed
+from app.utils.streaming_utils import StreamingTranscriber
+from app.utils.upload_utils import MultipartFileStream, UploadFormError
+from app.utils.vector_index import corpus_index
+from app.utils.whisper_worker import WhisperExecutor
 
 router = APIRouter()
 
-@router.post("/transcribe")
-async def transcribe_audio(file: UploadFile = File(...)) -> JSONResponse:
-    if file.content_type not in ["audio/wav", "audio/x-wav", "audio/mpeg"]:
-        raise HTTPException(status_code=400, detail="Invalid format. Upload a WAV or MP3 file.")
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as tmp:
-        temp_filename = tmp.name
-        tmp.write(await file.read())
-    try:
-        transcription_result = whisper_model.transcribe(temp_filename, language="en")
-        full_transcription = transcription_result["text"].strip()
-    except Exception as e:
-        os.remove(temp_filename)
-        raise HTTPException(status_code=500, detail=f"Transcription failed: {e}")
-    os.remove(temp_filename)
-    print("✅ Transcription Completed Successfully!")
-    
+ALLOWED_AUDIO_TYPES = ["audio/wav", "audio/x-wav", "audio/mpeg"]
+
+whisper_executor = WhisperExecutor(TRANSCRIBE_WORKER_MODE, TRANSCRIBE_WORKERS, MODEL_NAME)
+# Worker processes only start when the first long recording arrives
+long_audio_executor = WhisperExecutor("process", LONG_AUDIO_WORKERS, MODEL_NAME, quantize=WHISPER_QUANTIZE_CPU)
+
+
+async def diarize_with_gemini(full_transcription: str) -> str:
     diarization_prompt = (
         "You are an expert speech analyst. Given the following transcription from a meeting, "
         "please split the transcript into segments by speaker. For each segment, if possible, "
@@ -31,17 +48,230 @@ async def transcribe_audio(file: UploadFile = File(...)) -> JSONResponse:
         "If timestamps are not available, simply separate the text by speaker. "
         f"Transcription:\n{full_transcription}"
     )
-    diarized_transcript = gemini_inference(diarization_prompt)
+    # Transcripts are unique per recording; caching them would only fill the cache
+    diarized_transcript = await gemini_inference_async(diarization_prompt, use_cache=False)
     print("🔹 Diarized Transcript from Gemini:", diarized_transcript)
-    
+    return diarized_transcript
+
+
+async def diarize_and_save(full_transcription: str, patient_id: str = None, audio=None, segments: list = None) -> str:
+    """
+    Splits a transcript by speaker, saves it to Firestore, pre-builds its RAG index and adds
+    it to the corpus-wide index. With DIARIZATION_MODE = "local" and the audio and Whisper
+    segments at hand, speakers are found locally; otherwise (or if that fails) Gemini does it.
+    """
+    diarized_segments = None
+    if DIARIZATION_MODE == "local" and audio is not None and segments:
+        try:
+            with timed("diarization"):
+                diarized_segments = await asyncio.to_thread(diarize_segments, audio, segments)
+        except Exception as e:
+            print(f"Local diarization failed, falling back to Gemini: {e}")
+    if diarized_segments:
+        diarized_transcript = format_diarized(diarized_segments)
+        print("🔹 Diarized Transcript (local):", diarized_transcript)
+    else:
+        diarized_transcript = await diarize_with_gemini(full_transcription)
+
+    doc_id = None
+    summary_doc = {
+        "summary": diarized_transcript,
+        "patient_id": patient_id,
+        "diarization": "local" if diarized_segments else "gemini",
+        "timestamp": datetime.utcnow()
+    }
+    if diarized_segments:
+        summary_doc["segments"] = diarized_segments
     try:
-        doc_ref = db.collection("transcription_summaries").document()
-        doc_ref.set({
-            "summary": diarized_transcript,
-            "timestamp": datetime.utcnow()
-        })
-        print("🔹 Saved transcription summary to Firestore.")
+        doc_id = firestore_writer.add(SUMMARIES_COLLECTION, summary_doc)
+        summary_store.note_written(doc_id, summary_doc)
+        print("🔹 Queued transcription summary for Firestore.")
     except Exception as e:
         print(f"Error saving summary to Firestore: {e}")
-        
-    return JSONResponse(content={"transcription": full_transcription, "diarized": diarized_transcript})
+
+    # Build the RAG index now so chat questions only pay for a query embedding and a search
+    try:
+        await summary_index_cache.get_or_build(diarized_transcript)
+        print("🔹 Cached FAISS index for transcription summary.")
+    except Exception as e:
+        print(f"Error building FAISS index for summary: {e}")
+
+    # Append to the cross-encounter index incrementally (no rebuild)
+    if doc_id is not None and diarized_transcript != ERROR_RESPONSE:
+        try:
+            added = await corpus_index.add_document(doc_id, diarized_transcript, patient_id, summary_doc["timestamp"])
+            print(f"🔹 Added {added} chunks to the corpus index.")
+        except Exception as e:
+            print(f"Error adding summary to corpus index: {e}")
+    return diarized_transcript
+
+
+async def long_audio_enabled() -> bool:
+    if LONG_AUDIO_ENABLED is None:
+        # CPU worker processes only beat the shared model when that model is on the CPU too
+        device = await asyncio.to_thread(get_device)
+        return device.type == "cpu"
+    return LONG_AUDIO_ENABLED
+
+
+async def transcribe_audio_array(audio) -> dict:
+    if len(audio) > LONG_AUDIO_THRESHOLD_S * SAMPLE_RATE and await long_audio_enabled():
+        return await long_audio_executor.transcribe_chunked(audio, LONG_AUDIO_CHUNK_S, language="en")
+    return await whisper_executor.transcribe(audio, language="en")
+
+
+async def process_transcription_job(payload) -> dict:
+    audio, patient_id = payload
+    try:
+        transcription_result = await transcribe_audio_array(audio)
+        full_transcription = transcription_result["text"].strip()
+    except Exception as e:
+        raise RuntimeError(f"Transcription failed: {e}")
+    print("✅ Transcription Completed Successfully!")
+    diarized_transcript = await diarize_and_save(full_transcription, patient_id, audio,
+                                                 transcription_result.get("segments"))
+    return {"transcription": full_transcription, "diarized": diarized_transcript}
+
+
+transcription_queue = JobQueue(process_transcription_job)
+
+
+async def _submit_upload(request: Request, patient_id: str = None):
+    """
+    Decodes the request body straight from the socket: either multipart/form-data with a
+    "file" part (and optional "patient_id" field) or a raw WAV/MP3 body. The body is
+    never spooled to disk; ffmpeg receives it as it arrives.
+    """
+    if transcription_queue.is_full():
+        raise HTTPException(status_code=429, detail="Transcription queue is full.", headers={"Retry-After": "30"})
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"Upload exceeds {MAX_UPLOAD_BYTES // (1024 * 1024)} MB.")
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    form = None
+    if content_type == "multipart/form-data":
+        try:
+            form = MultipartFileStream(request, "file", ALLOWED_AUDIO_TYPES)
+        except UploadFormError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        chunks = form.file_chunks()
+    elif content_type in ALLOWED_AUDIO_TYPES:
+        chunks = request.stream()
+    else:
+        raise HTTPException(status_code=400, detail="Invalid format. Upload a WAV or MP3 file.")
+    try:
+        audio = await decode_stream(chunks, MAX_UPLOAD_BYTES)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except (AudioDecodeError, UploadFormError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if form is not None:
+        patient_id = patient_id or form.fields.get("patient_id") or None
+    try:
+        return transcription_queue.submit((audio, patient_id))
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "30"})
+
+
+@router.post("/transcribe")
+async def transcribe_audio(request: Request, patient_id: str = None) -> JSONResponse:
+    """
+    Transcribes a WAV/MP3 upload, sent as multipart/form-data or as the raw request body.
+    """
+    job = await _submit_upload(request, patient_id)
+    await job.done.wait()
+    if job.status == "failed":
+        raise HTTPException(status_code=500, detail=job.error)
+    return JSONResponse(content=job.result)
+
+@router.post("/transcribe_jobs", status_code=202)
+async def submit_transcription_job(request: Request, patient_id: str = None) -> JSONResponse:
+    """
+    Queues an audio file for transcription and returns a job id immediately.
+    Poll /transcribe_jobs/{job_id} (optionally with ?wait=<seconds> to long-poll) for the result.
+    """
+    job = await _submit_upload(request, patient_id)
+    return JSONResponse(status_code=202, content={"job_id": job.id, "status": job.status})
+
+@router.get("/transcribe_jobs/{job_id}")
+async def transcription_job_status(job_id: str, wait: float = 0) -> JSONResponse:
+    if wait > 0:
+        job = await transcription_queue.wait(job_id, timeout=min(wait, 60))
+    else:
+        job = transcription_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job id.")
+    return JSONResponse(content=job.to_dict())
+
+@router.get("/transcribe_metrics")
+async def transcription_metrics() -> JSONResponse:
+    return JSONResponse(content=transcription_queue.metrics())
+
+@router.websocket("/transcribe_stream")
+async def transcribe_stream(websocket: WebSocket):
+    """
+    Live transcription. The client sends binary frames of 16 kHz mono little-endian int16 PCM
+    and a text frame "stop" when recording ends. The server pushes JSON events:
+    {"type": "partial"} while an utterance is in progress, {"type": "final"} once it is
+    complete, and a closing {"type": "done"} with the full and diarized transcript.
+    Pass ?patient_id=... to file the encounter under a patient.
+    """
+    await websocket.accept()
+    transcriber = StreamingTranscriber(
+        whisper_executor.transcribe,
+        vad_threshold=STREAM_VAD_THRESHOLD,
+        silence_s=STREAM_SILENCE_S,
+        max_segment_s=STREAM_MAX_SEGMENT_S,
+        partial_interval_s=STREAM_PARTIAL_INTERVAL_S,
+    )
+    closed = asyncio.Event()
+    connected = True
+
+    async def send(event: dict):
+        nonlocal connected
+        if not connected:
+            return
+        try:
+            await websocket.send_json(event)
+        except (WebSocketDisconnect, RuntimeError):
+            connected = False
+
+    async def receive():
+        nonlocal connected
+        try:
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    connected = False
+                    break
+                if message.get("bytes"):
+                    transcriber.feed(message["bytes"])
+                elif (message.get("text") or "").strip().lower() == "stop":
+                    break
+        finally:
+            transcriber.flush()
+            closed.set()
+
+    receiver = asyncio.create_task(receive())
+    try:
+        # Decoding runs beside the receiver so slow Whisper passes never stall incoming audio
+        while not (closed.is_set() and not transcriber.has_pending()):
+            await transcriber.wakeup.wait()
+            transcriber.wakeup.clear()
+            for event in await transcriber.step():
+                await send(event)
+            if transcriber.has_pending() or closed.is_set():
+                transcriber.wakeup.set()
+    finally:
+        receiver.cancel()
+
+    # The finalized transcript goes through the same diarization and Firestore path as uploads,
+    # even if the client dropped the connection instead of sending "stop"
+    full_transcription = transcriber.transcript()
+    diarized_transcript = ""
+    if full_transcription:
+        print("✅ Live Transcription Completed Successfully!")
+        diarized_transcript = await diarize_and_save(full_transcription, websocket.query_params.get("patient_id"))
+    await send({"type": "done", "transcription": full_transcription, "diarized": diarized_transcript})
+    if connected:
+        await websocket.close()
@@ -0,0 +1,163 @@
+import asyncio
+import numpy as np
+
+SAMPLE_RATE = 16000           # Whisper's native sample rate
+FRAME_SAMPLES = 480           # 30 ms analysis frames
+
+
+def frame_energy(audio: np.ndarray) -> np.ndarray:
+    """
+    Mean-square energy of consecutive 30 ms frames.
+    """
+    n_frames = len(audio) // FRAME_SAMPLES
+    if n_frames == 0:
+        return np.zeros(0, dtype="float32")
+    frames = audio[:n_frames * FRAME_SAMPLES].reshape(n_frames, FRAME_SAMPLES)
+    return np.mean(frames.astype("float32") ** 2, axis=1)
+
+
+def split_on_silence(audio: np.ndarray, chunk_s: float, search_s: float = 10.0) -> list:
+    """
+    Cuts audio into roughly `chunk_s`-second pieces. Each cut is moved to the quietest
+    frame within `search_s` seconds of the nominal boundary so words are not split.
+    Returns a list of (start_sample, end_sample) tuples covering the whole signal.
+    """
+    total = len(audio)
+    chunk = int(chunk_s * SAMPLE_RATE)
+    if total <= chunk:
+        return [(0, total)]
+    energy = frame_energy(audio)
+    search = int(search_s * SAMPLE_RATE) // FRAME_SAMPLES
+    bounds = []
+    start = 0
+    while total - start > chunk:
+        nominal = (start + chunk) // FRAME_SAMPLES
+        low = max(start // FRAME_SAMPLES + 1, nominal - search)
+        high = min(len(energy), nominal + search + 1)
+        cut_frame = low + int(np.argmin(energy[low:high])) if high > low else nominal
+        cut = cut_frame * FRAME_SAMPLES + FRAME_SAMPLES // 2
+        bounds.append((start, cut))
+        start = cut
+    bounds.append((start, total))
+    return bounds
+
+
+def stitch_transcripts(results: list, offsets: list) -> dict:
+    """
+    Joins per-chunk Whisper results in order, shifting segment timestamps by each
+    chunk's start offset (seconds) and renumbering segment ids.
+    """
+    segments = []
+    texts = []
+    for result, offset in zip(results, offsets):
+        text = result.get("text", "").strip()
+        if text:
+            texts.append(text)
+        for segment in result.get("segments", []):
+            segment = dict(segment)
+            segment["id"] = len(segments)
+            segment["start"] = round(segment["start"] + offset, 3)
+            segment["end"] = round(segment["end"] + offset, 3)
+            segments.append(segment)
+    language = results[0].get("language", "en") if results else "en"
+    return {"text": " ".join(texts), "segments": segments, "language": language}
+
+
+class AudioDecodeError(Exception):
+    """Raised when an upload is not decodable audio."""
+
+
+class UploadTooLargeError(Exception):
+    """Raised when an upload exceeds the configured size limit."""
+
+
+def sniff_audio_format(header: bytes):
+    """
+    Identifies common audio containers from their leading bytes. Returns None if unknown.
+    """
+    if header[:4] == b"RIFF" and header[8:12] == b"WAVE":
+        return "wav"
+    if header[:3] == b"ID3" or (len(header) > 1 and header[0] == 0xFF and header[1] & 0xE0 == 0xE0):
+        return "mp3"
+    if header[:4] == b"\x1aE\xdf\xa3":
+        return "webm"
+    if header[:4] == b"OggS":
+        return "ogg"
+    if header[:4] == b"fLaC":
+        return "flac"
+    return None
+
+
+async def decode_stream(chunks, max_bytes: int) -> np.ndarray:
+    """
+    Pipes an async iterator of compressed audio bytes (e.g. a request body as it arrives
+    from the socket) through ffmpeg and returns 16 kHz mono float32 samples. The
+    compressed upload is never held in memory or written to disk; only the decoded
+    16-bit PCM is accumulated. The format is sniffed from the first bytes before ffmpeg
+    starts, and the byte limit is enforced while reading.
+    """
+    chunks = chunks.__aiter__()
+    first = b""
+    while len(first) < 16:
+        try:
+            first += await chunks.__anext__()
+        except StopAsyncIteration:
+            break
+    if len(first) > max_bytes:
+        raise UploadTooLargeError(f"Upload exceeds {max_bytes // (1024 * 1024)} MB.")
+    if sniff_audio_format(first) is None:
+        raise AudioDecodeError("Unrecognised audio format.")
+
+    process = await asyncio.create_subprocess_exec(
+        "ffmpeg", "-nostdin", "-loglevel", "error", "-threads", "0",
+        "-i", "pipe:0", "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(SAMPLE_RATE), "pipe:1",
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    pcm = bytearray()
+    errors = bytearray()
+
+    async def feed():
+        received = len(first)
+        chunk = first
+        try:
+            while chunk:
+                if received > max_bytes:
+                    raise UploadTooLargeError(f"Upload exceeds {max_bytes // (1024 * 1024)} MB.")
+                process.stdin.write(chunk)
+                await process.stdin.drain()
+                try:
+                    chunk = await chunks.__anext__()
+                except StopAsyncIteration:
+                    break
+                received += len(chunk)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # ffmpeg gave up; its exit code and stderr explain why
+        finally:
+            process.stdin.close()
+
+    async def drain(stream, buffer, limit=None):
+        while True:
+            data = await stream.read(65536)
+            if not data:
+                break
+            if limit is None or len(buffer) < limit:
+                buffer.extend(data)
+
+    try:
+        await asyncio.gather(feed(), drain(process.stdout, pcm), drain(process.stderr, errors, 4096))
+    except BaseException:
+        if process.returncode is None:
+            process.kill()
+        await process.wait()
+        raise
+    if await process.wait() != 0:
+        message = errors.decode("utf-8", "replace").strip().splitlines()
+        raise AudioDecodeError(f"Could not decode audio: {message[-1] if message else 'ffmpeg failed'}")
+    if len(pcm) < 2:
+        raise AudioDecodeError("Audio contains no samples.")
+
+    audio = np.frombuffer(pcm, np.int16, count=len(pcm) // 2).astype(np.float32)
+    audio *= 1.0 / 32768.0
+    return audio
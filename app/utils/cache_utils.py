@@ -0,0 +1,152 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from app.config import (
+    GEMINI_MODEL_NAME,
+    GEMINI_CACHE_PATH,
+    GEMINI_CACHE_TTL_S,
+    GEMINI_CACHE_MEMORY_ENTRIES,
+    GEMINI_CACHE_MAX_BYTES,
+)
+from app.utils.image_utils import PreparedImage
+
+
+def image_fingerprint(image) -> str:
+    """
+    Hash of an image's decoded pixels (plus mode and size), so the same picture
+    re-encoded or re-uploaded with different metadata still hits the cache.
+    """
+    if isinstance(image, PreparedImage):
+        image = image.image
+    digest = hashlib.sha256()
+    digest.update(f"{image.mode}:{image.size}".encode("utf-8"))
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+def response_cache_key(prompt: str, image=None, model_name: str = GEMINI_MODEL_NAME) -> str:
+    """
+    Key for a model response. The model name is part of it, so switching models never
+    serves answers cached from the previous one.
+    """
+    digest = hashlib.sha256(f"{model_name}\0".encode("utf-8"))
+    digest.update(prompt.encode("utf-8"))
+    if image is not None:
+        digest.update(b"\0image:")
+        digest.update(image_fingerprint(image).encode("ascii"))
+    return digest.hexdigest()
+
+
+class ResponseCache:
+    """
+    Two-tier cache for model responses: an in-memory LRU in front of a SQLite table.
+    Entries expire after `ttl_s`; the SQLite tier is trimmed oldest-first once its
+    payload exceeds `max_bytes`. Safe to call from worker threads. The SQLite file is
+    only opened on first use, so importing the module never touches the disk.
+    """
+
+    def __init__(self, path: str = GEMINI_CACHE_PATH, ttl_s: float = GEMINI_CACHE_TTL_S,
+                 memory_entries: int = GEMINI_CACHE_MEMORY_ENTRIES, max_bytes: int = GEMINI_CACHE_MAX_BYTES):
+        self.path = path
+        self.ttl_s = ttl_s
+        self.memory_entries = memory_entries
+        self.max_bytes = max_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+        self._conn = None
+
+    def _connection(self) -> sqlite3.Connection:
+        # Called with self._lock held
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, created_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_created_at ON responses(created_at)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _remember(self, key: str, value: str, created_at: float):
+        self._memory[key] = (value, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and now - entry[1] < self.ttl_s:
+                self._memory.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return entry[0]
+            row = self._connection().execute(
+                "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and now - row[1] < self.ttl_s:
+                self._remember(key, row[0], row[1])
+                self._stats["disk_hits"] += 1
+                return row[0]
+            self._memory.pop(key, None)
+            self._stats["misses"] += 1
+            return None
+
+    def put(self, key: str, value: str):
+        now = time.time()
+        size = len(value.encode("utf-8"))
+        with self._lock:
+            self._remember(key, value, now)
+            self._connection().execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, created_at) VALUES (?, ?, ?, ?)",
+                (key, value, size, now),
+            )
+            self._stats["writes"] += 1
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float):
+        # Only called from put(), after the connection has been opened
+        expired = self._conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_s,)).rowcount
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        trimmed = 0
+        if total > self.max_bytes:
+            # Drop the oldest rows until the table fits in its budget again
+            rows = self._conn.execute("SELECT key, size FROM responses ORDER BY created_at").fetchall()
+            stale = []
+            for key, size in rows:
+                if total <= self.max_bytes:
+                    break
+                stale.append((key,))
+                total -= size
+            self._conn.executemany("DELETE FROM responses WHERE key = ?", stale)
+            for (key,) in stale:
+                self._memory.pop(key, None)
+            trimmed = len(stale)
+        self._stats["evictions"] += max(expired, 0) + trimmed
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            conn = self._connection()
+            conn.execute("DELETE FROM responses")
+            conn.commit()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            if self._conn is None:
+                row = (0, 0)  # Nothing cached by this process yet; don't open the file just to report
+            else:
+                row = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        stats["memory_entries"] = len(self._memory)
+        stats["disk_entries"] = row[0]
+        stats["disk_bytes"] = row[1]
+        return stats
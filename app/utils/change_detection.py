@@ -0,0 +1,72 @@
+import time
+import numpy as np
+from PIL import Image
+from app.config import MONITOR_CHANGE_THRESHOLD, MONITOR_MAX_STALENESS_S, MONITOR_GATE_SIZE
+
+
+class FrameChangeDetector:
+    """
+    Cheap local pre-filter for camera frames. Each frame is reduced to a small
+    grayscale thumbnail and compared with the thumbnail of the last frame that was
+    sent to Gemini. Only a difference above `threshold`, or `max_staleness_s`
+    without any check, escalates the frame.
+    """
+
+    def __init__(self, threshold: float = MONITOR_CHANGE_THRESHOLD,
+                 max_staleness_s: float = MONITOR_MAX_STALENESS_S, size: int = MONITOR_GATE_SIZE):
+        self.threshold = threshold
+        self.max_staleness_s = max_staleness_s
+        self.size = size
+        self._reference = None
+        self._reference_time = 0.0
+        self._stats = {
+            "frames": 0,
+            "escalated": 0,
+            "skipped": 0,
+            "escalated_first_frame": 0,
+            "escalated_scene_change": 0,
+            "escalated_stale": 0,
+            "last_score": None,
+        }
+
+    def signature(self, image: Image.Image) -> np.ndarray:
+        thumbnail = image.convert("L").resize((self.size, self.size), Image.BILINEAR)
+        return np.asarray(thumbnail, dtype=np.float32) / 255.0
+
+    def check(self, image: Image.Image, now: float = None):
+        """
+        Returns (escalate, reason, score). When escalating, the frame becomes the new reference.
+        """
+        now = time.time() if now is None else now
+        current = self.signature(image)
+        self._stats["frames"] += 1
+        if self._reference is None:
+            reason, score = "first_frame", None
+        else:
+            score = float(np.mean(np.abs(current - self._reference)))
+            self._stats["last_score"] = score
+            if score >= self.threshold:
+                reason = "scene_change"
+            elif now - self._reference_time >= self.max_staleness_s:
+                reason = "stale"
+            else:
+                self._stats["skipped"] += 1
+                return False, "unchanged", score
+        self._reference = current
+        self._reference_time = now
+        self._stats["escalated"] += 1
+        self._stats[f"escalated_{reason}"] += 1
+        return True, reason, score
+
+    def reset(self):
+        """
+        Forgets the reference frame so the next frame is always escalated (e.g. after a failed check).
+        """
+        self._reference = None
+
+    def get_stats(self) -> dict:
+        stats = dict(self._stats)
+        stats["skip_ratio"] = stats["skipped"] / stats["frames"] if stats["frames"] else 0.0
+        stats["threshold"] = self.threshold
+        stats["max_staleness_s"] = self.max_staleness_s
+        return stats
@@ -0,0 +1,194 @@
+import numpy as np
+from app.config import (
+    DIARIZATION_EMBEDDING,
+    DIARIZATION_NUM_SPEAKERS,
+    DIARIZATION_MAX_SPEAKERS,
+    DIARIZATION_DISTANCE_THRESHOLD,
+    DIARIZATION_MIN_SEGMENT_S,
+    get_speaker_encoder,
+)
+from app.utils.audio_utils import SAMPLE_RATE
+
+N_FFT = 512
+WIN_SAMPLES = 400                 # 25 ms analysis window
+HOP_SAMPLES = 160                 # 10 ms hop
+N_MELS = 40
+MIN_EMBED_SAMPLES = 4000          # 0.25 s; below this a segment just inherits its neighbour's speaker
+
+_mel_filters = None
+
+
+def mel_filterbank(n_mels: int = N_MELS, n_fft: int = N_FFT, fmin: float = 20.0, fmax: float = 7600.0) -> np.ndarray:
+    def hz_to_mel(hz):
+        return 2595.0 * np.log10(1.0 + hz / 700.0)
+
+    def mel_to_hz(mel):
+        return 700.0 * (10.0 ** (mel / 2595.0) - 1.0)
+
+    edges = mel_to_hz(np.linspace(hz_to_mel(fmin), hz_to_mel(fmax), n_mels + 2))
+    bins = np.fft.rfftfreq(n_fft, 1.0 / SAMPLE_RATE)
+    filters = np.zeros((n_mels, len(bins)), dtype=np.float32)
+    for i in range(n_mels):
+        left, center, right = edges[i], edges[i + 1], edges[i + 2]
+        rising = (bins - left) / (center - left)
+        falling = (right - bins) / (right - center)
+        filters[i] = np.maximum(0.0, np.minimum(rising, falling))
+    return filters
+
+
+def log_mel(audio: np.ndarray) -> np.ndarray:
+    """
+    (frames, N_MELS) log mel energies of a 16 kHz signal.
+    """
+    global _mel_filters
+    if _mel_filters is None:
+        _mel_filters = mel_filterbank()
+    if len(audio) < WIN_SAMPLES:
+        audio = np.pad(audio, (0, WIN_SAMPLES - len(audio)))
+    n_frames = 1 + (len(audio) - WIN_SAMPLES) // HOP_SAMPLES
+    index = np.arange(WIN_SAMPLES)[None, :] + HOP_SAMPLES * np.arange(n_frames)[:, None]
+    frames = audio[index] * np.hanning(WIN_SAMPLES).astype(np.float32)
+    power = np.abs(np.fft.rfft(frames, n=N_FFT, axis=1)) ** 2
+    return np.log(power @ _mel_filters.T + 1e-10)
+
+
+def logmel_embedding(audio: np.ndarray) -> np.ndarray:
+    """
+    Voice statistics of a segment: mean and spread of its log mel spectrum over the
+    louder 70% of frames (pauses and breaths are left out).
+    """
+    features = log_mel(audio)
+    energy = features.mean(axis=1)
+    voiced = features[energy >= np.percentile(energy, 30)]
+    return np.concatenate([voiced.mean(axis=0), voiced.std(axis=0)])
+
+
+def ecapa_embedding(audio: np.ndarray) -> np.ndarray:
+    import torch
+    with torch.no_grad():
+        embedding = get_speaker_encoder().encode_batch(torch.from_numpy(np.ascontiguousarray(audio))[None, :])
+    return embedding.squeeze().cpu().numpy()
+
+
+def cluster_embeddings(embeddings: np.ndarray, num_speakers: int = None, max_speakers: int = DIARIZATION_MAX_SPEAKERS,
+                       threshold: float = DIARIZATION_DISTANCE_THRESHOLD) -> np.ndarray:
+    """
+    Average-linkage agglomerative clustering on cosine distance. Merges down to
+    `num_speakers` clusters if given; otherwise until the closest pair of clusters is
+    further apart than `threshold` (and at most `max_speakers` remain).
+    Returns one cluster label per row.
+    """
+    n = len(embeddings)
+    labels = np.arange(n)
+    if n <= 1:
+        return labels
+    unit = embeddings / (np.linalg.norm(embeddings, axis=1, keepdims=True) + 1e-10)
+    distance = 1.0 - unit @ unit.T
+    np.fill_diagonal(distance, np.inf)
+    sizes = np.ones(n)
+    clusters = n
+    target = max(1, num_speakers or 1)
+    while clusters > target:
+        i, j = np.unravel_index(np.argmin(distance), distance.shape)
+        if num_speakers is None and clusters <= max_speakers and distance[i, j] > threshold:
+            break
+        merged = (distance[i] * sizes[i] + distance[j] * sizes[j]) / (sizes[i] + sizes[j])
+        distance[i, :] = merged
+        distance[:, i] = merged
+        distance[i, i] = np.inf
+        distance[j, :] = np.inf
+        distance[:, j] = np.inf
+        sizes[i] += sizes[j]
+        labels[labels == j] = i
+        clusters -= 1
+    return labels
+
+
+def diarize_segments(audio: np.ndarray, segments: list, num_speakers: int = DIARIZATION_NUM_SPEAKERS,
+                     embedding: str = DIARIZATION_EMBEDDING, min_segment_s: float = DIARIZATION_MIN_SEGMENT_S) -> list:
+    """
+    Labels Whisper segments with speakers using the audio already in memory. Blocking
+    (numpy/torch work); run it in a thread. Returns [{"start", "end", "speaker", "text"}].
+    Speakers are numbered in order of first appearance.
+    """
+    segments = [s for s in segments if s.get("text", "").strip()]
+    if not segments:
+        return []
+    embed = ecapa_embedding if embedding == "ecapa" else logmel_embedding
+
+    # Segments long enough for a stable voice estimate are clustered; shorter ones are
+    # matched to the nearest speaker afterwards so they cannot split off as extra speakers
+    long_positions, long_vectors, short_positions, short_vectors = [], [], [], []
+    for position, segment in enumerate(segments):
+        start = int(segment["start"] * SAMPLE_RATE)
+        end = min(len(audio), int(segment["end"] * SAMPLE_RATE))
+        if end - start >= min_segment_s * SAMPLE_RATE:
+            long_positions.append(position)
+            long_vectors.append(embed(audio[start:end]))
+        elif end - start >= MIN_EMBED_SAMPLES:
+            short_positions.append(position)
+            short_vectors.append(embed(audio[start:end]))
+
+    labels = [None] * len(segments)
+    if long_vectors:
+        vectors = np.asarray(long_vectors, dtype=np.float64)
+        mean, scale = np.zeros(vectors.shape[1]), np.ones(vectors.shape[1])
+        if embedding != "ecapa":
+            # Standardize each feature so no single mel band dominates the distance
+            mean, scale = vectors.mean(axis=0), vectors.std(axis=0) + 1e-6
+        vectors = (vectors - mean) / scale
+        count = min(num_speakers, len(vectors)) if num_speakers else None
+        long_labels = cluster_embeddings(vectors, count)
+        for position, label in zip(long_positions, long_labels):
+            labels[position] = int(label)
+        if short_vectors:
+            speakers = np.unique(long_labels)
+            centroids = np.stack([vectors[long_labels == speaker].mean(axis=0) for speaker in speakers])
+            centroids /= np.linalg.norm(centroids, axis=1, keepdims=True) + 1e-10
+            short = (np.asarray(short_vectors, dtype=np.float64) - mean) / scale
+            short /= np.linalg.norm(short, axis=1, keepdims=True) + 1e-10
+            for position, nearest in zip(short_positions, np.argmax(short @ centroids.T, axis=1)):
+                labels[position] = int(speakers[nearest])
+
+    # Anything left (too short to embed, or no long segment at all) takes its neighbour's speaker
+    for position in range(len(labels)):
+        if labels[position] is None and position > 0:
+            labels[position] = labels[position - 1]
+    for position in reversed(range(len(labels))):
+        if labels[position] is None:
+            labels[position] = labels[position + 1] if position + 1 < len(labels) else 0
+
+    names = {}
+    diarized = []
+    for segment, label in zip(segments, labels):
+        speaker = names.setdefault(label, f"Speaker {len(names) + 1}")
+        diarized.append({
+            "start": round(float(segment["start"]), 2),
+            "end": round(float(segment["end"]), 2),
+            "speaker": speaker,
+            "text": segment["text"].strip(),
+        })
+    return diarized
+
+
+def format_timestamp(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes:02d}:{seconds:02d}"
+
+
+def format_diarized(segments: list) -> str:
+    """
+    Plain-text transcript with one line per speaker turn (consecutive segments of the
+    same speaker are merged), in the form "Speaker 1 [00:00 - 00:12]: ...".
+    """
+    turns = []
+    for segment in segments:
+        if turns and turns[-1]["speaker"] == segment["speaker"]:
+            turns[-1]["end"] = segment["end"]
+            turns[-1]["text"] += " " + segment["text"]
+        else:
+            turns.append(dict(segment))
+    return "\n".join(
+        f"{turn['speaker']} [{format_timestamp(turn['start'])} - {format_timestamp(turn['end'])}]: {turn['text']}"
+        for turn in turns
+    )
@@ -0,0 +1,150 @@
+import asyncio
+import time
+import numpy as np
+from app.config import EMBEDDING_BATCH_WINDOW_MS, EMBEDDING_MAX_BATCH_SIZE, get_embedding_model
+from app.utils.metrics import Histogram, registry, timed
+
+batch_size_histogram = registry.register(Histogram(
+    "vitalgenie_embedding_batch_size", "Sentences encoded per embedding micro-batch.",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256)))
+
+
+class EmbeddingService:
+    """
+    Process-wide sentence embedding service.
+
+    The SentenceTransformer model is loaded once (by `model_loader`) and shared. Concurrent
+    `encode` calls are gathered into micro-batches (up to `max_batch_size` sentences or
+    `batch_window_ms` of waiting) and each batch is encoded in a worker thread so the
+    event loop stays free.
+    """
+
+    def __init__(self, model_loader=get_embedding_model,
+                 batch_window_ms: float = EMBEDDING_BATCH_WINDOW_MS,
+                 max_batch_size: int = EMBEDDING_MAX_BATCH_SIZE):
+        self.model_loader = model_loader
+        self.batch_window_ms = batch_window_ms
+        self.max_batch_size = max_batch_size
+        self._queue = None
+        self._queue_loop = None
+        self._worker = None
+        self._stats = {
+            "batches": 0,
+            "requests": 0,
+            "sentences": 0,
+            "last_batch_size": 0,
+            "max_batch_size_seen": 0,
+            "encode_seconds_total": 0.0,
+            "wait_seconds_total": 0.0,
+        }
+
+    # ------------------------------
+    # Model handling
+    # ------------------------------
+    def get_model(self):
+        return self.model_loader()
+
+    def encode_sync(self, sentences: list) -> np.ndarray:
+        """
+        Encodes sentences in the calling thread. Use from worker threads/processes only.
+        """
+        if not sentences:
+            return np.zeros((0, 0), dtype="float32")
+        embeddings = self.get_model().encode(sentences, batch_size=self.max_batch_size)
+        return np.asarray(embeddings, dtype="float32")
+
+    # ------------------------------
+    # Micro-batching
+    # ------------------------------
+    def set_batch_window(self, batch_window_ms: float = None, max_batch_size: int = None):
+        if batch_window_ms is not None:
+            self.batch_window_ms = max(0.0, float(batch_window_ms))
+        if max_batch_size is not None:
+            self.max_batch_size = max(1, int(max_batch_size))
+
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        if self._queue is None or self._queue_loop is not loop or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._queue_loop = loop
+            self._worker = loop.create_task(self._batch_worker())
+        return self._queue
+
+    async def encode(self, sentences) -> np.ndarray:
+        """
+        Encodes a sentence or list of sentences, sharing a forward pass with other
+        concurrent callers. Returns a float32 array of shape (len(sentences), dim).
+        """
+        single = isinstance(sentences, str)
+        if single:
+            sentences = [sentences]
+        sentences = list(sentences)
+        if not sentences:
+            return np.zeros((0, 0), dtype="float32")
+        queue = self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        with timed("embedding"):
+            await queue.put((sentences, future, time.perf_counter()))
+            embeddings = await future
+        return embeddings[0] if single else embeddings
+
+    async def _batch_worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            pending = [await self._queue.get()]
+            count = len(pending[0][0])
+            deadline = loop.time() + self.batch_window_ms / 1000.0
+            while count < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                pending.append(item)
+                count += len(item[0])
+            await self._run_batch(pending)
+
+    async def _run_batch(self, pending):
+        batch = [sentence for sentences, _, _ in pending for sentence in sentences]
+        started = time.perf_counter()
+        try:
+            embeddings = await asyncio.get_running_loop().run_in_executor(None, self.encode_sync, batch)
+        except Exception as e:
+            print(f"Embedding batch error: {e}")
+            for _, future, _ in pending:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finished = time.perf_counter()
+
+        stats = self._stats
+        stats["batches"] += 1
+        stats["requests"] += len(pending)
+        stats["sentences"] += len(batch)
+        stats["last_batch_size"] = len(batch)
+        stats["max_batch_size_seen"] = max(stats["max_batch_size_seen"], len(batch))
+        batch_size_histogram.observe(len(batch))
+        stats["encode_seconds_total"] += finished - started
+        stats["wait_seconds_total"] += sum(started - queued_at for _, _, queued_at in pending)
+
+        offset = 0
+        for sentences, future, _ in pending:
+            if not future.done():
+                future.set_result(embeddings[offset:offset + len(sentences)])
+            offset += len(sentences)
+
+    def get_stats(self) -> dict:
+        stats = dict(self._stats)
+        batches = stats["batches"] or 1
+        stats["avg_batch_size"] = stats["sentences"] / batches
+        stats["avg_encode_ms"] = 1000.0 * stats["encode_seconds_total"] / batches
+        stats["avg_wait_ms"] = 1000.0 * stats["wait_seconds_total"] / (stats["requests"] or 1)
+        stats["batch_window_ms"] = self.batch_window_ms
+        stats["max_batch_size"] = self.max_batch_size
+        return stats
+
+
+# Shared instance used by every router
+embedding_service = EmbeddingService()
@@ -1,16 +1,144 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
 import numpy as np
 import faiss
+from app.config import FAISS_CACHE_DIR, FAISS_CACHE_MAX_ENTRIES, FAISS_CACHE_MAX_DISK_ENTRIES
+from app.utils.embedding_utils import embedding_service
 
-def build_faiss_index_from_summary(summary: str):
-    from sentence_transformers import SentenceTransformer
-    embedding_model = SentenceTransformer('all-mpnet-base-v2')
+async def build_faiss_index_from_summary(summary: str):
     sentences = [s.strip() for s in summary.split('.') if s.strip()]
     if not sentences:
         return None, {}
-    embeddings = embedding_model.encode(sentences)
+    embeddings = await embedding_service.encode(sentences)
     embeddings = np.array(embeddings).astype("float32")
     dimension = embeddings.shape[1]
     index = faiss.IndexFlatL2(dimension)
     index.add(embeddings)
     mapping = {i: sentence for i, sentence in enumerate(sentences)}
     return index, mapping
+
+
+def summary_cache_key(summary: str) -> str:
+    """
+    Content-addressed key for a summary: identical text always maps to the same index.
+    """
+    return hashlib.sha256(summary.encode("utf-8")).hexdigest()
+
+
+class FaissIndexCache:
+    """
+    Bounded in-memory LRU of (index, mapping) pairs backed by on-disk files.
+    Indexes are written once and read back with memory mapping, so a restart
+    only needs to map the file instead of re-embedding the summary. The directory
+    is created on the first write and holds at most `max_disk_entries` indexes;
+    the least recently used ones are deleted beyond that.
+    """
+
+    def __init__(self, cache_dir: str = FAISS_CACHE_DIR, max_entries: int = FAISS_CACHE_MAX_ENTRIES,
+                 max_disk_entries: int = FAISS_CACHE_MAX_DISK_ENTRIES):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._build_locks = {}
+
+    def _paths(self, key: str):
+        base = os.path.join(self.cache_dir, key)
+        return base + ".index", base + ".json"
+
+    def _remember(self, key: str, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+        index_path, mapping_path = self._paths(key)
+        if not (os.path.exists(index_path) and os.path.exists(mapping_path)):
+            return None
+        try:
+            index = faiss.read_index(index_path, faiss.IO_FLAG_MMAP)
+            with open(mapping_path, "r", encoding="utf-8") as f:
+                mapping = {int(i): sentence for i, sentence in json.load(f).items()}
+            # Pruning goes by modification time, so a disk hit counts as a use
+            os.utime(index_path)
+        except Exception as e:
+            print(f"Error loading cached FAISS index {key}: {e}")
+            return None
+        entry = (index, mapping)
+        self._remember(key, entry)
+        return entry
+
+    def put(self, key: str, index, mapping: dict):
+        index_path, mapping_path = self._paths(key)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # Write to temp files and rename so readers never see a partial index
+            faiss.write_index(index, index_path + ".tmp")
+            with open(mapping_path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump({str(i): sentence for i, sentence in mapping.items()}, f)
+            os.replace(mapping_path + ".tmp", mapping_path)
+            os.replace(index_path + ".tmp", index_path)
+            self._prune()
+        except Exception as e:
+            print(f"Error persisting FAISS index {key}: {e}")
+        self._remember(key, (index, mapping))
+
+    def _prune(self):
+        indexes = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".index"):
+                path = os.path.join(self.cache_dir, name)
+                try:
+                    indexes.append((os.path.getmtime(path), path))
+                except OSError:
+                    continue
+        if len(indexes) <= self.max_disk_entries:
+            return
+        indexes.sort()
+        for _, path in indexes[:len(indexes) - self.max_disk_entries]:
+            for stale in (path, path[:-len(".index")] + ".json"):
+                try:
+                    os.remove(stale)
+                except OSError:
+                    pass
+
+    async def get_or_build(self, summary: str):
+        """
+        Returns (index, mapping) for a summary, building and persisting it on a miss.
+        Concurrent misses for the same summary share a single build.
+        """
+        key = summary_cache_key(summary)
+        loop = asyncio.get_running_loop()
+        entry = await loop.run_in_executor(None, self.get, key)
+        if entry is not None:
+            return entry
+        lock = self._build_locks.setdefault(key, asyncio.Lock())
+        try:
+            async with lock:
+                entry = await loop.run_in_executor(None, self.get, key)
+                if entry is not None:
+                    return entry
+                index, mapping = await build_faiss_index_from_summary(summary)
+                if index is None:
+                    return None, {}
+                await loop.run_in_executor(None, self.put, key, index, mapping)
+                return index, mapping
+        finally:
+            if not lock.locked():
+                self._build_locks.pop(key, None)
+
+
+# Shared cache of per-summary indexes
+summary_index_cache = FaissIndexCache()
@@ -0,0 +1,139 @@
+"""
+Minimal in-process stand-in for the Firestore client, covering the calls this app
+makes: collection().document().set()/get(), order_by().limit().stream(), batch()
+and on_snapshot(). Used to run the data-access layer and benchmarks offline.
+For full fidelity, point the real client at the Firestore emulator instead
+(set FIRESTORE_EMULATOR_HOST).
+"""
+import copy
+import threading
+import uuid
+
+
+class FakeDocumentSnapshot:
+    def __init__(self, doc_id: str, data):
+        self.id = doc_id
+        self._data = data
+
+    @property
+    def exists(self) -> bool:
+        return self._data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data)
+
+
+class FakeDocumentReference:
+    def __init__(self, client, collection: str, doc_id: str):
+        self._client = client
+        self.collection_name = collection
+        self.id = doc_id
+
+    def set(self, data: dict):
+        self._client._write(self.collection_name, self.id, data)
+
+    def get(self):
+        return FakeDocumentSnapshot(self.id, self._client._read(self.collection_name, self.id))
+
+
+class FakeQuery:
+    def __init__(self, client, collection: str, order_field=None, descending=False, limit_count=None):
+        self._client = client
+        self._collection = collection
+        self._order_field = order_field
+        self._descending = descending
+        self._limit = limit_count
+
+    def order_by(self, field: str, direction: str = "ASCENDING"):
+        return FakeQuery(self._client, self._collection, field, direction == "DESCENDING", self._limit)
+
+    def limit(self, count: int):
+        return FakeQuery(self._client, self._collection, self._order_field, self._descending, count)
+
+    def stream(self):
+        docs = self._client._snapshot(self._collection)
+        if self._order_field is not None:
+            docs = [d for d in docs if self._order_field in d[1]]
+            docs.sort(key=lambda d: d[1][self._order_field], reverse=self._descending)
+        if self._limit is not None:
+            docs = docs[:self._limit]
+        return iter([FakeDocumentSnapshot(doc_id, data) for doc_id, data in docs])
+
+    def on_snapshot(self, callback):
+        return self._client._watch(self, callback)
+
+
+class FakeCollectionReference(FakeQuery):
+    def __init__(self, client, collection: str):
+        super().__init__(client, collection)
+
+    def document(self, doc_id: str = None):
+        return FakeDocumentReference(self._client, self._collection, doc_id or uuid.uuid4().hex[:20])
+
+
+class FakeWriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._writes = []
+
+    def set(self, ref: FakeDocumentReference, data: dict):
+        self._writes.append((ref, data))
+
+    def commit(self):
+        for ref, data in self._writes:
+            ref.set(data)
+        self._client.batch_commits += 1
+        self._writes = []
+
+
+class FakeWatch:
+    def __init__(self, client, query, callback):
+        self._client = client
+        self.query = query
+        self.callback = callback
+
+    def unsubscribe(self):
+        self._client._unwatch(self)
+
+
+class FakeFirestore:
+    def __init__(self):
+        self._collections = {}
+        self._lock = threading.Lock()
+        self._watches = []
+        self.writes = 0
+        self.batch_commits = 0
+
+    def collection(self, name: str) -> FakeCollectionReference:
+        return FakeCollectionReference(self, name)
+
+    def batch(self) -> FakeWriteBatch:
+        return FakeWriteBatch(self)
+
+    def _write(self, collection: str, doc_id: str, data: dict):
+        with self._lock:
+            self._collections.setdefault(collection, {})[doc_id] = copy.deepcopy(data)
+            self.writes += 1
+            watches = [w for w in self._watches if w.query._collection == collection]
+        for watch in watches:
+            watch.callback(list(watch.query.stream()), [], None)
+
+    def _read(self, collection: str, doc_id: str):
+        with self._lock:
+            return copy.deepcopy(self._collections.get(collection, {}).get(doc_id))
+
+    def _snapshot(self, collection: str) -> list:
+        with self._lock:
+            return [(doc_id, copy.deepcopy(data)) for doc_id, data in self._collections.get(collection, {}).items()]
+
+    def _watch(self, query, callback) -> FakeWatch:
+        watch = FakeWatch(self, query, callback)
+        with self._lock:
+            self._watches.append(watch)
+        callback(list(query.stream()), [], None)
+        return watch
+
+    def _unwatch(self, watch: FakeWatch):
+        with self._lock:
+            if watch in self._watches:
+                self._watches.remove(watch)
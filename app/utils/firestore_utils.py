@@ -0,0 +1,288 @@
+import asyncio
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from app.config import (
+    get_db,
+    FIRESTORE_WRITE_QUEUE_SIZE,
+    FIRESTORE_WRITE_BATCH_SIZE,
+    FIRESTORE_WRITE_FLUSH_S,
+    FIRESTORE_WRITE_RETRY_BASE_S,
+    FIRESTORE_WRITE_RETRY_MAX_S,
+    FIRESTORE_OVERFLOW_WORKERS,
+)
+from app.utils.metrics import timed
+
+SUMMARIES_COLLECTION = "transcription_summaries"
+
+
+def to_epoch(value):
+    """
+    Firestore timestamps, datetimes (naive ones are UTC, as written by /transcribe),
+    ISO strings and numbers to epoch seconds; None stays None.
+    """
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.timestamp()
+    raise TypeError(f"Unsupported timestamp: {value!r}")
+
+
+class SummaryStore:
+    """
+    In-memory copy of the latest document in `transcription_summaries`.
+
+    The first read queries Firestore; afterwards the copy is kept current by
+    `note_written` (write-through from /transcribe) and, when started, an
+    `on_snapshot` listener that catches writes made by other processes.
+    """
+
+    def __init__(self, db=None, collection: str = SUMMARIES_COLLECTION):
+        self._db = db
+        self.collection = collection
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._doc_id = None
+        self._data = None
+        self._watch = None
+        self._stats = {"hits": 0, "queries": 0, "write_through": 0, "listener_updates": 0}
+
+    @property
+    def db(self):
+        return self._db if self._db is not None else get_db()
+
+    def _latest_query(self):
+        return self.db.collection(self.collection).order_by("timestamp", direction="DESCENDING").limit(1)
+
+    def _set(self, doc_id, data):
+        with self._lock:
+            # Write-through copies carry naive UTC datetimes, listener snapshots aware ones
+            current = to_epoch(self._data.get("timestamp")) if self._data else None
+            incoming = to_epoch(data.get("timestamp")) if data else None
+            if current is not None and incoming is not None and incoming < current:
+                return False
+            self._doc_id, self._data, self._loaded = doc_id, data, True
+            return True
+
+    def latest(self):
+        """
+        Returns (doc_id, document dict) for the newest summary, or (None, None).
+        Blocking on a cache miss; use `latest_async` from handlers.
+        """
+        with self._lock:
+            if self._loaded:
+                self._stats["hits"] += 1
+                return self._doc_id, self._data
+        self._stats["queries"] += 1
+        doc_id, data = None, None
+        with timed("firestore_read"):
+            for doc in self._latest_query().stream():
+                doc_id, data = doc.id, doc.to_dict()
+        with self._lock:
+            if not self._loaded:
+                self._doc_id, self._data, self._loaded = doc_id, data, data is not None
+            return self._doc_id, self._data
+
+    async def latest_async(self):
+        with self._lock:
+            if self._loaded:
+                self._stats["hits"] += 1
+                return self._doc_id, self._data
+        return await asyncio.to_thread(self.latest)
+
+    def note_written(self, doc_id: str, data: dict):
+        if self._set(doc_id, data):
+            self._stats["write_through"] += 1
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded = False
+            self._doc_id, self._data = None, None
+
+    def start_listener(self):
+        if self._watch is not None:
+            return
+        query = self._latest_query()
+        if not hasattr(query, "on_snapshot"):
+            return
+
+        def on_snapshot(docs, changes, read_time):
+            for doc in docs:
+                if self._set(doc.id, doc.to_dict()):
+                    self._stats["listener_updates"] += 1
+
+        try:
+            self._watch = query.on_snapshot(on_snapshot)
+            print("🔹 Listening for new transcription summaries.")
+        except Exception as e:
+            print(f"Could not start summary listener: {e}")
+
+    def stop_listener(self):
+        if self._watch is not None:
+            self._watch.unsubscribe()
+            self._watch = None
+
+    def get_stats(self) -> dict:
+        return dict(self._stats)
+
+
+class BatchedWriter:
+    """
+    Coalesces document writes into batch commits on a background thread.
+
+    `add` generates the document id locally, queues the write and returns
+    immediately; the Firestore client is only touched on the writer threads, so
+    `add` never waits for it to initialise. When the bounded queue is full the
+    write is handed to a small overflow pool instead, so nothing is dropped under
+    load and callers on the event loop never block on the network. A batch that fails to
+    commit is retried with capped exponential backoff until it succeeds; writes
+    are only given up (and logged with their ids) when the writer is stopping.
+    """
+
+    def __init__(self, db=None, max_queue: int = FIRESTORE_WRITE_QUEUE_SIZE,
+                 batch_size: int = FIRESTORE_WRITE_BATCH_SIZE, flush_s: float = FIRESTORE_WRITE_FLUSH_S,
+                 retry_base_s: float = FIRESTORE_WRITE_RETRY_BASE_S, retry_max_s: float = FIRESTORE_WRITE_RETRY_MAX_S,
+                 overflow_workers: int = FIRESTORE_OVERFLOW_WORKERS):
+        self._db = db
+        self.batch_size = min(batch_size, 500)
+        self.flush_s = flush_s
+        self.retry_base_s = retry_base_s
+        self.retry_max_s = retry_max_s
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._overflow = ThreadPoolExecutor(max_workers=overflow_workers, thread_name_prefix="firestore-overflow")
+        self._overflow_pending = set()
+        self._overflow_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {"queued": 0, "direct_writes": 0, "batches": 0, "written": 0, "retries": 0, "failed": 0}
+
+    @property
+    def db(self):
+        return self._db if self._db is not None else get_db()
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="firestore-writer", daemon=True)
+                    self._thread.start()
+
+    def _count(self, stat: str, amount: int = 1):
+        with self._stats_lock:
+            self._stats[stat] += amount
+
+    def _ref(self, collection: str, doc_id: str):
+        return self.db.collection(collection).document(doc_id)
+
+    def add(self, collection: str, data: dict) -> str:
+        # Same shape as Firestore's auto ids (20 characters), without touching the client here
+        doc_id = uuid.uuid4().hex[:20]
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((collection, doc_id, data))
+            self._count("queued")
+        except queue.Full:
+            print(f"⚠️ Firestore write queue full; writing {collection}/{doc_id} directly.")
+            future = self._overflow.submit(self._direct_write, collection, doc_id, data)
+            with self._overflow_lock:
+                self._overflow_pending.add(future)
+            future.add_done_callback(self._overflow_done)
+        return doc_id
+
+    def _overflow_done(self, future):
+        with self._overflow_lock:
+            self._overflow_pending.discard(future)
+
+    def _direct_write(self, collection: str, doc_id: str, data: dict):
+        try:
+            with timed("firestore_write"):
+                self._ref(collection, doc_id).set(data)
+            self._count("direct_writes")
+        except Exception as e:
+            self._count("failed")
+            print(f"❌ Firestore write to {collection}/{doc_id} failed and was dropped: {e}")
+
+    def _run(self):
+        while not (self._stopping.is_set() and self._queue.empty()):
+            try:
+                pending = [self._queue.get(timeout=0.5)]
+            except queue.Empty:
+                continue
+            deadline = time.monotonic() + self.flush_s
+            while len(pending) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    pending.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._commit(pending)
+            for _ in pending:
+                self._queue.task_done()
+
+    def _commit(self, pending: list):
+        attempt = 0
+        while True:
+            try:
+                batch = self.db.batch()
+                for collection, doc_id, data in pending:
+                    batch.set(self._ref(collection, doc_id), data)
+                with timed("firestore_write"):
+                    batch.commit()
+                with self._stats_lock:
+                    self._stats["batches"] += 1
+                    self._stats["written"] += len(pending)
+                return
+            except Exception as e:
+                if self._stopping.is_set():
+                    self._count("failed", len(pending))
+                    print(f"❌ Dropping {len(pending)} Firestore writes after a failed commit on shutdown "
+                          f"({e}): {', '.join(f'{collection}/{doc_id}' for collection, doc_id, _ in pending)}")
+                    return
+                delay = min(self.retry_max_s, self.retry_base_s * (2 ** attempt))
+                attempt += 1
+                self._count("retries")
+                print(f"Error committing Firestore batch of {len(pending)} (attempt {attempt}), "
+                      f"retrying in {delay:.1f}s: {e}")
+                # Woken early by stop(), which then gets one last attempt
+                self._stopping.wait(delay)
+
+    def flush(self, timeout: float = 10.0):
+        """
+        Blocks until every queued write has been committed (or `timeout` passes).
+        """
+        deadline = time.monotonic() + timeout
+        while (self._queue.unfinished_tasks or self._overflow_pending) and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+    def stop(self, timeout: float = 10.0):
+        self.flush(timeout)
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout=max(1.0, self.flush_s * 2))
+        self._overflow.shutdown(wait=False)
+
+    def get_stats(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["queue_depth"] = self._queue.qsize()
+        with self._overflow_lock:
+            stats["overflow_pending"] = len(self._overflow_pending)
+        return stats
+
+
+# Shared instances using the lazily-initialized client from app.config
+summary_store = SummaryStore()
+firestore_writer = BatchedWriter()
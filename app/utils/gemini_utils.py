@@ -1,17 +1,295 @@
+import asyncio
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
-from app.config import model
+from app.config import (
+    get_gemini_model,
+    GEMINI_MODEL_NAME,
+    GEMINI_MAX_CONCURRENCY,
+    GEMINI_TIMEOUT_S,
+    GEMINI_MAX_RETRIES,
+    GEMINI_RETRY_BASE_DELAY_S,
+    GEMINI_HEDGE_DELAY_S,
+    GEMINI_CACHE_ENABLED,
+)
+from app.utils.cache_utils import ResponseCache, response_cache_key
+from app.utils.image_utils import PreparedImage
+from app.utils.metrics import timed
+
+try:
+    from google.api_core import exceptions as google_exceptions
+    TRANSIENT_ERRORS = (
+        google_exceptions.TooManyRequests,
+        google_exceptions.ResourceExhausted,
+        google_exceptions.ServiceUnavailable,
+        google_exceptions.InternalServerError,
+        google_exceptions.DeadlineExceeded,
+    )
+except ImportError:
+    TRANSIENT_ERRORS = ()
+TRANSIENT_ERRORS = TRANSIENT_ERRORS + (asyncio.TimeoutError, TimeoutError, ConnectionError)
+
+ERROR_RESPONSE = "Error processing your request."
+
+def build_contents(prompt: str, image=None):
+    """
+    Request contents for a prompt and optional image. Preprocessed images are sent as
+    their bounded JPEG bytes; plain PIL images are left for the SDK to encode.
+    """
+    if not image:
+        return prompt
+    return [prompt, image.to_part() if isinstance(image, PreparedImage) else image]
 
 def gemini_inference(prompt: str, image: Image = None) -> str:
     """
     Calls the Gemini model with a text prompt and optional image input.
+    Blocking; inside async handlers use `gemini_inference_async` instead.
     """
     try:
-        if image:
-            response = model.generate_content([prompt, image], stream=False)
-        else:
-            response = model.generate_content(prompt, stream=False)
+        model = get_gemini_model()
+        response = model.generate_content(build_contents(prompt, image), stream=False)
         response.resolve()
         return response.text
     except Exception as e:
         print(f"Gemini inference error: {e}")
-        return "Error processing your request."
+        return ERROR_RESPONSE
+
+
+class GeminiClient:
+    """
+    Async wrapper around a Gemini `GenerativeModel` (or any object with a compatible
+    `generate_content`, such as a local fake; None means the shared lazily-loaded model). Blocking SDK calls run on a bounded
+    thread pool; a semaphore caps in-flight calls, each attempt has a deadline, and
+    transient failures are retried with full-jitter exponential backoff. When
+    `hedge_delay` is set, a backup request is fired if the first one is still
+    pending after that many seconds and whichever finishes first wins. Successful
+    responses are stored in `cache` (if given) keyed by model name, prompt and image pixels.
+    `stream` yields text chunks as the model produces them instead.
+    """
+
+    def __init__(self, model=None, cache: ResponseCache = None, max_concurrency: int = GEMINI_MAX_CONCURRENCY,
+                 timeout: float = GEMINI_TIMEOUT_S, max_retries: int = GEMINI_MAX_RETRIES,
+                 retry_base_delay: float = GEMINI_RETRY_BASE_DELAY_S,
+                 hedge_delay: float = GEMINI_HEDGE_DELAY_S, model_name: str = None):
+        self.model = model
+        self.model_name = model_name or getattr(model, "model_name", None) or GEMINI_MODEL_NAME
+        self.cache = cache
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.hedge_delay = hedge_delay
+        # Timed-out attempts keep their thread until the SDK returns, so leave headroom
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency * 2, thread_name_prefix="gemini")
+        self._semaphore = None
+        self._semaphore_loop = None
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphore_loop = loop
+        return self._semaphore
+
+    def _get_model(self):
+        return self.model if self.model is not None else get_gemini_model()
+
+    def _generate(self, prompt: str, image: Image = None) -> str:
+        response = self._get_model().generate_content(build_contents(prompt, image), stream=False)
+        response.resolve()
+        return response.text
+
+    async def _attempt(self, prompt: str, image: Image, timeout: float) -> str:
+        async with self._get_semaphore():
+            loop = asyncio.get_running_loop()
+            call = loop.run_in_executor(self._executor, self._generate, prompt, image)
+            return await asyncio.wait_for(call, timeout)
+
+    async def _hedged_attempt(self, prompt: str, image: Image, timeout: float, hedge_delay: float) -> str:
+        primary = asyncio.ensure_future(self._attempt(prompt, image, timeout))
+        if not hedge_delay:
+            return await primary
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=hedge_delay)
+        except asyncio.CancelledError:
+            # asyncio.wait does not cancel what it waits on; don't leave the call holding a semaphore slot
+            primary.cancel()
+            raise
+        if done:
+            return primary.result()
+        pending = {primary, asyncio.ensure_future(self._attempt(prompt, image, timeout))}
+        last_error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    last_error = task.exception()
+            raise last_error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    @staticmethod
+    def is_transient(error: Exception) -> bool:
+        return isinstance(error, TRANSIENT_ERRORS)
+
+    async def generate(self, prompt: str, image: Image = None, timeout: float = None,
+                       hedge_delay: float = None) -> str:
+        """
+        Returns the model's text. Raises the last error once retries are exhausted.
+        """
+        timeout = timeout or self.timeout
+        hedge_delay = self.hedge_delay if hedge_delay is None else hedge_delay
+        attempt = 0
+        with timed("gemini"):
+            while True:
+                try:
+                    return await self._hedged_attempt(prompt, image, timeout, hedge_delay)
+                except Exception as e:
+                    if not self.is_transient(e) or attempt >= self.max_retries:
+                        raise
+                    delay = random.uniform(0, self.retry_base_delay * (2 ** attempt))
+                    print(f"Gemini transient error ({type(e).__name__}), retrying in {delay:.2f}s")
+                    attempt += 1
+                    await asyncio.sleep(delay)
+
+    def _cache_lookup(self, prompt: str, image: Image):
+        key = response_cache_key(prompt, image, self.model_name)
+        return key, self.cache.get(key)
+
+    async def infer(self, prompt: str, image: Image = None, use_cache: bool = True, **kwargs) -> str:
+        """
+        Same contract as `gemini_inference`: returns a fixed error string instead of raising.
+        Pass `use_cache=False` for calls whose answer must always be fresh (e.g. live camera frames).
+        """
+        loop = asyncio.get_running_loop()
+        key = None
+        if use_cache and self.cache is not None:
+            # Hashing pixels and SQLite reads stay off the event loop
+            key, cached = await loop.run_in_executor(None, self._cache_lookup, prompt, image)
+            if cached is not None:
+                return cached
+        try:
+            text = await self.generate(prompt, image=image, **kwargs)
+        except Exception as e:
+            print(f"Gemini inference error: {type(e).__name__}: {e}")
+            return ERROR_RESPONSE
+        if key is not None:
+            await loop.run_in_executor(None, self.cache.put, key, text)
+        return text
+
+    @staticmethod
+    def _notify(loop, queue: asyncio.Queue, item):
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, item)
+        except RuntimeError:
+            # Event loop already closed; nobody is listening anymore
+            pass
+
+    @staticmethod
+    def _release_once(semaphore: asyncio.Semaphore):
+        # Called from whichever finishes first, the stream worker or its consumer; always on the event loop
+        released = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                semaphore.release()
+
+        return release
+
+    def _stream_worker(self, prompt: str, image: Image, loop, queue: asyncio.Queue, cancelled: threading.Event,
+                       release):
+        try:
+            response = self._get_model().generate_content(build_contents(prompt, image), stream=True)
+            for chunk in response:
+                if cancelled.is_set():
+                    return
+                text = chunk.text
+                if text:
+                    self._notify(loop, queue, ("chunk", text))
+            self._notify(loop, queue, ("end", None))
+        except Exception as e:
+            self._notify(loop, queue, ("error", e))
+        finally:
+            # The model is done; a slow consumer draining the queue should not hold a concurrency slot
+            try:
+                loop.call_soon_threadsafe(release)
+            except RuntimeError:
+                pass
+
+    async def stream(self, prompt: str, image: Image = None, use_cache: bool = True, timeout: float = None):
+        """
+        Async generator of text chunks, forwarded as soon as the SDK yields them.
+        `timeout` bounds the wait for each chunk. Transient failures before the first
+        chunk are retried like `generate`; once text has been yielded errors are raised.
+        A cached answer is yielded as a single chunk; complete answers are cached.
+        A concurrency slot is held only while the model is producing (or until the
+        consumer gives up), not while a slow consumer drains the buffered tail.
+        """
+        loop = asyncio.get_running_loop()
+        key = None
+        if use_cache and self.cache is not None:
+            key, cached = await loop.run_in_executor(None, self._cache_lookup, prompt, image)
+            if cached is not None:
+                yield cached
+                return
+        timeout = timeout or self.timeout
+        parts = []
+        attempt = 0
+        semaphore = self._get_semaphore()
+        with timed("gemini_stream"):
+            while True:
+                await semaphore.acquire()
+                release = self._release_once(semaphore)
+                queue = asyncio.Queue()
+                cancelled = threading.Event()
+                try:
+                    loop.run_in_executor(self._executor, self._stream_worker, prompt, image, loop, queue, cancelled,
+                                         release)
+                    while True:
+                        kind, value = await asyncio.wait_for(queue.get(), timeout)
+                        if kind == "end":
+                            break
+                        if kind == "error":
+                            raise value
+                        parts.append(value)
+                        yield value
+                    break
+                except Exception as e:
+                    if parts or not self.is_transient(e) or attempt >= self.max_retries:
+                        raise
+                    release()
+                    delay = random.uniform(0, self.retry_base_delay * (2 ** attempt))
+                    print(f"Gemini transient error ({type(e).__name__}), retrying stream in {delay:.2f}s")
+                    attempt += 1
+                    await asyncio.sleep(delay)
+                finally:
+                    # Stops the worker thread early if the consumer went away
+                    cancelled.set()
+                    release()
+        if key is not None and parts:
+            await loop.run_in_executor(None, self.cache.put, key, "".join(parts))
+
+
+# Shared client used by the routers
+response_cache = ResponseCache() if GEMINI_CACHE_ENABLED else None
+gemini_client = GeminiClient(cache=response_cache)
+
+async def gemini_inference_async(prompt: str, image: Image = None, use_cache: bool = True, **kwargs) -> str:
+    """
+    Non-blocking counterpart of `gemini_inference` for use inside async handlers.
+    """
+    return await gemini_client.infer(prompt, image=image, use_cache=use_cache, **kwargs)
+
+
+def gemini_inference_stream(prompt: str, image: Image = None, use_cache: bool = True, **kwargs):
+    """
+    Streaming counterpart of `gemini_inference_async`: an async generator of text chunks.
+    Raises on failure so callers can tell the client the answer was cut short.
+    """
+    return gemini_client.stream(prompt, image=image, use_cache=use_cache, **kwargs)
@@ -1,7 +1,18 @@
 import torch
 
+def gpu_memory() -> list:
+    """
+    Allocated and reserved bytes for each visible CUDA device; empty without CUDA.
+    """
+    if not torch.cuda.is_available():
+        return []
+    return [
+        {"device": device, "allocated": torch.cuda.memory_allocated(device), "reserved": torch.cuda.memory_reserved(device)}
+        for device in range(torch.cuda.device_count())
+    ]
+
 def check_gpu_usage(stage: str):
-    if torch.cuda.is_available():
-        allocated = torch.cuda.memory_allocated() / 1024**2  # MB
-        reserved = torch.cuda.memory_reserved() / 1024**2    # MB
-        print(f"🔹 [{stage}] GPU Memory - Allocated: {allocated:.2f} MB, Reserved: {reserved:.2f} MB")
+    for memory in gpu_memory():
+        allocated = memory["allocated"] / 1024**2  # MB
+        reserved = memory["reserved"] / 1024**2    # MB
+        print(f"🔹 [{stage}] GPU {memory['device']} Memory - Allocated: {allocated:.2f} MB, Reserved: {reserved:.2f} MB")
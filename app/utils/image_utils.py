@@ -0,0 +1,188 @@
+import asyncio
+import io
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageOps
+from app.config import (
+    IMAGE_MAX_EDGE,
+    IMAGE_JPEG_QUALITY,
+    IMAGE_MAX_PIXELS,
+    IMAGE_MAX_UPLOAD_BYTES,
+    IMAGE_PREPROCESS_WORKERS,
+    UPLOAD_CHUNK_BYTES,
+)
+from app.utils.metrics import timed
+
+
+class ImageDecodeError(Exception):
+    """Raised when an upload is not a decodable image."""
+
+
+class ImageTooLargeError(Exception):
+    """Raised when an image exceeds the byte or pixel limits."""
+
+
+class PreparedImage:
+    """
+    A vision input after preprocessing: the bounded RGB image (for local checks and
+    cache keys) and the JPEG bytes that are actually sent to Gemini.
+    """
+
+    mime_type = "image/jpeg"
+
+    def __init__(self, image: Image.Image, data: bytes, info: dict):
+        self.image = image
+        self.data = data
+        self.info = info
+
+    def to_part(self) -> dict:
+        # Passed as a blob so the SDK does not re-encode the pixels as lossless WebP
+        return {"mime_type": self.mime_type, "data": self.data}
+
+
+async def read_image_upload(upload, max_bytes: int = IMAGE_MAX_UPLOAD_BYTES,
+                            chunk_bytes: int = UPLOAD_CHUNK_BYTES) -> bytes:
+    """
+    Reads an UploadFile into memory, giving up as soon as it passes `max_bytes`.
+    """
+    data = bytearray()
+    while True:
+        chunk = await upload.read(chunk_bytes)
+        if not chunk:
+            return bytes(data)
+        data.extend(chunk)
+        if len(data) > max_bytes:
+            raise ImageTooLargeError(f"Image exceeds {max_bytes // (1024 * 1024)} MB.")
+
+
+class ImagePreprocessor:
+    """
+    Shared decode/resize/re-encode stage for every vision input, run on a small
+    thread pool. The header is checked against `max_pixels` before any pixel is
+    decoded; JPEGs are decoded in draft mode (DCT scaling straight to 1/2, 1/4 or
+    1/8 size), the result is downscaled to `max_edge` and re-encoded as JPEG at
+    `quality`.
+    """
+
+    def __init__(self, max_edge: int = IMAGE_MAX_EDGE, quality: int = IMAGE_JPEG_QUALITY,
+                 max_pixels: int = IMAGE_MAX_PIXELS, workers: int = IMAGE_PREPROCESS_WORKERS):
+        self.max_edge = max_edge
+        self.quality = quality
+        self.max_pixels = max_pixels
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="image")
+        self._lock = threading.Lock()
+        self._stats = {
+            "images": 0,
+            "rejected_too_large": 0,
+            "rejected_undecodable": 0,
+            "draft_decodes": 0,
+            "bytes_in_total": 0,
+            "bytes_out_total": 0,
+            "decode_seconds_total": 0.0,
+            "total_seconds_total": 0.0,
+            "decoded_bytes_total": 0,
+            "max_decoded_bytes": 0,
+            "native_decoded_bytes_total": 0,
+            "last": None,
+        }
+
+    def _reject(self, stat: str, error: Exception):
+        with self._lock:
+            self._stats[stat] += 1
+        raise error
+
+    def process(self, data: bytes) -> PreparedImage:
+        """
+        Blocking; use `prepare` from async code.
+        """
+        started = time.perf_counter()
+        try:
+            image = Image.open(io.BytesIO(data))
+        except Image.DecompressionBombError as e:
+            self._reject("rejected_too_large", ImageTooLargeError(str(e)))
+        except Exception:
+            self._reject("rejected_undecodable", ImageDecodeError("Unrecognised image format."))
+
+        # Only the header has been read so far
+        width, height = image.size
+        if width * height > self.max_pixels:
+            self._reject("rejected_too_large", ImageTooLargeError(
+                f"Image is {width}x{height}; the limit is {self.max_pixels // 1_000_000} megapixels."))
+        scale = min(1.0, self.max_edge / max(width, height))
+        target = (max(1, int(width * scale)), max(1, int(height * scale)))
+        drafted = False
+        if image.format == "JPEG" and scale < 1.0:
+            drafted = image.draft("RGB", target) is not None
+
+        decode_started = time.perf_counter()
+        try:
+            image = ImageOps.exif_transpose(image).convert("RGB")
+        except Exception as e:
+            self._reject("rejected_undecodable", ImageDecodeError(f"Could not decode image: {e}"))
+        decode_seconds = time.perf_counter() - decode_started
+        decoded_bytes = image.width * image.height * 3
+
+        if max(image.size) > self.max_edge:
+            image.thumbnail((self.max_edge, self.max_edge), Image.LANCZOS)
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=self.quality)
+        encoded = buffer.getvalue()
+        total_seconds = time.perf_counter() - started
+
+        info = {
+            "bytes_in": len(data),
+            "bytes_out": len(encoded),
+            "source_size": [width, height],
+            "size": list(image.size),
+            "draft": drafted,
+            "decode_ms": 1000.0 * decode_seconds,
+            "total_ms": 1000.0 * total_seconds,
+            "decoded_bytes": decoded_bytes,
+            "native_decoded_bytes": width * height * 3,
+        }
+        with self._lock:
+            stats = self._stats
+            stats["images"] += 1
+            stats["draft_decodes"] += int(drafted)
+            stats["bytes_in_total"] += len(data)
+            stats["bytes_out_total"] += len(encoded)
+            stats["decode_seconds_total"] += decode_seconds
+            stats["total_seconds_total"] += total_seconds
+            stats["decoded_bytes_total"] += decoded_bytes
+            stats["max_decoded_bytes"] = max(stats["max_decoded_bytes"], decoded_bytes)
+            stats["native_decoded_bytes_total"] += width * height * 3
+            stats["last"] = info
+        return PreparedImage(image, encoded, info)
+
+    async def prepare(self, data: bytes) -> PreparedImage:
+        loop = asyncio.get_running_loop()
+        with timed("image_preprocess"):
+            return await loop.run_in_executor(self._executor, self.process, data)
+
+    async def run(self, fn, *args):
+        """
+        Runs other per-image work (e.g. the camera change gate) on the same bounded pool.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fn, *args)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        images = stats["images"] or 1
+        stats["avg_bytes_in"] = stats["bytes_in_total"] / images
+        stats["avg_bytes_out"] = stats["bytes_out_total"] / images
+        stats["avg_decode_ms"] = 1000.0 * stats["decode_seconds_total"] / images
+        stats["avg_total_ms"] = 1000.0 * stats["total_seconds_total"] / images
+        stats["avg_decoded_bytes"] = stats["decoded_bytes_total"] / images
+        stats["max_edge"] = self.max_edge
+        stats["quality"] = self.quality
+        return stats
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Shared instance used by the image routes and the camera monitor
+image_preprocessor = ImagePreprocessor()
@@ -0,0 +1,151 @@
+import asyncio
+import time
+import uuid
+from app.config import TRANSCRIBE_WORKERS, TRANSCRIBE_QUEUE_SIZE, TRANSCRIBE_JOB_TTL_S
+from app.utils.metrics import current_profile, record_stage, use_profile
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at capacity."""
+
+
+class Job:
+    def __init__(self, payload):
+        self.id = uuid.uuid4().hex
+        self.payload = payload
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.done = asyncio.Event()
+        # Stage timings of the job go to the submitting request's profile, if it asked for one
+        self.profile = current_profile()
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "result": self.result,
+            "error": self.error,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobQueue:
+    """
+    Bounded asyncio job queue drained by a fixed number of worker tasks.
+    `handler` is an async callable that receives the job payload and returns a
+    JSON-serialisable result. Submissions beyond `max_queue_size` waiting jobs
+    raise QueueFullError so callers can answer with HTTP 429.
+    """
+
+    def __init__(self, handler, workers: int = TRANSCRIBE_WORKERS,
+                 max_queue_size: int = TRANSCRIBE_QUEUE_SIZE, job_ttl_s: float = TRANSCRIBE_JOB_TTL_S):
+        self.handler = handler
+        self.workers = workers
+        self.max_queue_size = max_queue_size
+        self.job_ttl_s = job_ttl_s
+        self._jobs = {}
+        self._queue = None
+        self._tasks = []
+        self._running = 0
+        self._metrics = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "rejected": 0,
+            "processing_seconds_total": 0.0,
+            "processing_seconds_max": 0.0,
+            "queue_wait_seconds_total": 0.0,
+        }
+
+    def _ensure_started(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def _prune(self):
+        cutoff = time.time() - self.job_ttl_s
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished_at is not None and job.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def submit(self, payload) -> Job:
+        self._ensure_started()
+        self._prune()
+        job = Job(payload)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self._metrics["rejected"] += 1
+            raise QueueFullError(f"Queue is full ({self.max_queue_size} jobs waiting).")
+        self._jobs[job.id] = job
+        self._metrics["submitted"] += 1
+        return job
+
+    def is_full(self) -> bool:
+        return self._queue is not None and self._queue.full()
+
+    def get(self, job_id: str):
+        return self._jobs.get(job_id)
+
+    async def wait(self, job_id: str, timeout: float = None):
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        try:
+            await asyncio.wait_for(job.done.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return job
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            job.status = "running"
+            job.started_at = time.time()
+            job.payload, payload = None, job.payload
+            self._running += 1
+            record_stage("queue_wait", job.started_at - job.submitted_at, job.profile)
+            try:
+                with use_profile(job.profile):
+                    job.result = await self.handler(payload)
+                job.status = "completed"
+                self._metrics["completed"] += 1
+            except Exception as e:
+                job.status = "failed"
+                job.error = str(e)
+                self._metrics["failed"] += 1
+                print(f"Job {job.id} failed: {e}")
+            finally:
+                self._running -= 1
+                job.finished_at = time.time()
+                elapsed = job.finished_at - job.started_at
+                self._metrics["processing_seconds_total"] += elapsed
+                self._metrics["processing_seconds_max"] = max(self._metrics["processing_seconds_max"], elapsed)
+                self._metrics["queue_wait_seconds_total"] += job.started_at - job.submitted_at
+                job.done.set()
+                self._queue.task_done()
+
+    def metrics(self) -> dict:
+        metrics = dict(self._metrics)
+        finished = (metrics["completed"] + metrics["failed"]) or 1
+        metrics["queue_depth"] = self._queue.qsize() if self._queue else 0
+        metrics["queue_capacity"] = self.max_queue_size
+        metrics["running"] = self._running
+        metrics["workers"] = self.workers
+        metrics["processing_seconds_avg"] = metrics["processing_seconds_total"] / finished
+        metrics["queue_wait_seconds_avg"] = metrics["queue_wait_seconds_total"] / finished
+        return metrics
+
+    async def shutdown(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
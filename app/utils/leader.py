@@ -0,0 +1,81 @@
+import json
+import os
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, every process acts as leader
+    fcntl = None
+
+
+class FileLock:
+    """
+    Non-blocking exclusive lock on a local file. The OS drops it when the holder
+    exits or crashes, so another process can take over leadership.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd = None
+
+    @property
+    def held(self) -> bool:
+        return self._fd is not None
+
+    def try_acquire(self, blocking: bool = False) -> bool:
+        if self._fd is not None:
+            return True
+        if fcntl is None:
+            print("⚠️ fcntl unavailable; assuming monitor leadership.")
+            self._fd = -1
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode("ascii"))
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is None:
+            return
+        if self._fd >= 0:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+        self._fd = None
+
+    def __enter__(self):
+        self.try_acquire(blocking=True)
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def write_json_atomic(path: str, payload):
+    """
+    Writes JSON next to `path` and renames it into place so readers never see a partial file.
+    """
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(payload, f)
+    os.replace(tmp_path, path)
+
+
+def read_json(path: str, default=None):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def file_age(path: str):
+    try:
+        return time.time() - os.path.getmtime(path)
+    except OSError:
+        return None
@@ -0,0 +1,252 @@
+import bisect
+import contextvars
+import os
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from app.config import METRICS_LATENCY_BUCKETS
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def format_labels(names, values, **extra) -> str:
+    pairs = list(zip(names, values)) + list(extra.items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+def format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """
+    Monotonic counter, one series per combination of label values.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount: float = 1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def samples(self) -> list:
+        with self._lock:
+            return [(self.name, format_labels(self.labelnames, labels), value)
+                    for labels, value in sorted(self._values.items())]
+
+
+class Gauge(Counter):
+    """
+    Value that can go up and down (e.g. requests in flight).
+    """
+
+    kind = "gauge"
+
+    def set(self, *labelvalues, value: float):
+        with self._lock:
+            self._values[labelvalues] = value
+
+    def dec(self, *labelvalues, amount: float = 1):
+        self.inc(*labelvalues, amount=-amount)
+
+
+class Histogram:
+    """
+    Cumulative-bucket latency histogram in the Prometheus layout, one series per
+    combination of label values.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = (), buckets: tuple = METRICS_LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labelvalues):
+        # Prometheus buckets are "less than or equal"; values past the last bound only count towards +Inf
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [[0] * len(self.buckets), 0.0, 0]
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self) -> list:
+        with self._lock:
+            series = [(labels, list(counts), total, count) for labels, (counts, total, count) in sorted(self._series.items())]
+        samples = []
+        for labels, counts, total, count in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                samples.append((f"{self.name}_bucket", format_labels(self.labelnames, labels, le=format_value(bound)), cumulative))
+            samples.append((f"{self.name}_bucket", format_labels(self.labelnames, labels, le="+Inf"), count))
+            samples.append((f"{self.name}_sum", format_labels(self.labelnames, labels), total))
+            samples.append((f"{self.name}_count", format_labels(self.labelnames, labels), count))
+        return samples
+
+
+class MetricsRegistry:
+    """
+    Metrics rendered together in the Prometheus text exposition format. Collectors
+    are callables returning extra (metric, kind, help, samples) families computed at
+    scrape time, for values that already live elsewhere (memory, queue depth).
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        families = [(metric.name, metric.kind, metric.help_text, metric.samples()) for metric in self._metrics]
+        for collector in self._collectors:
+            try:
+                families.extend(collector())
+            except Exception as e:
+                print(f"Metrics collector {getattr(collector, '__name__', collector)} failed: {e}")
+        lines = []
+        for name, kind, help_text, samples in families:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(f"{sample}{labels} {format_value(value)}" for sample, labels, value in samples)
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+request_latency = registry.register(Histogram(
+    "vitalgenie_request_duration_seconds", "HTTP request latency by route (time to response headers).",
+    ("method", "route", "status")))
+requests_in_progress = registry.register(Gauge(
+    "vitalgenie_requests_in_progress", "HTTP requests currently being handled.", ("method",)))
+stage_latency = registry.register(Histogram(
+    "vitalgenie_stage_duration_seconds", "Time spent in each pipeline stage.", ("stage",)))
+stage_errors = registry.register(Counter(
+    "vitalgenie_stage_errors_total", "Pipeline stage calls that raised.", ("stage",)))
+
+
+class Profile:
+    """
+    Stage timings collected for one request, reported back as a Server-Timing header.
+    """
+
+    def __init__(self):
+        self.stages = []
+
+    def add(self, stage: str, seconds: float):
+        self.stages.append((stage, seconds))
+
+    def server_timing(self, total_seconds: float = None) -> str:
+        # Repeated stages (e.g. several Firestore reads) are summed; concurrent ones can add up to more than the total
+        totals, counts = {}, {}
+        for stage, seconds in list(self.stages):
+            totals[stage] = totals.get(stage, 0.0) + seconds
+            counts[stage] = counts.get(stage, 0) + 1
+        entries = [f'{stage};desc="{counts[stage]}x";dur={1000.0 * seconds:.1f}' for stage, seconds in totals.items()]
+        if total_seconds is not None:
+            entries.append(f"total;dur={1000.0 * total_seconds:.1f}")
+        return ", ".join(entries)
+
+
+_profile = contextvars.ContextVar("vitalgenie_profile", default=None)
+
+def current_profile():
+    return _profile.get()
+
+@contextmanager
+def use_profile(profile):
+    """
+    Makes `profile` collect the stages timed in this context (None turns collection off).
+    Tasks and `asyncio.to_thread` calls started inside inherit it; `run_in_executor` does not.
+    """
+    token = _profile.set(profile)
+    try:
+        yield profile
+    finally:
+        _profile.reset(token)
+
+def record_stage(stage: str, seconds: float, profile=None):
+    stage_latency.observe(seconds, stage)
+    profile = profile if profile is not None else _profile.get()
+    if profile is not None:
+        profile.add(stage, seconds)
+
+@contextmanager
+def timed(stage: str):
+    """
+    Records the wall time of the block under `stage`, and adds it to the current
+    request's profile when one is being collected. Works around awaits as well as
+    blocking code.
+    """
+    profile = _profile.get()
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        stage_errors.inc(stage)
+        raise
+    finally:
+        record_stage(stage, time.perf_counter() - started, profile)
+
+
+def process_memory() -> dict:
+    """
+    Resident set size of this process now and at its peak, in bytes.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak *= 1 if sys.platform == "darwin" else 1024
+    try:
+        with open("/proc/self/statm") as f:
+            rss = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        rss = peak
+    return {"rss_bytes": rss, "peak_rss_bytes": max(peak, rss)}
+
+def collect_process_metrics() -> list:
+    memory = process_memory()
+    families = [
+        ("vitalgenie_process_resident_memory_bytes", "gauge", "Resident set size of the API process.",
+         [("vitalgenie_process_resident_memory_bytes", "", memory["rss_bytes"])]),
+        ("vitalgenie_process_peak_resident_memory_bytes", "gauge", "Peak resident set size of the API process.",
+         [("vitalgenie_process_peak_resident_memory_bytes", "", memory["peak_rss_bytes"])]),
+    ]
+    # Only when a model has already pulled in torch; a scrape should never be the thing that loads it
+    if "torch" in sys.modules:
+        from app.utils.gpu_utils import gpu_memory
+        devices = gpu_memory()
+        if devices:
+            families.append(("vitalgenie_gpu_memory_allocated_bytes", "gauge", "CUDA memory allocated by tensors.",
+                             [("vitalgenie_gpu_memory_allocated_bytes", format_labels(("device",), (d["device"],)), d["allocated"])
+                              for d in devices]))
+            families.append(("vitalgenie_gpu_memory_reserved_bytes", "gauge", "CUDA memory reserved by the caching allocator.",
+                             [("vitalgenie_gpu_memory_reserved_bytes", format_labels(("device",), (d["device"],)), d["reserved"])
+                              for d in devices]))
+    return families
+
+registry.add_collector(collect_process_metrics)
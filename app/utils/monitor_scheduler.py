@@ -0,0 +1,161 @@
+import asyncio
+import random
+import time
+import httpx
+from app.config import (
+    MONITOR_FETCH_TIMEOUT_S,
+    MONITOR_INTERVAL_JITTER,
+    MONITOR_MAX_CONCURRENT_EVALUATIONS,
+    MONITOR_HTTP_MAX_CONNECTIONS,
+)
+from app.utils.change_detection import FrameChangeDetector
+from app.utils.image_utils import image_preprocessor
+from app.utils.metrics import timed
+
+
+class Camera:
+    def __init__(self, camera_id: str, url: str, interval_s: float = 3.0):
+        self.id = camera_id
+        self.url = url
+        self.interval_s = interval_s
+        self.detector = FrameChangeDetector()
+        self.status = {"status": "OK", "message": "No anomaly detected.", "last_checked": None}
+        self.fetch_stats = {"fetches": 0, "fetch_errors": 0, "fetch_seconds_total": 0.0}
+
+    def to_dict(self) -> dict:
+        return {"id": self.id, "url": self.url, "interval_s": self.interval_s}
+
+
+class CameraRegistry:
+    def __init__(self, cameras: list = None):
+        self._cameras = {}
+        for camera in cameras or []:
+            self.add(Camera(camera["id"], camera["url"], camera.get("interval_s", 3.0)))
+
+    def add(self, camera: Camera):
+        self._cameras[camera.id] = camera
+
+    def remove(self, camera_id: str):
+        return self._cameras.pop(camera_id, None)
+
+    def get(self, camera_id: str):
+        return self._cameras.get(camera_id)
+
+    def all(self) -> list:
+        return list(self._cameras.values())
+
+
+class MonitorScheduler:
+    """
+    Polls every registered camera on its own interval (with jitter so cameras do not
+    fire in lockstep) over one pooled async HTTP client. Frames that pass the change
+    gate are handed to `analyze(camera, image, reason)`; a semaphore bounds how many
+    of those evaluations run at once across all cameras.
+    """
+
+    def __init__(self, registry: CameraRegistry, analyze,
+                 max_concurrent_evaluations: int = MONITOR_MAX_CONCURRENT_EVALUATIONS,
+                 fetch_timeout_s: float = MONITOR_FETCH_TIMEOUT_S, jitter: float = MONITOR_INTERVAL_JITTER):
+        self.registry = registry
+        self.analyze = analyze
+        self.max_concurrent_evaluations = max_concurrent_evaluations
+        self.fetch_timeout_s = fetch_timeout_s
+        self.jitter = jitter
+        self._client = None
+        self._semaphore = None
+        self._tasks = {}
+
+    @property
+    def running(self) -> bool:
+        return self._client is not None
+
+    def start(self):
+        if self.running:
+            return
+        self._client = httpx.AsyncClient(
+            timeout=self.fetch_timeout_s,
+            limits=httpx.Limits(max_connections=MONITOR_HTTP_MAX_CONNECTIONS,
+                                max_keepalive_connections=MONITOR_HTTP_MAX_CONNECTIONS),
+        )
+        self._semaphore = asyncio.Semaphore(self.max_concurrent_evaluations)
+        for camera in self.registry.all():
+            self._start_camera(camera)
+
+    def _start_camera(self, camera: Camera):
+        self._tasks[camera.id] = asyncio.create_task(self._camera_loop(camera))
+
+    def add_camera(self, camera: Camera):
+        self.remove_camera(camera.id)
+        self.registry.add(camera)
+        if self.running:
+            self._start_camera(camera)
+
+    def remove_camera(self, camera_id: str):
+        task = self._tasks.pop(camera_id, None)
+        if task is not None:
+            task.cancel()
+        return self.registry.remove(camera_id)
+
+    async def stop(self):
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = {}
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _next_delay(self, camera: Camera) -> float:
+        return camera.interval_s * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    async def _camera_loop(self, camera: Camera):
+        # Spread the first polls over one interval
+        await asyncio.sleep(random.uniform(0, camera.interval_s))
+        while True:
+            try:
+                await self.poll_once(camera)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error during monitoring of {camera.id}:", e)
+                camera.status = {
+                    "status": "ERROR",
+                    "message": f"Error during monitoring: {e}",
+                    "last_checked": time.time(),
+                }
+            await asyncio.sleep(self._next_delay(camera))
+
+    async def poll_once(self, camera: Camera):
+        started = time.perf_counter()
+        try:
+            with timed("camera_fetch"):
+                response = await self._client.get(camera.url)
+        except httpx.HTTPError:
+            camera.fetch_stats["fetch_errors"] += 1
+            raise
+        finally:
+            camera.fetch_stats["fetches"] += 1
+            camera.fetch_stats["fetch_seconds_total"] += time.perf_counter() - started
+        if response.status_code != 200:
+            camera.fetch_stats["fetch_errors"] += 1
+            print(f"Failed to get image from {camera.id}. Status code:", response.status_code)
+            return
+        # Frames share the bounded decode pool with uploads; the gate compares the downscaled image
+        image = await image_preprocessor.prepare(response.content)
+        escalate, reason, _ = await image_preprocessor.run(camera.detector.check, image.image)
+        if not escalate:
+            return
+        async with self._semaphore:
+            await self.analyze(camera, image, reason)
+
+    def get_metrics(self) -> dict:
+        metrics = {}
+        for camera in self.registry.all():
+            fetches = camera.fetch_stats["fetches"] or 1
+            metrics[camera.id] = {
+                **camera.fetch_stats,
+                "fetch_seconds_avg": camera.fetch_stats["fetch_seconds_total"] / fetches,
+                "change_gate": camera.detector.get_stats(),
+            }
+        return metrics
@@ -0,0 +1,119 @@
+import asyncio
+import hashlib
+import io
+import json
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.enums import TA_CENTER, TA_LEFT
+from app.config import EHR_PDF_RENDER_WORKERS, EHR_PDF_CACHE_ENTRIES
+from app.utils.metrics import timed
+
+_styles = None
+_styles_lock = threading.Lock()
+_render_executor = ThreadPoolExecutor(max_workers=EHR_PDF_RENDER_WORKERS, thread_name_prefix="ehr-pdf")
+
+
+def get_ehr_styles():
+    """
+    Stylesheet shared by every report; built once per process.
+    """
+    global _styles
+    if _styles is None:
+        with _styles_lock:
+            if _styles is None:
+                styles = getSampleStyleSheet()
+                styles.add(ParagraphStyle(name='CenterTitle', fontSize=18, leading=22, alignment=TA_CENTER, spaceAfter=20))
+                styles.add(ParagraphStyle(name='Heading', fontSize=14, leading=18, alignment=TA_LEFT, spaceBefore=12, spaceAfter=8))
+                styles.add(ParagraphStyle(name='Body', fontSize=12, leading=16, alignment=TA_LEFT, spaceAfter=6))
+                _styles = styles
+    return _styles
+
+
+def render_ehr_pdf(report_content: dict) -> bytes:
+    """
+    Renders the EHR report sections into PDF bytes in memory.
+    """
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(
+        buffer,
+        pagesize=letter,
+        rightMargin=50,
+        leftMargin=50,
+        topMargin=50,
+        bottomMargin=50
+    )
+    styles = get_ehr_styles()
+    story = []
+
+    # Title
+    story.append(Paragraph("Electronic Health Record (EHR) Report", styles['CenterTitle']))
+
+    # For each section, add a heading and list its items
+    for section, items in report_content.items():
+        story.append(Paragraph(section + ":", styles['Heading']))
+        for item in items:
+            # Using a bullet-like symbol for clarity
+            story.append(Paragraph(f"• {item}", styles['Body']))
+        story.append(Spacer(1, 12))
+
+    doc.build(story)
+    return buffer.getvalue()
+
+
+def report_content_hash(report_content: dict) -> str:
+    return hashlib.sha256(json.dumps(report_content, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class PdfCache:
+    """
+    LRU of rendered PDFs keyed by (summary document id, report content hash).
+    """
+
+    def __init__(self, max_entries: int = EHR_PDF_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0}
+
+    def get(self, key):
+        with self._lock:
+            pdf = self._entries.get(key)
+            if pdf is None:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return pdf
+
+    def put(self, key, pdf: bytes):
+        with self._lock:
+            self._entries[key] = pdf
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, "entries": len(self._entries),
+                    "bytes": sum(len(pdf) for pdf in self._entries.values())}
+
+
+pdf_cache = PdfCache()
+
+
+async def get_or_render_ehr_pdf(doc_id: str, report_content: dict) -> bytes:
+    """
+    Returns the cached PDF for this encounter and report, rendering it on the PDF thread pool on a miss.
+    """
+    key = (doc_id, report_content_hash(report_content))
+    pdf = pdf_cache.get(key)
+    if pdf is None:
+        loop = asyncio.get_running_loop()
+        with timed("pdf_render"):
+            pdf = await loop.run_in_executor(_render_executor, render_ehr_pdf, report_content)
+        pdf_cache.put(key, pdf)
+    return pdf
@@ -0,0 +1,129 @@
+import asyncio
+import numpy as np
+from app.utils.audio_utils import SAMPLE_RATE, FRAME_SAMPLES, frame_energy
+
+
+class StreamingTranscriber:
+    """
+    Incremental transcription of a live 16 kHz mono PCM stream.
+
+    `feed` is cheap and synchronous: it appends samples and runs an energy VAD over
+    30 ms frames. An utterance is finalized after `silence_s` of trailing silence or
+    once it reaches `max_segment_s`. `step` does the Whisper work: it decodes the
+    oldest finalized utterance, or, if none is waiting, re-decodes the utterance in
+    progress (at most `max_segment_s` long) to produce a partial result.
+    """
+
+    def __init__(self, transcribe, vad_threshold: float, silence_s: float,
+                 max_segment_s: float, partial_interval_s: float, preroll_s: float = 0.3):
+        self.transcribe = transcribe
+        self.vad_threshold = vad_threshold
+        self.silence_frames = int(silence_s * SAMPLE_RATE) // FRAME_SAMPLES
+        self.max_segment_samples = int(max_segment_s * SAMPLE_RATE)
+        self.partial_interval_samples = int(partial_interval_s * SAMPLE_RATE)
+        self.preroll_samples = int(preroll_s * SAMPLE_RATE)
+        self.wakeup = asyncio.Event()
+        self.segments = []
+        self._residual = b""
+        self._current = np.zeros(0, dtype="float32")
+        self._current_start = 0          # absolute sample index of self._current[0]
+        self._samples_seen = 0
+        self._scanned = 0                # samples of self._current already run through VAD
+        self._in_speech = False
+        self._trailing_silence = 0
+        self._last_partial_len = 0
+        self._finalized = []             # (start_sample, audio) waiting for a final decode
+
+    def feed(self, pcm: bytes):
+        """
+        Accepts little-endian int16 PCM bytes.
+        """
+        data = self._residual + pcm
+        usable = len(data) - len(data) % 2
+        self._residual = data[usable:]
+        if not usable:
+            return
+        samples = np.frombuffer(data[:usable], np.int16).astype(np.float32) / 32768.0
+        self._samples_seen += len(samples)
+        self._current = np.concatenate([self._current, samples])
+
+        start = self._scanned
+        new_frames = (len(self._current) - start) // FRAME_SAMPLES
+        energy = frame_energy(self._current[start:start + new_frames * FRAME_SAMPLES])
+        self._scanned += new_frames * FRAME_SAMPLES
+        shift = 0                        # samples removed from the front by finalizing mid-batch
+        for i, value in enumerate(energy):
+            if value >= self.vad_threshold:
+                self._in_speech = True
+                self._trailing_silence = 0
+            elif self._in_speech:
+                self._trailing_silence += 1
+                if self._trailing_silence >= self.silence_frames:
+                    frame_end = start + (i + 1) * FRAME_SAMPLES - shift
+                    self._finalize(frame_end)
+                    shift += frame_end
+
+        if not self._in_speech and len(self._current) > self.preroll_samples:
+            # Nothing said yet: keep only a short pre-roll so speech onsets are not clipped
+            drop = len(self._current) - self.preroll_samples
+            self._current = self._current[drop:]
+            self._current_start += drop
+            self._scanned = max(0, self._scanned - drop)
+        elif len(self._current) >= self.max_segment_samples:
+            self._finalize(len(self._current))
+        self.wakeup.set()
+
+    def _finalize(self, end: int):
+        audio = self._current[:end]
+        if len(audio):
+            self._finalized.append((self._current_start, audio))
+        self._current = self._current[end:]
+        self._current_start += end
+        self._scanned = max(0, self._scanned - end)
+        self._in_speech = False
+        self._trailing_silence = 0
+        self._last_partial_len = 0
+
+    def flush(self):
+        """
+        Ends the stream: whatever is left becomes a final utterance.
+        """
+        if self._in_speech:
+            self._finalize(len(self._current))
+        self.wakeup.set()
+
+    def has_pending(self) -> bool:
+        return bool(self._finalized)
+
+    async def step(self) -> list:
+        """
+        Runs at most one decode and returns the events it produced.
+        """
+        if self._finalized:
+            start, audio = self._finalized.pop(0)
+            text = await self._decode(audio)
+            if not text:
+                return []
+            segment = {
+                "type": "final",
+                "id": len(self.segments),
+                "start": round(start / SAMPLE_RATE, 2),
+                "end": round((start + len(audio)) / SAMPLE_RATE, 2),
+                "text": text,
+            }
+            self.segments.append(segment)
+            return [segment]
+        if self._in_speech and len(self._current) - self._last_partial_len >= self.partial_interval_samples:
+            start, audio = self._current_start, self._current.copy()
+            self._last_partial_len = len(audio)
+            text = await self._decode(audio)
+            if text:
+                return [{"type": "partial", "start": round(start / SAMPLE_RATE, 2), "text": text}]
+        return []
+
+    async def _decode(self, audio: np.ndarray) -> str:
+        result = await self.transcribe(audio)
+        return result["text"].strip()
+
+    def transcript(self) -> str:
+        return " ".join(segment["text"] for segment in self.segments)
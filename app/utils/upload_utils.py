@@ -0,0 +1,111 @@
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+
+class UploadFormError(Exception):
+    """Raised when a multipart body is malformed, lacks the file field or carries a disallowed type."""
+
+
+class MultipartFileStream:
+    """
+    Incremental multipart/form-data reader over `request.stream()`. Only the bytes of
+    `file_field` are handed on, as they arrive from the socket; nothing is spooled to
+    disk. Other (small) text fields are collected into `fields` and are complete once
+    `file_chunks()` is exhausted. If `allowed_types` is given, the file part's
+    Content-Type is checked as soon as its headers have been read.
+    """
+
+    def __init__(self, request, file_field: str = "file", allowed_types=None, max_field_bytes: int = 64 * 1024):
+        content_type, params = parse_options_header(request.headers.get("content-type", ""))
+        if content_type != b"multipart/form-data" or not params.get(b"boundary"):
+            raise UploadFormError("Expected a multipart/form-data body with a boundary.")
+        self.request = request
+        self.file_field = file_field
+        self.allowed_types = allowed_types
+        self.max_field_bytes = max_field_bytes
+        self.fields = {}
+        self.filename = None
+        self.file_content_type = None
+        self.found_file = False
+        self._boundary = params[b"boundary"]
+        self._headers = {}
+        self._header_field = b""
+        self._header_value = b""
+        self._name = None
+        self._value = bytearray()
+        self._in_file = False
+        self._pending = []
+        self._error = None
+
+    # ------------------------------
+    # Parser callbacks (synchronous, called from parser.write)
+    # ------------------------------
+    def _on_part_begin(self):
+        self._headers = {}
+        self._header_field, self._header_value = b"", b""
+        self._name, self._in_file = None, False
+        self._value = bytearray()
+
+    def _on_header_field(self, data, start, end):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data, start, end):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field, self._header_value = b"", b""
+
+    def _on_headers_finished(self):
+        _, disposition = parse_options_header(self._headers.get(b"content-disposition", b""))
+        self._name = disposition.get(b"name", b"").decode("utf-8", "replace")
+        if self._name != self.file_field or self.found_file:
+            return
+        self._in_file = True
+        self.found_file = True
+        self.filename = disposition.get(b"filename", b"").decode("utf-8", "replace") or None
+        self.file_content_type = self._headers.get(b"content-type", b"").decode("latin-1").strip() or None
+        if self.allowed_types is not None and self.file_content_type not in self.allowed_types:
+            self._error = UploadFormError(f"Unsupported file type: {self.file_content_type}.")
+
+    def _on_part_data(self, data, start, end):
+        if self._in_file:
+            self._pending.append(bytes(data[start:end]))
+        elif len(self._value) + (end - start) <= self.max_field_bytes:
+            self._value.extend(data[start:end])
+        else:
+            self._error = UploadFormError(f"Form field '{self._name}' is too large.")
+
+    def _on_part_end(self):
+        if not self._in_file and self._name:
+            self.fields[self._name] = self._value.decode("utf-8", "replace")
+        self._in_file = False
+
+    async def file_chunks(self):
+        """
+        Async iterator over the file part's bytes. Raises UploadFormError on a bad body.
+        """
+        parser = MultipartParser(self._boundary, {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        })
+        async for chunk in self.request.stream():
+            try:
+                parser.write(chunk)
+            except Exception as e:
+                raise UploadFormError(f"Malformed multipart body: {e}")
+            if self._error is not None:
+                raise self._error
+            if self._pending:
+                data, self._pending = b"".join(self._pending), []
+                yield data
+        parser.finalize()
+        if not self.found_file:
+            raise UploadFormError(f"Missing file field '{self.file_field}'.")
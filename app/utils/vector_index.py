@@ -0,0 +1,568 @@
+import asyncio
+import glob
+import json
+import os
+import re
+import threading
+import numpy as np
+import faiss
+from app.config import (
+    CORPUS_INDEX_DIR,
+    CORPUS_CHUNK_CHARS,
+    CORPUS_CHUNK_OVERLAP_SENTENCES,
+    CORPUS_HNSW_THRESHOLD,
+    CORPUS_HNSW_M,
+    CORPUS_HNSW_EF_CONSTRUCTION,
+    CORPUS_HNSW_EF_SEARCH,
+    CORPUS_EXACT_FILTER_MAX,
+    CORPUS_SAVE_EVERY,
+    CORPUS_SYNC_INTERVAL_S,
+)
+from app.utils.embedding_utils import embedding_service
+from app.utils.firestore_utils import SUMMARIES_COLLECTION, to_epoch
+from app.utils.leader import FileLock
+from app.utils.metrics import timed
+
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+|\n+")
+
+
+def split_sentences(text: str) -> list:
+    return [s.strip() for s in _SENTENCE_BREAK.split(text) if s.strip()]
+
+
+def chunk_text(text: str, max_chars: int = CORPUS_CHUNK_CHARS,
+               overlap_sentences: int = CORPUS_CHUNK_OVERLAP_SENTENCES) -> list:
+    """
+    Packs whole sentences into chunks of about `max_chars`. Each chunk starts with the
+    last `overlap_sentences` sentences of the previous one so answers spanning a
+    boundary are still retrievable. A single over-long sentence becomes its own chunk.
+    """
+    chunks = []
+    current, length = [], 0
+    for sentence in split_sentences(text):
+        if current and length + len(sentence) + 1 > max_chars:
+            chunks.append(" ".join(current))
+            current = current[-overlap_sentences:] if overlap_sentences else []
+            length = sum(len(s) + 1 for s in current)
+        current.append(sentence)
+        length += len(sentence) + 1
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+
+class CorpusIndex:
+    """
+    One vector index over the chunks of every stored summary, with patient and
+    date filters.
+
+    New summaries are chunked, embedded and appended (`add_document`) instead of
+    triggering a rebuild. The index is an exact `IndexFlatL2` until it holds
+    `hnsw_threshold` chunks and is then converted once to HNSW, which also
+    supports incremental adds. Vectors are L2-normalized, so L2 ranking equals
+    cosine ranking. Chunk ids are positions in the index; their metadata is
+    appended to `chunks.jsonl` as they are added, while the index file is written
+    every `save_every` documents and on shutdown. Chunks whose vectors were not
+    yet saved are re-embedded from their stored text by `backfill`.
+
+    Filtered searches that match few chunks are answered exactly over just those
+    chunks; broader filters are passed to FAISS as an ID selector.
+
+    With several API processes sharing `index_dir`, only the one holding
+    `corpus.lock` (the owner) writes the files or backfills. Other processes hand new
+    summaries to the owner through `inbox.jsonl` and follow its files read-only: the
+    saved index is reloaded when it changes and chunks appended after it are embedded
+    in memory. `run_sync_loop` drives both sides and lets a follower take over when
+    the owner exits.
+    """
+
+    def __init__(self, index_dir: str = CORPUS_INDEX_DIR, encoder=None,
+                 hnsw_threshold: int = CORPUS_HNSW_THRESHOLD, hnsw_m: int = CORPUS_HNSW_M,
+                 ef_construction: int = CORPUS_HNSW_EF_CONSTRUCTION, ef_search: int = CORPUS_HNSW_EF_SEARCH,
+                 exact_filter_max: int = CORPUS_EXACT_FILTER_MAX, save_every: int = CORPUS_SAVE_EVERY):
+        self.index_dir = index_dir
+        self.encoder = encoder or embedding_service.encode
+        self.hnsw_threshold = hnsw_threshold
+        self.hnsw_m = hnsw_m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.exact_filter_max = exact_filter_max
+        self.save_every = save_every
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._index = None
+        self._doc_ids = []
+        self._patients = []
+        self._timestamps = []
+        self._texts = []
+        self._documents = set()
+        self._patient_codes = {}
+        self._patient_array = None
+        self._timestamp_array = None
+        self._unsaved_documents = 0
+        self._recover = []
+        self._converting = False
+        self._owner_lock = FileLock(os.path.join(index_dir, "corpus.lock"))
+        self.is_owner = False
+        # Follower state: which version of the owner's files is loaded, and chunks still to embed
+        self._index_mtime = None
+        self._metadata_inode = None
+        self._metadata_offset = 0
+        self._tail = []
+        self._generation = 0
+        self._stats = {"searches": 0, "filtered_searches": 0, "exact_filtered": 0, "documents_added": 0,
+                       "documents_spooled": 0, "reloads": 0}
+
+    @property
+    def index_path(self) -> str:
+        return os.path.join(self.index_dir, "corpus.index")
+
+    @property
+    def metadata_path(self) -> str:
+        return os.path.join(self.index_dir, "chunks.jsonl")
+
+    @property
+    def inbox_path(self) -> str:
+        return os.path.join(self.index_dir, "inbox.jsonl")
+
+    # ------------------------------
+    # Persistence
+    # ------------------------------
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        os.makedirs(self.index_dir, exist_ok=True)
+        self.is_owner = self._owner_lock.try_acquire()
+        self._load_files()
+
+    def _read_records(self, offset: int = 0):
+        """
+        Chunk records from `offset` up to the last complete line, and the offset after them.
+        """
+        try:
+            with open(self.metadata_path, "rb") as f:
+                f.seek(offset)
+                data = f.read()
+        except FileNotFoundError:
+            return [], 0
+        # A line without its newline is still being appended (or was torn by a crash)
+        end = data.rfind(b"\n") + 1
+        records = []
+        for line in data[:end].splitlines():
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                break
+        return records, offset + end
+
+    def _file_versions(self):
+        index_mtime = os.path.getmtime(self.index_path) if os.path.exists(self.index_path) else None
+        metadata = os.stat(self.metadata_path) if os.path.exists(self.metadata_path) else None
+        return index_mtime, metadata
+
+    def _load_files(self):
+        # Called with self._lock held; replaces everything in memory with what is on disk
+        index_mtime, metadata = self._file_versions()
+        records, offset = self._read_records()
+        index = None
+        if os.path.exists(self.index_path):
+            try:
+                index = faiss.read_index(self.index_path)
+            except Exception as e:
+                print(f"Error loading corpus index, rebuilding from chunk text: {e}")
+        if index is not None and index.ntotal > len(records):
+            print("Corpus index is ahead of its metadata, rebuilding from chunk text.")
+            index = None
+        saved = index.ntotal if index is not None else 0
+
+        self._index = None
+        self._doc_ids, self._patients, self._timestamps, self._texts = [], [], [], []
+        self._documents = set()
+        self._patient_codes = {}
+        self._patient_array = None
+        self._timestamp_array = None
+        self._recover, self._tail = [], []
+        self._generation += 1
+        if self.is_owner:
+            # Chunks appended after the last index save are re-embedded by `backfill`
+            by_doc = {}
+            for record in records[saved:]:
+                entry = by_doc.setdefault(record["doc_id"], (record.get("patient_id"), record.get("timestamp"), []))
+                entry[2].append(record["text"])
+            self._recover = [(doc_id, patient, ts, texts) for doc_id, (patient, ts, texts) in by_doc.items()]
+            if saved < len(records):
+                self._write_metadata(records[:saved])
+        else:
+            # Followers never write; the owner's unsaved chunks are embedded in memory by `sync`
+            self._tail = records[saved:]
+            self._index_mtime = index_mtime
+            self._metadata_inode = metadata.st_ino if metadata is not None else None
+            self._metadata_offset = offset
+
+        self._index = index
+        for record in records[:saved]:
+            self._append_record(record)
+        self._loaded = True
+        if records:
+            role = "owner" if self.is_owner else "follower"
+            print(f"🔹 Corpus index loaded ({role}): {saved} chunks, "
+                  f"{len(self._recover) or len(self._tail)} {'documents' if self.is_owner else 'chunks'} to re-embed.")
+
+    def _write_metadata(self, records: list):
+        tmp_path = self.metadata_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+        os.replace(tmp_path, self.metadata_path)
+
+    def save(self):
+        with self._lock:
+            if self._index is None or not self.is_owner:
+                return
+            os.makedirs(self.index_dir, exist_ok=True)
+            # Write then rename so a crash never leaves a partial index behind
+            faiss.write_index(self._index, self.index_path + ".tmp")
+            os.replace(self.index_path + ".tmp", self.index_path)
+            self._unsaved_documents = 0
+
+    # ------------------------------
+    # Adding
+    # ------------------------------
+    def _append_record(self, record: dict):
+        self._doc_ids.append(record["doc_id"])
+        self._patients.append(record.get("patient_id"))
+        self._timestamps.append(record.get("timestamp"))
+        self._texts.append(record["text"])
+        self._documents.add(record["doc_id"])
+        patient = record.get("patient_id")
+        if patient is not None and patient not in self._patient_codes:
+            self._patient_codes[patient] = len(self._patient_codes)
+        self._patient_array = None
+        self._timestamp_array = None
+
+    def load(self):
+        with self._lock:
+            self._ensure_loaded()
+
+    def has_document(self, doc_id: str) -> bool:
+        with self._lock:
+            self._ensure_loaded()
+            return doc_id in self._documents
+
+    def _build_hnsw(self, vectors: np.ndarray):
+        index = faiss.IndexHNSWFlat(vectors.shape[1], self.hnsw_m)
+        index.hnsw.efConstruction = self.ef_construction
+        index.hnsw.efSearch = self.ef_search
+        index.add(vectors)
+        return index
+
+    def _add_vectors(self, records: list, vectors):
+        # Called with self._lock held
+        vectors = np.ascontiguousarray(vectors, dtype="float32").reshape(len(records), -1)
+        faiss.normalize_L2(vectors)
+        if self._index is None:
+            self._index = faiss.IndexFlatL2(vectors.shape[1])
+        self._index.add(vectors)
+        for record in records:
+            self._append_record(record)
+
+    def add_embeddings(self, doc_id: str, chunks: list, vectors, patient_id: str = None, timestamp=None) -> int:
+        """
+        Appends one document's chunks and their embeddings. Blocking; returns the number
+        of chunks added (0 if the document is already indexed or this process is not the owner).
+        """
+        timestamp = to_epoch(timestamp)
+        with self._lock:
+            self._ensure_loaded()
+            if doc_id in self._documents or not chunks or not self.is_owner:
+                return 0
+            records = [
+                {"doc_id": doc_id, "patient_id": patient_id, "timestamp": timestamp, "text": text}
+                for text in chunks
+            ]
+            with open(self.metadata_path, "a", encoding="utf-8") as f:
+                for record in records:
+                    f.write(json.dumps(record) + "\n")
+            self._add_vectors(records, vectors)
+
+            convert = (isinstance(self._index, faiss.IndexFlat) and self._index.ntotal >= self.hnsw_threshold
+                       and not self._converting)
+            if convert:
+                # Only the copy is taken under the lock; searches keep using the flat index meanwhile
+                self._converting = True
+                snapshot = self._index.reconstruct_n(0, self._index.ntotal)
+                generation = self._generation
+
+            self._stats["documents_added"] += 1
+            self._unsaved_documents += 1
+            if self._unsaved_documents >= self.save_every:
+                self.save()
+        if convert:
+            self._convert_to_hnsw(snapshot, generation)
+        return len(chunks)
+
+    def _convert_to_hnsw(self, vectors: np.ndarray, generation: int):
+        try:
+            print(f"🔹 Corpus index reached {len(vectors)} chunks; converting to HNSW.")
+            index = self._build_hnsw(vectors)
+            # Saved before rows added in the meantime; on restart those are re-embedded like any unsaved chunk
+            faiss.write_index(index, self.index_path + ".hnsw.tmp")
+            with self._lock:
+                if generation != self._generation or not isinstance(self._index, faiss.IndexFlat):
+                    return
+                os.replace(self.index_path + ".hnsw.tmp", self.index_path)
+                total = self._index.ntotal
+                if total > len(vectors):
+                    index.add(self._index.reconstruct_n(len(vectors), total - len(vectors)))
+                self._index = index
+        finally:
+            with self._lock:
+                self._converting = False
+
+    async def add_document(self, doc_id: str, text: str, patient_id: str = None, timestamp=None,
+                           chunks: list = None) -> int:
+        """
+        Chunks, embeds and appends a summary. Safe to call again for the same document.
+        A process that does not own the index hands the document to the owner instead
+        and returns 0; it becomes searchable here once the owner has appended it.
+        """
+        loop = asyncio.get_running_loop()
+        if await loop.run_in_executor(None, self.has_document, doc_id):
+            return 0
+        chunks = chunks if chunks is not None else chunk_text(text)
+        if not chunks:
+            return 0
+        if not self.is_owner:
+            await loop.run_in_executor(None, self._spool, doc_id, chunks, patient_id, to_epoch(timestamp))
+            return 0
+        vectors = await self.encoder(chunks)
+        return await loop.run_in_executor(None, self.add_embeddings, doc_id, chunks, vectors, patient_id, timestamp)
+
+    async def backfill(self, db=None, collection: str = SUMMARIES_COLLECTION) -> int:
+        """
+        Re-embeds chunks whose vectors were not saved, then indexes every stored summary
+        the corpus does not have yet. Returns the number of documents added. Only the
+        owner backfills; elsewhere this returns 0.
+        """
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.load)
+        if not self.is_owner:
+            return 0
+        added = 0
+        recover, self._recover = self._recover, []
+        for doc_id, patient_id, timestamp, chunks in recover:
+            if await self.add_document(doc_id, None, patient_id, timestamp, chunks=chunks):
+                added += 1
+        if db is not None:
+            with timed("firestore_read"):
+                docs = await loop.run_in_executor(None, lambda: list(db.collection(collection).stream()))
+            for doc in docs:
+                data = doc.to_dict() or {}
+                summary = data.get("summary")
+                if summary and await self.add_document(doc.id, summary, data.get("patient_id"), data.get("timestamp")):
+                    added += 1
+        if added:
+            await loop.run_in_executor(None, self.save)
+            print(f"🔹 Corpus index backfilled {added} documents.")
+        return added
+
+    # ------------------------------
+    # Multi-process sync
+    # ------------------------------
+    def _spool(self, doc_id: str, chunks: list, patient_id: str, timestamp):
+        record = {"doc_id": doc_id, "patient_id": patient_id, "timestamp": timestamp, "chunks": chunks}
+        with FileLock(self.inbox_path + ".lock"):
+            with open(self.inbox_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+        self._stats["documents_spooled"] += 1
+
+    def _claim_inbox(self) -> list:
+        # Moves the inbox aside so followers can keep appending; leftovers from an owner that died
+        # while draining are picked up too
+        with FileLock(self.inbox_path + ".lock"):
+            if os.path.exists(self.inbox_path):
+                os.replace(self.inbox_path, f"{self.inbox_path}.{os.getpid()}.processing")
+        return sorted(glob.glob(self.inbox_path + ".*.processing"))
+
+    async def _drain_inbox(self) -> int:
+        loop = asyncio.get_running_loop()
+        added = 0
+        for path in await loop.run_in_executor(None, self._claim_inbox):
+            with open(path, "r", encoding="utf-8") as f:
+                lines = f.read().splitlines()
+            for line in lines:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                # add_document skips documents already indexed, so a retried file is harmless
+                if await self.add_document(record["doc_id"], None, record.get("patient_id"),
+                                           record.get("timestamp"), chunks=record["chunks"]):
+                    added += 1
+            os.remove(path)
+        return added
+
+    def _poll_files(self):
+        # Follower side: reload if the owner saved or rewrote its files, otherwise queue appended chunks
+        with self._lock:
+            index_mtime, metadata = self._file_versions()
+            inode = metadata.st_ino if metadata is not None else None
+            size = metadata.st_size if metadata is not None else 0
+            if index_mtime != self._index_mtime or inode != self._metadata_inode or size < self._metadata_offset:
+                self._load_files()
+                self._stats["reloads"] += 1
+            elif size > self._metadata_offset:
+                records, self._metadata_offset = self._read_records(self._metadata_offset)
+                self._tail.extend(records)
+            return list(self._tail), self._generation
+
+    def _add_tail(self, records: list, vectors, generation: int):
+        with self._lock:
+            # Dropped if the files were reloaded while these chunks were being embedded
+            if generation != self._generation or self._tail[:len(records)] != records:
+                return
+            self._add_vectors(records, vectors)
+            del self._tail[:len(records)]
+
+    async def sync(self):
+        """
+        One round of multi-process upkeep. A follower first tries to take over a free
+        owner lock. The owner then indexes documents other processes handed over; a
+        follower picks up what the owner has written since the last round.
+        """
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.load)
+        if not self.is_owner and self._owner_lock.try_acquire():
+            print(f"🔹 Process {os.getpid()} took over the corpus index.")
+            with self._lock:
+                self.is_owner = True
+                self._load_files()
+            await self.backfill()
+        if self.is_owner:
+            added = await self._drain_inbox()
+            if added:
+                print(f"🔹 Corpus index added {added} documents from other processes.")
+            return
+        tail, generation = await loop.run_in_executor(None, self._poll_files)
+        if tail:
+            vectors = await self.encoder([record["text"] for record in tail])
+            await loop.run_in_executor(None, self._add_tail, tail, vectors, generation)
+
+    async def run_sync_loop(self, interval_s: float = CORPUS_SYNC_INTERVAL_S):
+        while True:
+            try:
+                await self.sync()
+            except Exception as e:
+                print(f"Corpus index sync failed: {e}")
+            await asyncio.sleep(interval_s)
+
+    def close(self):
+        """
+        Saves the index (owner only) and gives up ownership so another process can take over.
+        """
+        self.save()
+        with self._lock:
+            self._owner_lock.release()
+            self.is_owner = False
+
+    # ------------------------------
+    # Searching
+    # ------------------------------
+    def _filter_mask(self, patient_id: str = None, start=None, end=None):
+        if patient_id is None and start is None and end is None:
+            return None
+        count = len(self._doc_ids)
+        mask = np.ones(count, dtype=bool)
+        if patient_id is not None:
+            code = self._patient_codes.get(patient_id)
+            if code is None:
+                return np.zeros(count, dtype=bool)
+            if self._patient_array is None:
+                codes = self._patient_codes
+                self._patient_array = np.array([codes.get(p, -1) if p is not None else -1 for p in self._patients],
+                                               dtype=np.int32)
+            mask &= self._patient_array == code
+        if start is not None or end is not None:
+            if self._timestamp_array is None:
+                self._timestamp_array = np.array([np.nan if t is None else t for t in self._timestamps],
+                                                 dtype=np.float64)
+            # Chunks without a timestamp never match a date range (NaN comparisons are False)
+            if start is not None:
+                mask &= self._timestamp_array >= to_epoch(start)
+            if end is not None:
+                mask &= self._timestamp_array <= to_epoch(end)
+        return mask
+
+    def _search_filtered(self, query: np.ndarray, k: int, mask: np.ndarray):
+        ids = np.flatnonzero(mask)
+        if ids.size == 0:
+            return np.empty((1, 0), dtype="float32"), np.empty((1, 0), dtype="int64")
+        if ids.size <= self.exact_filter_max and not isinstance(self._index, faiss.IndexFlat):
+            # Few candidates: graph search with a selective filter loses recall, so scan them directly
+            self._stats["exact_filtered"] += 1
+            vectors = self._index.reconstruct_batch(ids)
+            distances = ((vectors - query) ** 2).sum(axis=1)
+            top = np.argsort(distances)[:k]
+            return distances[top][None, :], ids[top][None, :]
+        bitmap = np.packbits(mask, bitorder="little")
+        selector = faiss.IDSelectorBitmap(mask.size, faiss.swig_ptr(bitmap))
+        if isinstance(self._index, faiss.IndexHNSW):
+            params = faiss.SearchParametersHNSW(sel=selector, efSearch=max(self.ef_search, k))
+        else:
+            params = faiss.SearchParameters(sel=selector)
+        return self._index.search(query, k, params=params)
+
+    def search_vectors(self, query_vector, k: int = 5, patient_id: str = None, start=None, end=None) -> list:
+        """
+        Blocking nearest-neighbour search for one query embedding. Returns hit dicts
+        (text, doc_id, patient_id, timestamp, distance), closest first.
+        """
+        query = np.ascontiguousarray(query_vector, dtype="float32").reshape(1, -1)
+        faiss.normalize_L2(query)
+        with self._lock:
+            self._ensure_loaded()
+            self._stats["searches"] += 1
+            if self._index is None or self._index.ntotal == 0:
+                return []
+            mask = self._filter_mask(patient_id, start, end)
+            if mask is None:
+                if isinstance(self._index, faiss.IndexHNSW):
+                    self._index.hnsw.efSearch = max(self.ef_search, k)
+                distances, ids = self._index.search(query, k)
+            else:
+                self._stats["filtered_searches"] += 1
+                distances, ids = self._search_filtered(query, k, mask)
+            return [
+                {
+                    "text": self._texts[i],
+                    "doc_id": self._doc_ids[i],
+                    "patient_id": self._patients[i],
+                    "timestamp": self._timestamps[i],
+                    "distance": float(d),
+                }
+                for d, i in zip(distances[0], ids[0]) if i >= 0
+            ]
+
+    async def search(self, query: str, k: int = 5, patient_id: str = None, start=None, end=None) -> list:
+        query_vector = await self.encoder(query)
+        loop = asyncio.get_running_loop()
+        with timed("faiss_search"):
+            return await loop.run_in_executor(None, self.search_vectors, query_vector, k, patient_id, start, end)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["loaded"] = self._loaded
+            stats["owner"] = self.is_owner
+            stats["chunks"] = len(self._doc_ids)
+            stats["documents"] = len(self._documents)
+            stats["patients"] = len(self._patient_codes)
+            stats["index_type"] = type(self._index).__name__ if self._index is not None else None
+            stats["unsaved_documents"] = self._unsaved_documents
+            stats["pending_recovery"] = len(self._recover)
+            stats["pending_tail"] = len(self._tail)
+            return stats
+
+
+# Shared corpus index over every stored transcription summary
+corpus_index = CorpusIndex()
@@ -0,0 +1,94 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from app.utils.audio_utils import SAMPLE_RATE, split_on_silence, stitch_transcripts
+from app.utils.metrics import timed
+
+# Model owned by this process when running inside a ProcessPoolExecutor worker
+_worker_model = None
+# Whisper's kv-cache hooks live on the model's decoder, so two decodes on one model would
+# write into each other's caches; thread mode takes turns on the shared model
+_shared_model_lock = threading.Lock()
+
+def load_cpu_model(model_name: str, quantize: bool = False):
+    """
+    Loads Whisper on the CPU, optionally with int8 dynamic quantization of its Linear layers.
+    """
+    import torch
+    import whisper
+    model = whisper.load_model(model_name, device="cpu")
+    if quantize:
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
+
+def _init_process_worker(model_name: str, threads: int, quantize: bool = False):
+    """
+    Loads a private Whisper model in a worker process. Runs once per process.
+    """
+    global _worker_model
+    import torch
+    torch.set_num_threads(threads)
+    _worker_model = load_cpu_model(model_name, quantize)
+    print(f"🔹 Whisper worker {os.getpid()} ready ({model_name}, {threads} threads, int8={quantize})")
+
+def _transcribe_in_process(audio, language: str = "en") -> dict:
+    return _worker_model.transcribe(audio, language=language, fp16=False)
+
+def _transcribe_with_shared_model(audio, language: str = "en") -> dict:
+    from app.config import get_whisper_model
+    model = get_whisper_model()
+    with _shared_model_lock:
+        return model.transcribe(audio, language=language)
+
+
+class WhisperExecutor:
+    """
+    Runs Whisper off the event loop. Thread mode shares the model held by `app.config`
+    (best when a single GPU holds the model) and runs one decode at a time on it, whatever
+    the worker count; process mode gives every worker its own CPU model, optionally
+    int8-quantized, so decodes run on separate cores.
+    """
+
+    def __init__(self, mode: str, workers: int, model_name: str, quantize: bool = False):
+        self.mode = mode
+        self.workers = workers
+        if mode == "process":
+            threads = max(1, (os.cpu_count() or 1) // workers)
+            # Spawned, not forked: by the time the pool starts the parent may have loaded torch
+            # and its OpenMP threads, which do not survive a fork
+            self._executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_process_worker,
+                initargs=(model_name, threads, quantize),
+            )
+            self._fn = _transcribe_in_process
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="whisper")
+            self._fn = _transcribe_with_shared_model
+
+    async def _run(self, audio, language: str) -> dict:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._fn, audio, language)
+
+    async def transcribe(self, audio, language: str = "en") -> dict:
+        with timed("whisper_decode"):
+            return await self._run(audio, language)
+
+    async def transcribe_chunked(self, audio, chunk_s: float, language: str = "en") -> dict:
+        """
+        Splits a long 16 kHz float32 signal at quiet points, decodes the chunks in
+        parallel across the pool and stitches the results back together in order.
+        """
+        bounds = split_on_silence(audio, chunk_s)
+        print(f"🔹 Long audio: {len(audio) / SAMPLE_RATE:.0f}s split into {len(bounds)} chunks")
+        with timed("whisper_decode"):
+            results = await asyncio.gather(*[
+                self._run(audio[start:end], language) for start, end in bounds
+            ])
+        return stitch_transcripts(list(results), [start / SAMPLE_RATE for start, _ in bounds])
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
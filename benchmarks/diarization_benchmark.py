@@ -0,0 +1,144 @@
+"""
+Diarization benchmark.
+
+Transcribes each recording once with Whisper, then splits it by speaker both ways:
+the current Gemini call on the flattened transcript, and local clustering of speaker
+embeddings over Whisper's segments. Reports end-to-end latency (transcription plus
+diarization) for each path and how well the two agree on who said each word.
+Agreement aligns the words of both outputs and maps speaker labels one-to-one in
+whichever way matches best; coverage is the share of Whisper's words that could be
+aligned with Gemini's text (Gemini sometimes rewords). Needs GOOGLE_API_KEY unless
+--skip-gemini is given.
+
+    python -m benchmarks.diarization_benchmark visit1.wav visit2.mp3 --model base --embedding logmel
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import re
+import time
+from collections import Counter
+from difflib import SequenceMatcher
+import whisper
+from app.config import DIARIZATION_NUM_SPEAKERS
+from app.utils.audio_utils import SAMPLE_RATE
+from app.utils.diarization import diarize_segments, format_diarized
+from app.utils.whisper_worker import load_cpu_model
+
+# "Speaker 1:", "**Doctor:**", "- Patient (00:12):", "[00:00 - 00:05] Speaker A:" ...
+TURN = re.compile(r"^\W*(?:\[[^\]]*\]\s*)?\**([A-Za-z][\w .'-]{0,30}?)\**\s*(?:\([^)]*\)|\[[^\]]*\])?\s*\**:\**\s*(.*)$")
+
+
+def words(text: str) -> list:
+    return re.findall(r"[a-z0-9']+", text.lower())
+
+def labelled_words(turns: list) -> tuple:
+    tokens, labels = [], []
+    for speaker, text in turns:
+        for word in words(text):
+            tokens.append(word)
+            labels.append(speaker)
+    return tokens, labels
+
+def parse_turns(diarized_text: str) -> list:
+    """
+    Best-effort (speaker, text) turns from free-form model output.
+    """
+    turns = []
+    for line in diarized_text.splitlines():
+        match = TURN.match(line.strip())
+        if match:
+            turns.append((match.group(1).strip().lower(), match.group(2)))
+        elif turns and line.strip():
+            turns[-1] = (turns[-1][0], turns[-1][1] + " " + line)
+    return turns
+
+def speaker_agreement(local_turns: list, gemini_turns: list) -> dict:
+    local_words, local_labels = labelled_words(local_turns)
+    gemini_words, gemini_labels = labelled_words(gemini_turns)
+    pairs = Counter()
+    matcher = SequenceMatcher(None, local_words, gemini_words, autojunk=False)
+    for block in matcher.get_matching_blocks():
+        for offset in range(block.size):
+            pairs[(local_labels[block.a + offset], gemini_labels[block.b + offset])] += 1
+    aligned = sum(pairs.values())
+    if not aligned:
+        return {"agreement": None, "coverage": 0.0, "aligned_words": 0}
+    local_speakers = sorted({a for a, _ in pairs})
+    gemini_speakers = sorted({b for _, b in pairs})
+    best = 0
+    if len(local_speakers) <= len(gemini_speakers):
+        for mapping in itertools.permutations(gemini_speakers, len(local_speakers)):
+            best = max(best, sum(pairs[(a, b)] for a, b in zip(local_speakers, mapping)))
+    else:
+        for mapping in itertools.permutations(local_speakers, len(gemini_speakers)):
+            best = max(best, sum(pairs[(a, b)] for a, b in zip(mapping, gemini_speakers)))
+    return {
+        "agreement": best / aligned,
+        "coverage": aligned / max(1, len(local_words)),
+        "aligned_words": aligned,
+        "local_speakers": len(local_speakers),
+        "gemini_speakers": len(gemini_speakers),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("audio", nargs="+", help="Recordings of encounters (any format ffmpeg reads)")
+    parser.add_argument("--model", default="tiny")
+    parser.add_argument("--embedding", default="logmel", choices=["logmel", "ecapa"])
+    parser.add_argument("--speakers", type=int, default=DIARIZATION_NUM_SPEAKERS, help="0 estimates the count")
+    parser.add_argument("--skip-gemini", action="store_true")
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    if not args.skip_gemini:
+        from app.routers.transcribe import diarize_with_gemini
+    model = load_cpu_model(args.model)
+    rows = []
+    for path in args.audio:
+        audio = whisper.load_audio(path)
+        duration = len(audio) / SAMPLE_RATE
+        started = time.perf_counter()
+        result = model.transcribe(audio, language="en", fp16=False)
+        transcribe_s = time.perf_counter() - started
+
+        started = time.perf_counter()
+        segments = diarize_segments(audio, result["segments"], num_speakers=args.speakers or None,
+                                    embedding=args.embedding)
+        local_s = time.perf_counter() - started
+        local_turns = [(segment["speaker"], segment["text"]) for segment in segments]
+        row = {
+            "audio": path,
+            "duration_s": duration,
+            "transcribe_s": transcribe_s,
+            "local_diarize_s": local_s,
+            "local_end_to_end_s": transcribe_s + local_s,
+            "local_output": format_diarized(segments),
+        }
+        if not args.skip_gemini:
+            started = time.perf_counter()
+            gemini_text = asyncio.run(diarize_with_gemini(result["text"].strip()))
+            gemini_s = time.perf_counter() - started
+            row.update({
+                "gemini_diarize_s": gemini_s,
+                "gemini_end_to_end_s": transcribe_s + gemini_s,
+                "gemini_output": gemini_text,
+                **speaker_agreement(local_turns, parse_turns(gemini_text)),
+            })
+        rows.append(row)
+
+    print(f"\n{'audio':<28}{'dur s':>7}{'whisper s':>10}{'local s':>9}{'gemini s':>10}{'e2e local':>11}{'e2e gemini':>12}{'agree':>7}{'cover':>7}")
+    for row in rows:
+        gemini = row.get("gemini_diarize_s")
+        agreement = row.get("agreement")
+        print(f"{row['audio'][-27:]:<28}{row['duration_s']:>7.0f}{row['transcribe_s']:>10.1f}{row['local_diarize_s']:>9.2f}"
+              f"{gemini if gemini is not None else float('nan'):>10.2f}{row['local_end_to_end_s']:>11.1f}"
+              f"{row.get('gemini_end_to_end_s', float('nan')):>12.1f}"
+              f"{agreement if agreement is not None else float('nan'):>7.2f}{row.get('coverage', float('nan')):>7.2f}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"model": args.model, "embedding": args.embedding, "results": rows}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,593 @@
+"""
+End-to-end load benchmark.
+
+Starts the FastAPI app in a child process with offline stand-ins: a fake Gemini model
+(configurable latency, jitter and canned outputs), the in-memory FakeFirestore, fake
+Whisper and embedding models (unless --real-models) and a local HTTP server playing
+the ESP32 camera. Then drives a concurrent mix of /transcribe, /rag_chat,
+/image_analysis, /extract_prescription and /generate_ehr_pdf over real HTTP.
+
+For each endpoint it reports p50/p95/p99 latency, error count and throughput. It also
+reports the server's peak RSS and the average time per pipeline stage, both read from
+/metrics. Results can be written to JSON with --output. --compare prints the change
+against an earlier result file and exits with status 1 if any endpoint regressed by
+more than --tolerance.
+
+    python -m benchmarks.load_benchmark --concurrency 16 --duration 60 --output run.json
+    python -m benchmarks.load_benchmark --gemini-latency 2.5 --compare run.json
+
+The server runs with its working directory in a temporary folder, so the FAISS caches,
+the corpus index and the Gemini response cache start empty. The response cache is off
+unless --gemini-cache is given, so every call pays the fake latency. /transcribe
+needs ffmpeg on PATH.
+"""
+import argparse
+import asyncio
+import hashlib
+import io
+import itertools
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import types
+import wave
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+
+ENDPOINTS = ["transcribe", "rag_chat", "image_analysis", "extract_prescription", "generate_ehr_pdf"]
+DEFAULT_MIX = "transcribe=1,rag_chat=4,image_analysis=2,extract_prescription=2,generate_ehr_pdf=1"
+
+ENCOUNTER = [
+    ("Doctor", "Good morning, what brings you in today?"),
+    ("Patient", "I have had a persistent cough for about two weeks."),
+    ("Doctor", "Is the cough dry or are you bringing anything up?"),
+    ("Patient", "Mostly dry, sometimes there is mucus, and I get short of breath on the stairs."),
+    ("Doctor", "I can hear some wheezing. I am prescribing amoxicillin 500 mg three times a day for seven days."),
+    ("Patient", "Should I come back if it does not get better?"),
+    ("Doctor", "Yes, return if you develop a fever or the shortness of breath gets worse."),
+]
+QUESTIONS = [
+    "How long has the patient had the cough?",
+    "What medication was prescribed and at what dose?",
+    "Does the patient report shortness of breath?",
+    "When should the patient come back?",
+    "Summarise the encounter in two sentences.",
+]
+PRESCRIPTION_TEXT = "Doctor: Take amoxicillin 500 mg three times a day for seven days and paracetamol as needed for fever."
+
+# Prompt marker -> canned answer; the first marker found in the prompt wins
+DEFAULT_GEMINI_OUTPUTS = {
+    "expert speech analyst": "\n".join(f"{speaker}: {text}" for speaker, text in ENCOUNTER),
+    "medical data extractor": json.dumps({"medications": [
+        {"name": "Amoxicillin", "dosage": "500 mg", "frequency": "three times a day", "duration": "7 days", "notes": ""},
+    ]}),
+    "medical safety monitor": "OK",
+    "": ("The patient reports a dry cough of two weeks with intermittent shortness of breath. "
+         "Amoxicillin 500 mg three times daily for seven days was prescribed, with follow-up if a fever develops."),
+}
+
+
+# ------------------------------
+# Stand-ins (run inside the server process)
+# ------------------------------
+class FakeGeminiResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+    def resolve(self):
+        pass
+
+
+class FakeGeminiModel:
+    """
+    Offline `GenerativeModel` stand-in. Each call takes `latency_s` (+/- `jitter` as a
+    fraction) and answers with the output whose marker appears in the prompt. Streamed
+    calls spread the same latency over `stream_chunks` chunks.
+    """
+
+    def __init__(self, latency_s: float = 1.0, jitter: float = 0.2, outputs: dict = None,
+                 stream_chunks: int = 8, seed: int = 0):
+        self.latency_s = latency_s
+        self.jitter = jitter
+        self.outputs = outputs or DEFAULT_GEMINI_OUTPUTS
+        self.stream_chunks = max(1, stream_chunks)
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def _delay(self) -> float:
+        with self._lock:
+            self.calls += 1
+            return max(0.0, self.latency_s * (1.0 + self._rng.uniform(-self.jitter, self.jitter)))
+
+    def _answer(self, contents) -> str:
+        prompt = contents if isinstance(contents, str) else next((c for c in contents if isinstance(c, str)), "")
+        for marker, text in self.outputs.items():
+            if marker and marker in prompt:
+                return text
+        return self.outputs.get("", DEFAULT_GEMINI_OUTPUTS[""])
+
+    def _stream(self, text: str, delay: float):
+        words = text.split(" ")
+        step = max(1, -(-len(words) // self.stream_chunks))
+        for start in range(0, len(words), step):
+            time.sleep(delay / self.stream_chunks)
+            yield FakeGeminiResponse(" ".join(words[start:start + step]) + (" " if start + step < len(words) else ""))
+
+    def generate_content(self, contents, stream: bool = False):
+        text, delay = self._answer(contents), self._delay()
+        if stream:
+            return self._stream(text, delay)
+        time.sleep(delay)
+        return FakeGeminiResponse(text)
+
+
+class FakeWhisperModel:
+    """
+    Whisper stand-in that takes `rtf` seconds per second of audio and returns the
+    scripted encounter as segments spread over the recording.
+    """
+
+    def __init__(self, rtf: float = 0.05):
+        self.rtf = rtf
+
+    def transcribe(self, audio, language: str = "en", **kwargs) -> dict:
+        from app.utils.audio_utils import SAMPLE_RATE
+        duration = len(audio) / SAMPLE_RATE
+        time.sleep(duration * self.rtf)
+        span = duration / len(ENCOUNTER)
+        segments = [{"start": i * span, "end": (i + 1) * span, "text": " " + text}
+                    for i, (_, text) in enumerate(ENCOUNTER)]
+        return {"text": "".join(s["text"] for s in segments), "segments": segments, "language": language}
+
+
+class FakeEmbeddingModel:
+    """
+    SentenceTransformer stand-in: deterministic unit vectors derived from each
+    sentence's hash, plus `seconds_per_sentence` of simulated compute.
+    """
+
+    def __init__(self, dim: int = 768, seconds_per_sentence: float = 0.001):
+        self.dim = dim
+        self.seconds_per_sentence = seconds_per_sentence
+
+    def encode(self, sentences, batch_size: int = 32, **kwargs) -> np.ndarray:
+        time.sleep(self.seconds_per_sentence * len(sentences))
+        vectors = np.stack([
+            np.random.default_rng(int(hashlib.sha256(s.encode("utf-8")).hexdigest()[:16], 16)).standard_normal(self.dim)
+            for s in sentences
+        ]).astype("float32")
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def serve(args):
+    """
+    Child-process entry point: installs the stand-ins, seeds one encounter and runs uvicorn.
+    """
+    import uvicorn
+    from app import config
+    from app.utils.fake_firestore import FakeFirestore
+
+    outputs = dict(DEFAULT_GEMINI_OUTPUTS)
+    if args.gemini_outputs:
+        with open(args.gemini_outputs) as f:
+            custom = json.load(f)
+        # Custom markers are tried first; the built-in ones only fill the gaps when asked to
+        outputs = {**custom, **{k: v for k, v in outputs.items() if k not in custom}} if args.keep_default_outputs else custom
+    db = FakeFirestore()
+    config.firestore_resource.set(db)
+    config.gemini_resource.set(FakeGeminiModel(args.gemini_latency, args.gemini_jitter, outputs,
+                                               args.gemini_stream_chunks, args.seed))
+    if not args.real_models:
+        config.device_resource.set(types.SimpleNamespace(type="cpu"))
+        config.whisper_resource.set(FakeWhisperModel(args.whisper_rtf))
+        config.embedding_resource.set(FakeEmbeddingModel(args.embedding_dim, args.embedding_cost_ms / 1000.0))
+
+    import app.main as main
+    from app.routers import monitoring, transcribe
+    from app.utils.firestore_utils import SUMMARIES_COLLECTION
+    from app.utils.faiss_utils import summary_cache_key
+    from app.utils.gemini_utils import gemini_client
+    from app.utils.monitor_scheduler import Camera
+    from app.utils.whisper_worker import WhisperExecutor
+
+    if not args.real_models:
+        # Process workers would load real Whisper; threads share the fake installed above
+        transcribe.whisper_executor = WhisperExecutor("thread", config.TRANSCRIBE_WORKERS, config.MODEL_NAME)
+        transcribe.long_audio_executor = WhisperExecutor("thread", config.LONG_AUDIO_WORKERS, config.MODEL_NAME)
+    if not args.gemini_cache:
+        gemini_client.cache = None
+    main.CORPUS_BACKFILL_ON_STARTUP = False
+
+    # Poll the local camera server instead of the configured devices
+    monitoring.MONITOR_MODE = "inline"
+    for camera in monitoring.camera_registry.all():
+        monitoring.camera_registry.remove(camera.id)
+    for i in range(args.cameras if args.camera_url else 0):
+        monitoring.camera_registry.add(Camera(f"bench-{i}", args.camera_url, args.camera_interval))
+
+    summary = "\n".join(f"{speaker}: {text}" for speaker, text in ENCOUNTER)
+    db.collection(SUMMARIES_COLLECTION).document().set({
+        "summary": summary,
+        "index_key": summary_cache_key(summary),
+        "patient_id": "bench-patient",
+        "timestamp": datetime.utcnow() - timedelta(days=1),
+    })
+    uvicorn.run(main.app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+# ------------------------------
+# Camera stand-in (runs in the driver process)
+# ------------------------------
+def make_jpeg(seed: int, size: tuple = (1280, 960), invert: bool = False) -> bytes:
+    from PIL import Image
+    rng = np.random.default_rng(seed)
+    base = np.linspace(40, 200, size[0], dtype=np.float32)[None, :, None].repeat(size[1], axis=0).repeat(3, axis=2)
+    pixels = np.clip(base + rng.normal(0, 12, (size[1], size[0], 3)), 0, 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(255 - pixels if invert else pixels).save(buffer, format="JPEG", quality=85)
+    return buffer.getvalue()
+
+
+class CameraServer:
+    """
+    Local HTTP server answering like the ESP32 camera. Every `change_every` frames it
+    switches to a visibly different scene so the change gate escalates some of them
+    to Gemini.
+    """
+
+    def __init__(self, change_every: int = 10):
+        self.frames = [make_jpeg(0), make_jpeg(1, invert=True)]
+        self.change_every = max(1, change_every)
+        self.served = 0
+        self._counter = itertools.count()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                served = next(server._counter)
+                server.served = served + 1
+                frame = server.frames[(served // server.change_every) % len(server.frames)]
+                self.send_response(200)
+                self.send_header("Content-Type", "image/jpeg")
+                self.send_header("Content-Length", str(len(frame)))
+                self.end_headers()
+                self.wfile.write(frame)
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self._httpd.server_address[1]}/cam-hi.jpg"
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+# ------------------------------
+# Load generation
+# ------------------------------
+def make_wav(seconds: float, seed: int = 0) -> bytes:
+    """
+    Two alternating synthetic "voices" (harmonic tones with noise), 16 kHz mono PCM.
+    """
+    rate = 16000
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * rate)) / rate
+    pitch = np.where((t // 4) % 2 == 0, 120.0, 210.0)
+    phase = 2 * np.pi * np.cumsum(pitch) / rate
+    signal = sum(np.sin(k * phase) / k for k in range(1, 6)) * (0.5 + 0.5 * np.sin(2 * np.pi * 3 * t) ** 2)
+    signal = 0.3 * signal / np.abs(signal).max() + 0.01 * rng.standard_normal(len(t))
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes((signal * 32767).astype("<i2").tobytes())
+    return buffer.getvalue()
+
+
+def parse_mix(mix: str) -> dict:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise ValueError(f"Unknown endpoint in mix: {name} (choose from {', '.join(ENDPOINTS)})")
+        weights[name] = float(weight or 1)
+    return {name: weight for name, weight in weights.items() if weight > 0}
+
+
+class LoadDriver:
+    def __init__(self, client, payloads: dict, rng: random.Random):
+        self.client = client
+        self.payloads = payloads
+        self.rng = rng
+
+    async def request(self, endpoint: str):
+        if endpoint == "transcribe":
+            return await self.client.post("/transcribe", files={"file": ("visit.wav", self.payloads["wav"], "audio/wav")},
+                                          data={"patient_id": f"p{self.rng.randrange(50)}"})
+        if endpoint == "rag_chat":
+            return await self.client.post("/rag_chat", json={"query": self.rng.choice(QUESTIONS)})
+        if endpoint == "image_analysis":
+            return await self.client.post("/image_analysis", files={"file": ("scan.jpg", self.payloads["jpeg"], "image/jpeg")})
+        if endpoint == "extract_prescription":
+            if self.rng.random() < 0.5:
+                return await self.client.post("/extract_prescription", data={"text": PRESCRIPTION_TEXT})
+            return await self.client.post("/extract_prescription",
+                                          files={"file": ("rx.jpg", self.payloads["jpeg"], "image/jpeg")})
+        return await self.client.get("/generate_ehr_pdf")
+
+
+async def run_load(base_url: str, args, payloads: dict) -> tuple:
+    import httpx
+    mix = parse_mix(args.mix)
+    names, weights = list(mix), list(mix.values())
+    samples = {name: [] for name in names}
+    errors = {name: {} for name in names}
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        # One untimed request per endpoint so first-use costs (index builds, thread pools) are not measured
+        warm = LoadDriver(client, payloads, random.Random(args.seed))
+        for name in names:
+            try:
+                await warm.request(name)
+            except Exception as e:
+                print(f"Warm-up request to {name} failed: {e}")
+        before = await client.get("/metrics")
+
+        deadline = time.perf_counter() + args.duration
+        remaining = [args.requests] if args.requests else None
+
+        async def worker(worker_id: int):
+            driver = LoadDriver(client, payloads, random.Random(args.seed * 1000 + worker_id))
+            while time.perf_counter() < deadline:
+                if remaining is not None:
+                    if remaining[0] <= 0:
+                        return
+                    remaining[0] -= 1
+                name = driver.rng.choices(names, weights)[0]
+                started = time.perf_counter()
+                try:
+                    response = await driver.request(name)
+                    outcome = None if response.status_code < 400 else str(response.status_code)
+                except Exception as e:
+                    outcome = type(e).__name__
+                elapsed = time.perf_counter() - started
+                if outcome is None:
+                    samples[name].append(elapsed)
+                else:
+                    errors[name][outcome] = errors[name].get(outcome, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*[worker(i) for i in range(args.concurrency)])
+        wall = time.perf_counter() - started
+        after = await client.get("/metrics")
+    return samples, errors, wall, before.text, after.text
+
+
+# ------------------------------
+# Reporting
+# ------------------------------
+METRIC_LINE = re.compile(r'^(\w+)(?:\{([^}]*)\})? (\S+)$')
+
+def parse_metrics(text: str) -> dict:
+    values = {}
+    for line in text.splitlines():
+        match = METRIC_LINE.match(line)
+        if match:
+            values[(match.group(1), match.group(2) or "")] = float(match.group(3))
+    return values
+
+def stage_summary(before: dict, after: dict) -> dict:
+    stages = {}
+    for (name, labels), total in after.items():
+        if name != "vitalgenie_stage_duration_seconds_sum":
+            continue
+        count = after.get(("vitalgenie_stage_duration_seconds_count", labels), 0) - \
+            before.get(("vitalgenie_stage_duration_seconds_count", labels), 0)
+        if count > 0:
+            stage = re.search(r'stage="([^"]*)"', labels).group(1)
+            seconds = total - before.get((name, labels), 0.0)
+            stages[stage] = {"count": int(count), "avg_ms": 1000.0 * seconds / count}
+    return dict(sorted(stages.items()))
+
+def latency_summary(latencies: list, errors: dict, wall: float) -> dict:
+    row = {"requests": len(latencies), "errors": sum(errors.values()), "error_kinds": errors,
+           "throughput_rps": len(latencies) / wall if wall else 0.0}
+    if latencies:
+        ms = 1000.0 * np.asarray(latencies)
+        row.update({"p50_ms": float(np.percentile(ms, 50)), "p95_ms": float(np.percentile(ms, 95)),
+                    "p99_ms": float(np.percentile(ms, 99)), "mean_ms": float(ms.mean()), "max_ms": float(ms.max())})
+    return row
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Prints per-endpoint changes against `baseline`; returns the regressions beyond `tolerance`.
+    """
+    regressions = []
+    print(f"\nCompared with {baseline.get('started_at', 'baseline')}:")
+    print(f"{'endpoint':<22}{'p50':>9}{'p95':>9}{'p99':>9}{'rps':>9}")
+    for name, row in {**results["endpoints"], "overall": results["overall"]}.items():
+        old = baseline.get("overall") if name == "overall" else baseline.get("endpoints", {}).get(name)
+        if not old:
+            continue
+        cells = []
+        for key, worse_when_higher in (("p50_ms", True), ("p95_ms", True), ("p99_ms", True), ("throughput_rps", False)):
+            if not old.get(key) or row.get(key) is None:
+                cells.append(f"{'-':>9}")
+                continue
+            change = row[key] / old[key] - 1.0
+            cells.append(f"{100.0 * change:>+8.1f}%")
+            if (change > tolerance) if worse_when_higher else (change < -tolerance):
+                regressions.append(f"{name} {key}: {old[key]:.2f} -> {row[key]:.2f}")
+        print(f"{name:<22}" + "".join(cells))
+    return regressions
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def wait_until_ready(base_url: str, process, timeout: float, log_path: str):
+    import httpx
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            with open(log_path) as f:
+                raise RuntimeError(f"Server exited during startup:\n{f.read()[-4000:]}")
+        try:
+            if httpx.get(base_url + "/ready", timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Server not ready after {timeout:.0f}s; see {log_path}")
+
+def server_args(args, port: int, camera_url: str) -> list:
+    forwarded = ["--serve", "--port", str(port), "--seed", str(args.seed),
+                 "--gemini-latency", str(args.gemini_latency), "--gemini-jitter", str(args.gemini_jitter),
+                 "--gemini-stream-chunks", str(args.gemini_stream_chunks),
+                 "--whisper-rtf", str(args.whisper_rtf), "--embedding-dim", str(args.embedding_dim),
+                 "--embedding-cost-ms", str(args.embedding_cost_ms),
+                 "--cameras", str(args.cameras), "--camera-interval", str(args.camera_interval)]
+    if camera_url:
+        forwarded += ["--camera-url", camera_url]
+    if args.gemini_outputs:
+        forwarded += ["--gemini-outputs", os.path.abspath(args.gemini_outputs)]
+    if args.keep_default_outputs:
+        forwarded.append("--keep-default-outputs")
+    for flag in ("real_models", "gemini_cache"):
+        if getattr(args, flag):
+            forwarded.append("--" + flag.replace("_", "-"))
+    return forwarded
+
+def run_benchmark(args) -> int:
+    repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    camera = CameraServer(args.camera_change_every).start() if args.cameras else None
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    payloads = {"wav": make_wav(args.audio_seconds, args.seed), "jpeg": make_jpeg(args.seed + 7, (2048, 1536))}
+
+    with tempfile.TemporaryDirectory(prefix="vitalgenie-load-") as workdir:
+        log_path = os.path.join(workdir, "server.log")
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [repo_root, os.environ.get("PYTHONPATH")])))
+        with open(log_path, "w") as log:
+            process = subprocess.Popen(
+                [sys.executable, "-m", "benchmarks.load_benchmark"] + server_args(args, port, camera.url if camera else None),
+                cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+        try:
+            wait_until_ready(base_url, process, args.startup_timeout, log_path)
+            print(f"Server ready on {base_url}; {args.concurrency} clients for "
+                  f"{f'{args.requests} requests' if args.requests else f'{args.duration:.0f}s'} ({args.mix})")
+            samples, errors, wall, before, after = asyncio.run(run_load(base_url, args, payloads))
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+            if camera:
+                camera.stop()
+        if args.keep_log:
+            with open(log_path) as src, open(args.keep_log, "w") as dst:
+                dst.write(src.read())
+
+    before, after = parse_metrics(before), parse_metrics(after)
+    all_latencies = [s for name in samples for s in samples[name]]
+    all_errors = {}
+    for name in errors:
+        for kind, count in errors[name].items():
+            all_errors[kind] = all_errors.get(kind, 0) + count
+    results = {
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "config": {key: value for key, value in vars(args).items()
+                   if key not in ("serve", "port", "camera_url", "output", "compare", "keep_log")},
+        "wall_seconds": wall,
+        "endpoints": {name: latency_summary(samples[name], errors[name], wall) for name in samples},
+        "overall": latency_summary(all_latencies, all_errors, wall),
+        "peak_rss_bytes": after.get(("vitalgenie_process_peak_resident_memory_bytes", "")),
+        "stages": stage_summary(before, after),
+        "camera_frames_served": camera.served if camera else 0,
+    }
+
+    print(f"\n{'endpoint':<22}{'ok':>6}{'err':>5}{'rps':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, row in {**results["endpoints"], "overall": results["overall"]}.items():
+        print(f"{name:<22}{row['requests']:>6}{row['errors']:>5}{row['throughput_rps']:>8.2f}"
+              f"{row.get('p50_ms', float('nan')):>10.1f}{row.get('p95_ms', float('nan')):>10.1f}"
+              f"{row.get('p99_ms', float('nan')):>10.1f}")
+    if results["peak_rss_bytes"]:
+        print(f"\nServer peak RSS: {results['peak_rss_bytes'] / 1024 ** 2:.0f} MB")
+    print(f"\n{'stage':<22}{'calls':>7}{'avg ms':>10}")
+    for stage, row in results["stages"].items():
+        print(f"{stage:<22}{row['count']:>7}{row['avg_ms']:>10.1f}")
+    if any(row["errors"] for row in results["endpoints"].values()):
+        print("\nErrors:", {name: row["error_kinds"] for name, row in results["endpoints"].items() if row["errors"]})
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("\nRegressions beyond tolerance:\n  " + "\n  ".join(regressions))
+            return 1
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent clients (closed loop)")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds of measured load")
+    parser.add_argument("--requests", type=int, default=0, help="Stop after this many requests instead (still bounded by --duration)")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Relative weights, e.g. " + DEFAULT_MIX)
+    parser.add_argument("--timeout", type=float, default=300.0, help="Per-request client timeout in seconds")
+    parser.add_argument("--audio-seconds", type=float, default=30.0, help="Length of the uploaded recording")
+    parser.add_argument("--gemini-latency", type=float, default=1.0, help="Seconds per fake Gemini call")
+    parser.add_argument("--gemini-jitter", type=float, default=0.2, help="+/- fraction applied to the latency")
+    parser.add_argument("--gemini-stream-chunks", type=int, default=8)
+    parser.add_argument("--gemini-outputs", help="JSON file mapping prompt markers to canned answers (\"\" = default)")
+    parser.add_argument("--keep-default-outputs", action="store_true", help="Merge --gemini-outputs over the built-in answers")
+    parser.add_argument("--gemini-cache", action="store_true", help="Keep the Gemini response cache on")
+    parser.add_argument("--real-models", action="store_true", help="Use the configured Whisper and embedding models")
+    parser.add_argument("--whisper-rtf", type=float, default=0.05, help="Fake Whisper seconds per audio second")
+    parser.add_argument("--embedding-dim", type=int, default=768)
+    parser.add_argument("--embedding-cost-ms", type=float, default=1.0, help="Fake embedding time per sentence")
+    parser.add_argument("--cameras", type=int, default=2, help="Cameras polling the local camera server (0 = none)")
+    parser.add_argument("--camera-interval", type=float, default=1.0)
+    parser.add_argument("--camera-change-every", type=int, default=10, help="Frames between scene changes")
+    parser.add_argument("--startup-timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    parser.add_argument("--compare", help="Earlier --output file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed relative slowdown before --compare fails")
+    parser.add_argument("--keep-log", help="Copy the server's log to this path")
+    # Internal: used when the benchmark starts its own server process
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, default=8000, help=argparse.SUPPRESS)
+    parser.add_argument("--camera-url", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+    sys.exit(run_benchmark(args))
+
+if __name__ == "__main__":
+    main()
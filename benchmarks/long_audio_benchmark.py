@@ -0,0 +1,82 @@
+"""
+Long-recording transcription benchmark.
+
+Compares the current single-pass Whisper decode against parallel chunked decoding
+(fp32 and int8-quantized) and reports real-time factor (decode seconds / audio
+seconds, lower is better) plus word-level agreement with the single-pass transcript.
+
+    python -m benchmarks.long_audio_benchmark consultation.wav --models tiny base --workers 4
+"""
+import argparse
+import asyncio
+import json
+import re
+import time
+from difflib import SequenceMatcher
+import whisper
+from app.utils.audio_utils import SAMPLE_RATE
+from app.utils.whisper_worker import WhisperExecutor, load_cpu_model
+
+
+def words(text: str) -> list:
+    return re.findall(r"[a-z0-9']+", text.lower())
+
+def word_agreement(reference: str, hypothesis: str) -> float:
+    ref, hyp = words(reference), words(hypothesis)
+    if not ref and not hyp:
+        return 1.0
+    return SequenceMatcher(None, ref, hyp, autojunk=False).ratio()
+
+async def run_chunked(audio, model_name: str, workers: int, chunk_s: float, quantize: bool):
+    executor = WhisperExecutor("process", workers, model_name, quantize=quantize)
+    try:
+        # Warm every worker so model loading is not counted as decode time
+        await asyncio.gather(*[executor.transcribe(audio[:SAMPLE_RATE]) for _ in range(workers)])
+        started = time.perf_counter()
+        result = await executor.transcribe_chunked(audio, chunk_s)
+        return result, time.perf_counter() - started
+    finally:
+        executor.shutdown()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("audio", help="Path to a long recording (any format ffmpeg reads)")
+    parser.add_argument("--models", nargs="+", default=["tiny"])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--chunk", type=float, default=120.0, help="Nominal chunk length in seconds")
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    audio = whisper.load_audio(args.audio)
+    duration = len(audio) / SAMPLE_RATE
+    print(f"Audio: {args.audio} ({duration:.1f}s)")
+
+    rows = []
+    for model_name in args.models:
+        model = load_cpu_model(model_name)
+        started = time.perf_counter()
+        reference = model.transcribe(audio, language="en", fp16=False)["text"]
+        elapsed = time.perf_counter() - started
+        del model
+        rows.append({"model": model_name, "mode": "single-pass", "seconds": elapsed,
+                     "rtf": elapsed / duration, "agreement": 1.0})
+
+        for quantize in (False, True):
+            result, elapsed = asyncio.run(run_chunked(audio, model_name, args.workers, args.chunk, quantize))
+            rows.append({
+                "model": model_name,
+                "mode": f"chunked x{args.workers}" + (" int8" if quantize else ""),
+                "seconds": elapsed,
+                "rtf": elapsed / duration,
+                "agreement": word_agreement(reference, result["text"]),
+            })
+
+    print(f"\n{'model':<10}{'mode':<22}{'seconds':>10}{'RTF':>8}{'agreement':>12}")
+    for row in rows:
+        print(f"{row['model']:<10}{row['mode']:<22}{row['seconds']:>10.1f}{row['rtf']:>8.3f}{row['agreement']:>12.3f}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"audio": args.audio, "duration_s": duration, "results": rows}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Corpus index benchmark.
+
+Fills a CorpusIndex with synthetic clustered embeddings (the same add path the
+transcription pipeline uses) and compares its searches with brute-force
+`IndexFlatL2` on the same vectors: recall@k against the exact neighbours and
+per-query latency, unfiltered and filtered to one patient. Below the HNSW
+threshold the corpus index is exact, so 10k chunks shows the flat path and 1M
+chunks the HNSW path.
+
+    python -m benchmarks.vector_index_benchmark --sizes 10000 1000000 --ef 16 32 64 128
+"""
+import argparse
+import json
+import tempfile
+import time
+import numpy as np
+import faiss
+from app.config import CORPUS_HNSW_THRESHOLD
+from app.utils.vector_index import CorpusIndex
+
+
+def clustered_vectors(count: int, dim: int, clusters: int, rng) -> np.ndarray:
+    """
+    Sentence embeddings are far from uniform; points scattered around topic centers are a closer stand-in.
+    """
+    centers = rng.standard_normal((clusters, dim)).astype("float32")
+    vectors = np.empty((count, dim), dtype="float32")
+    step = 100_000
+    for start in range(0, count, step):
+        end = min(count, start + step)
+        labels = rng.integers(0, clusters, end - start)
+        vectors[start:end] = centers[labels] + 0.6 * rng.standard_normal((end - start, dim)).astype("float32")
+    faiss.normalize_L2(vectors)
+    return vectors
+
+def recall(found: list, expected) -> float:
+    expected = set(int(i) for i in expected if i >= 0)
+    if not expected:
+        return 1.0
+    return len(expected.intersection(found)) / len(expected)
+
+def percentile_ms(samples: list, q: float) -> float:
+    return 1000.0 * float(np.percentile(samples, q))
+
+def timed_searches(search, queries: np.ndarray):
+    results, latencies = [], []
+    for query in queries:
+        started = time.perf_counter()
+        results.append(search(query))
+        latencies.append(time.perf_counter() - started)
+    return results, latencies
+
+def run_size(size: int, args, rng) -> list:
+    print(f"\n== {size} chunks, dim {args.dim} ==")
+    vectors = clustered_vectors(size, args.dim, args.clusters, rng)
+    chunk_patients = rng.integers(0, args.patients, size)
+    picks = rng.integers(0, size, args.queries)
+    queries = vectors[picks] + 0.05 * rng.standard_normal((args.queries, args.dim)).astype("float32")
+    faiss.normalize_L2(queries)
+
+    with tempfile.TemporaryDirectory() as index_dir:
+        corpus = CorpusIndex(index_dir, encoder=lambda text: None, save_every=10**9)
+        started = time.perf_counter()
+        for doc, start in enumerate(range(0, size, args.doc_chunks)):
+            end = min(size, start + args.doc_chunks)
+            # Chunk text carries the row number so hits can be matched to ground truth
+            corpus.add_embeddings(f"doc{doc}", [str(i) for i in range(start, end)], vectors[start:end],
+                                  patient_id=f"p{chunk_patients[start]}", timestamp=float(doc))
+            chunk_patients[start:end] = chunk_patients[start]
+        add_seconds = time.perf_counter() - started
+        index_type = corpus.get_stats()["index_type"]
+        print(f"Incremental add: {add_seconds:.1f}s ({size / add_seconds:.0f} chunks/s) -> {index_type}")
+
+        flat = faiss.IndexFlatL2(args.dim)
+        flat.add(vectors)
+        truth, flat_latencies = timed_searches(lambda q: flat.search(q[None, :], args.k)[1][0], queries)
+        rows = [{"size": size, "search": "brute-force", "filter": "none", "ef_search": None, "recall": 1.0,
+                 "p50_ms": percentile_ms(flat_latencies, 50), "p95_ms": percentile_ms(flat_latencies, 95)}]
+
+        def hit_ids(hits):
+            return [int(hit["text"]) for hit in hits]
+
+        for ef in (args.ef if index_type != "IndexFlatL2" else [None]):
+            if ef is not None:
+                corpus.ef_search = ef
+            found, latencies = timed_searches(lambda q: hit_ids(corpus.search_vectors(q, args.k)), queries)
+            rows.append({"size": size, "search": index_type, "filter": "none", "ef_search": ef,
+                         "recall": float(np.mean([recall(f, t) for f, t in zip(found, truth)])),
+                         "p50_ms": percentile_ms(latencies, 50), "p95_ms": percentile_ms(latencies, 95)})
+
+        # Filtered to the patient owning each query's source chunk; exact answer by scanning that patient's rows
+        query_patients = chunk_patients[picks]
+        filtered_truth = []
+        for query, patient in zip(queries, query_patients):
+            rows_of_patient = np.flatnonzero(chunk_patients == patient)
+            distances = ((vectors[rows_of_patient] - query) ** 2).sum(axis=1)
+            filtered_truth.append(rows_of_patient[np.argsort(distances)[:args.k]])
+        ef = max(args.ef) if index_type != "IndexFlatL2" else None
+        corpus.ef_search = ef or corpus.ef_search
+        found, latencies = [], []
+        for query, patient in zip(queries, query_patients):
+            started = time.perf_counter()
+            found.append(hit_ids(corpus.search_vectors(query, args.k, patient_id=f"p{patient}")))
+            latencies.append(time.perf_counter() - started)
+        rows.append({"size": size, "search": index_type, "filter": "patient", "ef_search": ef,
+                     "recall": float(np.mean([recall(f, t) for f, t in zip(found, filtered_truth)])),
+                     "p50_ms": percentile_ms(latencies, 50), "p95_ms": percentile_ms(latencies, 95)})
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", type=int, default=[10_000, 1_000_000])
+    parser.add_argument("--dim", type=int, default=768, help="Embedding width (768 for all-mpnet-base-v2)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--ef", nargs="+", type=int, default=[16, 32, 64, 128], help="HNSW efSearch values to sweep")
+    parser.add_argument("--clusters", type=int, default=256)
+    parser.add_argument("--patients", type=int, default=1000)
+    parser.add_argument("--doc-chunks", type=int, default=20, help="Chunks per synthetic summary")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    print(f"HNSW threshold: {CORPUS_HNSW_THRESHOLD} chunks, FAISS threads: {faiss.omp_get_max_threads()}")
+    rows = []
+    for size in args.sizes:
+        rows.extend(run_size(size, args, rng))
+
+    print(f"\n{'chunks':>9}  {'search':<14}{'filter':<9}{'ef':>5}{'recall@' + str(args.k):>11}{'p50 ms':>9}{'p95 ms':>9}")
+    for row in rows:
+        ef = "" if row["ef_search"] is None else row["ef_search"]
+        print(f"{row['size']:>9}  {row['search']:<14}{row['filter']:<9}{ef:>5}{row['recall']:>11.3f}"
+              f"{row['p50_ms']:>9.2f}{row['p95_ms']:>9.2f}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"k": args.k, "dim": args.dim, "results": rows}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+import threading
+from datetime import datetime, timedelta, timezone
+from app.utils.fake_firestore import FakeFirestore
+from app.utils.firestore_utils import BatchedWriter, SummaryStore, SUMMARIES_COLLECTION
+
+
+class FlakyFirestore(FakeFirestore):
+    """
+    Fails the first `failures` batch commits and, optionally, every direct write.
+    """
+
+    def __init__(self, failures: int = 0):
+        super().__init__()
+        self.failures = failures
+        self.set_threads = []
+
+    def batch(self):
+        batch = super().batch()
+        commit = batch.commit
+
+        def flaky_commit():
+            if self.failures > 0:
+                self.failures -= 1
+                raise ConnectionError("unavailable")
+            commit()
+
+        batch.commit = flaky_commit
+        return batch
+
+    def _write(self, collection, doc_id, data):
+        self.set_threads.append(threading.current_thread().name)
+        super()._write(collection, doc_id, data)
+
+
+def test_summary_store_orders_naive_and_aware_timestamps():
+    store = SummaryStore(db=FakeFirestore())
+    now = datetime.utcnow()
+    store.note_written("written", {"summary": "a", "timestamp": now})
+    # Listener snapshots carry aware datetimes; an older one must not replace the write-through copy
+    older = (now - timedelta(minutes=5)).replace(tzinfo=timezone.utc)
+    assert store._set("listener-old", {"summary": "b", "timestamp": older}) is False
+    newer = (now + timedelta(minutes=5)).replace(tzinfo=timezone.utc)
+    assert store._set("listener-new", {"summary": "c", "timestamp": newer}) is True
+    assert store.latest() == ("listener-new", {"summary": "c", "timestamp": newer})
+    # And a naive write-through copy older than the aware one is ignored as well
+    store.note_written("stale", {"summary": "d", "timestamp": now})
+    assert store.latest()[0] == "listener-new"
+
+
+def test_summary_store_listener_keeps_newest():
+    db = FakeFirestore()
+    store = SummaryStore(db=db)
+    store.start_listener()
+    db.collection(SUMMARIES_COLLECTION).document("first").set(
+        {"summary": "a", "timestamp": datetime(2024, 1, 1, tzinfo=timezone.utc)})
+    store.note_written("second", {"summary": "b", "timestamp": datetime(2024, 1, 2)})
+    assert store.latest()[0] == "second"
+    store.stop_listener()
+
+
+def test_batched_writer_retries_failed_batches():
+    db = FlakyFirestore(failures=2)
+    writer = BatchedWriter(db=db, flush_s=0.01, retry_base_s=0.01)
+    ids = [writer.add("doctor_alerts", {"n": i}) for i in range(5)]
+    writer.flush(timeout=5)
+    stats = writer.get_stats()
+    writer.stop()
+    assert stats["written"] == 5
+    assert stats["retries"] == 2
+    assert stats["failed"] == 0
+    assert all(db.collection("doctor_alerts").document(doc_id).get().exists for doc_id in ids)
+
+
+def test_batched_writer_reports_writes_dropped_on_shutdown(capsys):
+    db = FlakyFirestore(failures=10 ** 6)
+    writer = BatchedWriter(db=db, flush_s=0.01, retry_base_s=0.01)
+    doc_id = writer.add("doctor_alerts", {"n": 1})
+    writer.stop(timeout=0.2)
+    assert writer.get_stats()["failed"] == 1
+    assert f"doctor_alerts/{doc_id}" in capsys.readouterr().out
+
+
+def test_batched_writer_add_does_not_touch_the_client():
+    writer = BatchedWriter(db=None)
+    # Nothing drains the queue, so the client (which would need Firebase credentials) is never resolved
+    writer._thread = threading.current_thread()
+    doc_id = writer.add("prescriptions", {"n": 0})
+    assert len(doc_id) == 20
+    assert writer.get_stats()["queued"] == 1
+
+
+def test_batched_writer_overflow_writes_off_the_calling_thread():
+    db = FlakyFirestore()
+    writer = BatchedWriter(db=db, max_queue=1)
+    # Pretend the background thread is running but stalled, so the queue stays full
+    writer._thread = threading.current_thread()
+    writer.add("prescriptions", {"n": 0})
+    doc_id = writer.add("prescriptions", {"n": 1})
+    writer._overflow.shutdown(wait=True)
+    assert db.collection("prescriptions").document(doc_id).get().exists
+    assert db.set_threads == ["firestore-overflow_0"]
+    stats = writer.get_stats()
+    assert stats["queued"] == 1 and stats["direct_writes"] == 1
@@ -0,0 +1,115 @@
+import asyncio
+import threading
+import time
+import pytest
+from app.utils.cache_utils import ResponseCache
+from app.utils.gemini_utils import ERROR_RESPONSE, GeminiClient
+
+
+class FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+    def resolve(self):
+        pass
+
+
+class FakeModel:
+    """
+    Stand-in for a GenerativeModel. `behaviours` is consumed one per call: an exception
+    is raised, a float blocks for that many seconds (or until `release` is set) and
+    anything else is returned as the text. Once exhausted, calls answer "ok".
+    """
+
+    def __init__(self, *behaviours):
+        self.behaviours = list(behaviours)
+        self.calls = 0
+        self.release = threading.Event()
+        self._lock = threading.Lock()
+
+    def generate_content(self, contents, stream=False):
+        with self._lock:
+            self.calls += 1
+            behaviour = self.behaviours.pop(0) if self.behaviours else "ok"
+        if isinstance(behaviour, Exception):
+            raise behaviour
+        if isinstance(behaviour, float):
+            self.release.wait(behaviour)
+            return FakeResponse("slow")
+        return FakeResponse(behaviour)
+
+
+def client(model, **kwargs):
+    options = {"max_concurrency": 2, "timeout": 1.0, "max_retries": 2, "retry_base_delay": 0.01, "hedge_delay": 0}
+    options.update(kwargs)
+    return GeminiClient(model=model, **options)
+
+
+def test_transient_error_is_retried():
+    model = FakeModel(ConnectionError("unavailable"), "answer")
+    assert asyncio.run(client(model).generate("prompt")) == "answer"
+    assert model.calls == 2
+
+
+def test_permanent_error_is_not_retried():
+    model = FakeModel(ValueError("bad request"))
+    with pytest.raises(ValueError):
+        asyncio.run(client(model).generate("prompt"))
+    assert model.calls == 1
+
+
+def test_attempt_past_timeout_is_retried_then_reported():
+    model = FakeModel(5.0, 5.0)
+    gemini = client(model, timeout=0.05, max_retries=1)
+    started = time.perf_counter()
+    assert asyncio.run(gemini.infer("prompt", use_cache=False)) == ERROR_RESPONSE
+    assert time.perf_counter() - started < 1.0
+    assert model.calls == 2
+    model.release.set()
+
+
+def test_second_call_is_served_from_cache(tmp_path):
+    model = FakeModel("cached answer")
+    gemini = client(model, cache=ResponseCache(str(tmp_path / "cache.sqlite3")))
+
+    async def ask_twice():
+        return await gemini.infer("prompt"), await gemini.infer("prompt")
+
+    assert asyncio.run(ask_twice()) == ("cached answer", "cached answer")
+    assert model.calls == 1
+    assert gemini.cache.get_stats()["memory_hits"] == 1
+
+
+def test_hedge_wins_and_slow_attempt_is_cancelled():
+    model = FakeModel(5.0, "hedged")
+    gemini = client(model, hedge_delay=0.05)
+
+    async def run():
+        result = await gemini.generate("prompt")
+        # The losing attempt is cancelled; give the cancellation a moment to unwind
+        await asyncio.sleep(0.05)
+        return result, gemini._get_semaphore()._value
+
+    started = time.perf_counter()
+    assert asyncio.run(run()) == ("hedged", 2)
+    assert time.perf_counter() - started < 1.0
+    assert model.calls == 2
+    model.release.set()
+
+
+def test_caller_cancelled_during_hedge_wait_frees_the_slot():
+    model = FakeModel(5.0)
+    gemini = client(model, hedge_delay=1.0)
+
+    async def run():
+        task = asyncio.create_task(gemini.generate("prompt"))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await asyncio.sleep(0.05)
+        return gemini._get_semaphore()._value
+
+    assert asyncio.run(run()) == 2
+    assert model.calls == 1
+    model.release.set()
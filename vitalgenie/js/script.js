@@ -10,14 +10,42 @@ async function sendMessage() {
   }
   addChatBubble("You", message, "chat-user");
   chatInput.value = "";
+  const chatWindow = document.getElementById("chatWindow");
   try {
-    const response = await fetch(`${backendURL}/rag_chat`, {
+    const response = await fetch(`${backendURL}/rag_chat_stream`, {
       method: "POST",
       headers: { "Content-Type": "application/json" },
       body: JSON.stringify({ query: message })
     });
-    const data = await response.json();
-    addChatBubble("VitalGenie", data.response, "chat-ai");
+    if (!response.ok || !response.body) {
+      throw new Error(`HTTP ${response.status}`);
+    }
+    // Tokens arrive as Server-Sent Events; grow one bubble as they come in
+    const bubble = addChatBubble("VitalGenie", "", "chat-ai");
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    let answer = "";
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      const events = buffer.split("\n\n");
+      buffer = events.pop();
+      for (const raw of events) {
+        const event = (raw.match(/^event: (.*)$/m) || [])[1];
+        const data = JSON.parse((raw.match(/^data: (.*)$/m) || [])[1] || "{}");
+        if (event === "token") {
+          answer += data.text;
+        } else if (event === "done" || event === "error") {
+          answer = data.response;
+        } else {
+          continue;
+        }
+        bubble.innerHTML = `<strong>VitalGenie:</strong> ${answer}`;
+        chatWindow.scrollTop = chatWindow.scrollHeight;
+      }
+    }
   } catch (error) {
     console.error(error);
     addChatBubble("VitalGenie", "Error: " + error, "chat-ai");
@@ -31,6 +59,7 @@ function addChatBubble(sender, text, bubbleClass) {
   bubble.innerHTML = `<strong>${sender}:</strong> ${text}`;
   chatWindow.appendChild(bubble);
   chatWindow.scrollTop = chatWindow.scrollHeight;
+  return bubble;
 }
 
 // ------------------ IMAGE UPLOAD (for Analysis) ------------------
@@ -198,6 +227,108 @@ async function uploadRecording() {
 }
 
 
+// ------------------ LIVE TRANSCRIPTION ------------------
+// Streams 16 kHz mono int16 PCM to /transcribe_stream and renders partial/final segments as they arrive.
+let liveSocket = null;
+let liveContext = null;
+let liveStream = null;
+let liveProcessor = null;
+
+const startLiveBtn = document.getElementById("startLive");
+const stopLiveBtn = document.getElementById("stopLive");
+const liveTranscript = document.getElementById("liveTranscript");
+
+function downsampleToInt16(input, inputRate) {
+  const ratio = inputRate / 16000;
+  const length = Math.floor(input.length / ratio);
+  const output = new Int16Array(length);
+  for (let i = 0; i < length; i++) {
+    const sample = Math.max(-1, Math.min(1, input[Math.floor(i * ratio)]));
+    output[i] = sample < 0 ? sample * 0x8000 : sample * 0x7fff;
+  }
+  return output;
+}
+
+function renderLiveTranscript(finals, partial) {
+  let html = finals.map(seg => `<p><span class="text-gray-400">[${seg.start.toFixed(1)}s]</span> ${seg.text}</p>`).join("");
+  if (partial) {
+    html += `<p class="text-gray-400 italic">${partial}</p>`;
+  }
+  liveTranscript.innerHTML = html;
+}
+
+function stopLiveAudio() {
+  if (liveProcessor) liveProcessor.disconnect();
+  if (liveStream) liveStream.getTracks().forEach(track => track.stop());
+  if (liveContext) liveContext.close();
+  liveProcessor = null;
+  liveStream = null;
+  liveContext = null;
+}
+
+startLiveBtn.addEventListener("click", async () => {
+  try {
+    liveStream = await navigator.mediaDevices.getUserMedia({ audio: true });
+  } catch (err) {
+    alert("Error accessing microphone: " + err);
+    return;
+  }
+  const finals = [];
+  liveTranscript.style.display = "block";
+  liveTranscript.innerHTML = "";
+  liveSocket = new WebSocket(backendURL.replace(/^http/, "ws") + "/transcribe_stream");
+  liveSocket.binaryType = "arraybuffer";
+
+  liveSocket.onopen = () => {
+    liveContext = new AudioContext();
+    const source = liveContext.createMediaStreamSource(liveStream);
+    liveProcessor = liveContext.createScriptProcessor(4096, 1, 1);
+    liveProcessor.onaudioprocess = (e) => {
+      if (liveSocket && liveSocket.readyState === WebSocket.OPEN) {
+        liveSocket.send(downsampleToInt16(e.inputBuffer.getChannelData(0), liveContext.sampleRate).buffer);
+      }
+    };
+    source.connect(liveProcessor);
+    liveProcessor.connect(liveContext.destination);
+  };
+
+  liveSocket.onmessage = (e) => {
+    const data = JSON.parse(e.data);
+    if (data.type === "partial") {
+      renderLiveTranscript(finals, data.text);
+    } else if (data.type === "final") {
+      finals.push(data);
+      renderLiveTranscript(finals, "");
+    } else if (data.type === "done") {
+      recordingSpinner.style.display = "none";
+      if (data.diarized) {
+        const diarizedHTML = data.diarized.replace(/\n/g, "<br>");
+        recordingOutput.innerHTML = `<h3 class="text-xl font-bold mb-2">Diarized Transcript</h3><p>${diarizedHTML}</p>`;
+        addChatBubble("VitalGenie", recordingOutput.innerHTML, "chat-ai");
+      }
+    }
+  };
+
+  liveSocket.onclose = () => {
+    stopLiveAudio();
+    recordingSpinner.style.display = "none";
+    startLiveBtn.disabled = false;
+    stopLiveBtn.disabled = true;
+  };
+
+  startLiveBtn.disabled = true;
+  stopLiveBtn.disabled = false;
+});
+
+stopLiveBtn.addEventListener("click", () => {
+  stopLiveAudio();
+  if (liveSocket && liveSocket.readyState === WebSocket.OPEN) {
+    liveSocket.send("stop");
+    recordingSpinner.style.display = "flex";
+  }
+  stopLiveBtn.disabled = true;
+});
+
 // ------------------ MONITORING FUNCTIONS ------------------
 function updateMonitoringVideo() {
   const videoEl = document.getElementById("monitoringVideo");